@@ -2,6 +2,7 @@ from typing import Dict, List, Any, Optional, TypedDict
 from langgraph.graph import StateGraph  
 from langchain_core.tools import BaseTool
 from config.llm_config import llm_config
+import asyncio
 import logging
 
 class AgentState(TypedDict):
@@ -55,6 +56,10 @@ class BaseHealthcareAgent:
                 'agent': self.agent_name
             }
     
+    async def execute_async(self, input_data: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Run execute in a worker thread so event-loop callers are not blocked on the LLM"""
+        return await asyncio.to_thread(self.execute, input_data, context)
+    
     def get_tools(self) -> List[BaseTool]:
         """Get agent tools"""
         return self.tools
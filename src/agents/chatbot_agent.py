@@ -13,6 +13,8 @@ from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 import logging
 
+from sqlalchemy import delete, update
+
 from database.connection import get_db_session
 from database.models import ChatbotConversation, ChatbotMessage, ChatbotContext, Patient
 from config.llm_config import llm_config
@@ -118,9 +120,8 @@ Respond naturally and conversationally while maintaining medical accuracy and co
             ).first()
             
             if context_record:
-                # Update last activity
+                # Update last activity; committed when the block exits
                 context_record.last_activity = datetime.utcnow()
-                session.commit()
                 return context_record.context_data
             
             # Create new context
@@ -650,10 +651,11 @@ Provide a helpful, professional response that guides the user toward healthcare-
             ).first()
             
             if context_record:
+                now = datetime.utcnow()
                 # Update context with new information
                 context_record.context_data.update(response.context_update)
                 context_record.context_data["conversation_history"].append({
-                    "timestamp": datetime.utcnow().isoformat(),
+                    "timestamp": now.isoformat(),
                     "user_message": user_message,
                     "bot_response": response.message,
                     "intent": response.intent
@@ -664,7 +666,7 @@ Provide a helpful, professional response that guides the user toward healthcare-
                     context_record.context_data["conversation_history"] = \
                         context_record.context_data["conversation_history"][-10:]
                 
-                context_record.last_activity = datetime.utcnow()
+                context_record.last_activity = now
                 session.commit()
 
     def _log_conversation(self, session_id: str, user_message: str, response: ChatbotResponse, 
@@ -709,22 +711,30 @@ Provide a helpful, professional response that guides the user toward healthcare-
             )
             session.add(bot_msg)
             
+            # New messages move the conversation's version for polling clients
+            conversation.updated_at = datetime.utcnow()
             session.commit()
 
     def get_conversation_history(self, session_id: str, limit: int = 20) -> List[Dict[str, Any]]:
         """Get conversation history for a session"""
         with get_db_session() as session:
-            conversation = session.query(ChatbotConversation).filter(
-                ChatbotConversation.session_id == session_id,
-                ChatbotConversation.status == 'active'
-            ).first()
-            
-            if not conversation:
-                return []
-            
-            messages = session.query(ChatbotMessage).filter(
-                ChatbotMessage.conversation_id == conversation.id
-            ).order_by(ChatbotMessage.created_at.desc()).limit(limit).all()
+            # One join instead of a conversation lookup plus a message query; a missing
+            # or closed conversation simply yields no rows
+            messages = session.query(
+                ChatbotMessage.id,
+                ChatbotMessage.message_type,
+                ChatbotMessage.content,
+                ChatbotMessage.intent,
+                ChatbotMessage.confidence,
+                ChatbotMessage.created_at
+            ).join(ChatbotConversation, ChatbotConversation.id == ChatbotMessage.conversation_id)\
+                .filter(
+                    ChatbotConversation.session_id == session_id,
+                    ChatbotConversation.status == 'active'
+                )\
+                .order_by(ChatbotMessage.created_at.desc())\
+                .limit(limit)\
+                .all()
             
             return [
                 {
@@ -741,21 +751,21 @@ Provide a helpful, professional response that guides the user toward healthcare-
     def close_conversation(self, session_id: str):
         """Close a conversation session"""
         with get_db_session() as session:
-            conversation = session.query(ChatbotConversation).filter(
-                ChatbotConversation.session_id == session_id,
-                ChatbotConversation.status == 'active'
-            ).first()
-            
-            if conversation:
-                conversation.status = 'closed'
-                conversation.closed_at = datetime.utcnow()
-                session.commit()
+            # Conditional UPDATE and DELETE statements; neither row is loaded first
+            now = datetime.utcnow()
+            session.execute(
+                update(ChatbotConversation)
+                .where(
+                    ChatbotConversation.session_id == session_id,
+                    ChatbotConversation.status == 'active'
+                )
+                .values(status='closed', closed_at=now, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
             
             # Also close context
-            context = session.query(ChatbotContext).filter(
-                ChatbotContext.session_id == session_id
-            ).first()
-            
-            if context:
-                session.delete(context)
-                session.commit() 
\ No newline at end of file
+            session.execute(
+                delete(ChatbotContext)
+                .where(ChatbotContext.session_id == session_id)
+                .execution_options(synchronize_session=False)
+            ) 
\ No newline at end of file
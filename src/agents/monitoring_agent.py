@@ -11,9 +11,48 @@ from agents.base_agent import BaseHealthcareAgent
 from utils.logger import log_agent_event
 from database.models import VitalSigns, Alert, AlertSeverity
 from database.connection import get_db_session
+from sqlalchemy import select
 from datetime import datetime, timedelta
+from cachetools import TTLCache
+import hashlib
+import threading
 import json
 
+# Vital sign columns reported by get_patient_vital_trends, in output order
+TREND_COLUMNS = (
+    VitalSigns.heart_rate,
+    VitalSigns.systolic_bp,
+    VitalSigns.diastolic_bp,
+    VitalSigns.temperature,
+    VitalSigns.oxygen_saturation,
+    VitalSigns.respiratory_rate,
+    VitalSigns.blood_glucose
+)
+
+# Vital signs analysis prompt; {details} receives the assembled patient information
+ANALYSIS_PROMPT_TEMPLATE = """
+Please analyze these patient vital signs for abnormalities and trends:
+
+{details}
+
+Based on the above information, please:
+1. Assess if any vital signs are outside normal ranges
+2. Identify any concerning trends or patterns
+3. Determine alert severity for any abnormalities
+4. Recommend monitoring frequency adjustments
+5. Suggest any immediate actions needed
+6. Provide overall health status assessment
+
+Format your response as:
+OVERALL_STATUS: [normal/abnormal/concerning]
+ABNORMALITIES: [list any abnormal vital signs with values and severity]
+TRENDS: [any concerning trends or patterns]
+ALERT_SEVERITY: [critical/high/medium/low/none]
+RECOMMENDED_ACTIONS: [immediate actions needed]
+MONITORING_FREQUENCY: [suggested monitoring frequency]
+ASSESSMENT: [brief health status assessment]
+"""
+
 class MonitoringAgent(BaseHealthcareAgent):
     """AI agent for patient monitoring and alerting"""
     def __init__(self, tools: Dict[str, Any]):
@@ -36,6 +75,13 @@ Always act promptly and escalate critical situations."""
         monitoring_tools = [tool for tool in monitoring_tools if tool is not None]
         super().__init__("MonitoringAgent", system_prompt, monitoring_tools)
         self.logger = log_agent_event
+        # Recent LLM analyses keyed on a hash of the full prompt, so only identical inputs share one
+        self._analysis_cache = TTLCache(maxsize=4096, ttl=60)
+        self._analysis_cache_lock = threading.Lock()
+    
+    def _analysis_cache_key(self, analysis_input: str) -> str:
+        """Hash the prepared prompt, which carries the patient ID and every field the LLM sees"""
+        return hashlib.blake2b(analysis_input.encode(), digest_size=16).hexdigest()
     
     def analyze_vital_signs(self, vital_signs_data: Dict[str, Any]) -> Dict[str, Any]:
         """Analyze vital signs and generate alerts if needed"""
@@ -43,32 +89,46 @@ Always act promptly and escalate critical situations."""
             # Prepare analysis input
             analysis_input = self._prepare_analysis_input(vital_signs_data)
             
-            # Execute vital signs analysis
-            result = self.execute(analysis_input)
+            # Only the LLM analysis is reused, and never across patients; alerts are raised for every reading
+            cache_key = self._analysis_cache_key(analysis_input) if vital_signs_data.get('patient_id') else None
+            cached = None
+            if cache_key:
+                with self._analysis_cache_lock:
+                    cached = self._analysis_cache.get(cache_key)
             
-            if result['success']:
-                # Parse analysis results
-                analysis_result = self._parse_analysis_result(result['result'])
-                
-                # Create alerts if abnormalities detected
-                alerts_created = []
-                if analysis_result.get('abnormalities'):
-                    alerts_created = self._create_alerts(vital_signs_data, analysis_result)
+            if cached is not None:
+                analysis_result, assessment = cached
+            else:
+                # Execute vital signs analysis
+                result = self.execute(analysis_input)
                 
-                # Log monitoring event
-                self.logger("MonitoringAgent", "vital_signs_analyzed", 
-                           f"Vital signs analyzed for patient {vital_signs_data.get('patient_id', 'unknown')}, {len(alerts_created)} alerts created")
+                if not result['success']:
+                    self.logger("MonitoringAgent", "analysis_failed", 
+                               f"Vital signs analysis failed: {result.get('error', 'Unknown error')}")
+                    return result
                 
-                return {
-                    'success': True,
-                    'analysis': analysis_result,
-                    'alerts_created': alerts_created,
-                    'assessment': result['result']
-                }
-            else:
-                self.logger("MonitoringAgent", "analysis_failed", 
-                           f"Vital signs analysis failed: {result.get('error', 'Unknown error')}")
-                return result
+                # Parse analysis results
+                analysis_result = self._parse_analysis_result(result['result'])
+                assessment = result['result']
+                if cache_key:
+                    with self._analysis_cache_lock:
+                        self._analysis_cache[cache_key] = (analysis_result, assessment)
+            
+            # Create alerts if abnormalities detected
+            alerts_created = []
+            if analysis_result.get('abnormalities'):
+                alerts_created = self._create_alerts(vital_signs_data, analysis_result)
+            
+            # Log monitoring event
+            self.logger("MonitoringAgent", "vital_signs_analyzed", 
+                       f"Vital signs analyzed for patient {vital_signs_data.get('patient_id', 'unknown')}, {len(alerts_created)} alerts created")
+            
+            return {
+                'success': True,
+                'analysis': analysis_result,
+                'alerts_created': alerts_created,
+                'assessment': assessment
+            }
                 
         except Exception as e:
             self.logger("MonitoringAgent", "analysis_error", f"Vital signs analysis error: {str(e)}")
@@ -139,30 +199,7 @@ Always act promptly and escalate critical situations."""
             input_parts.append(f"Additional Context: {vital_signs_data['additional_context']}")
         
         # Create analysis prompt
-        analysis_prompt = f"""
-Please analyze these patient vital signs for abnormalities and trends:
-
-{chr(10).join(input_parts)}
-
-Based on the above information, please:
-1. Assess if any vital signs are outside normal ranges
-2. Identify any concerning trends or patterns
-3. Determine alert severity for any abnormalities
-4. Recommend monitoring frequency adjustments
-5. Suggest any immediate actions needed
-6. Provide overall health status assessment
-
-Format your response as:
-OVERALL_STATUS: [normal/abnormal/concerning]
-ABNORMALITIES: [list any abnormal vital signs with values and severity]
-TRENDS: [any concerning trends or patterns]
-ALERT_SEVERITY: [critical/high/medium/low/none]
-RECOMMENDED_ACTIONS: [immediate actions needed]
-MONITORING_FREQUENCY: [suggested monitoring frequency]
-ASSESSMENT: [brief health status assessment]
-"""
-        
-        return analysis_prompt
+        return ANALYSIS_PROMPT_TEMPLATE.format(details='\n'.join(input_parts))
     
     def _parse_analysis_result(self, result: str) -> Dict[str, Any]:
         """Parse analysis result from agent output"""
@@ -346,65 +383,38 @@ ASSESSMENT: [brief health status assessment]
                 # Get vital signs for the specified time period
                 start_time = datetime.utcnow() - timedelta(hours=hours)
                 
-                vital_signs = session.query(VitalSigns).filter(
-                    VitalSigns.patient_id == patient_id,
-                    VitalSigns.recorded_at >= start_time
-                ).order_by(VitalSigns.recorded_at).all()
+                # Stream plain row tuples in batches; trend building never needs ORM instances
+                vital_signs = session.execute(
+                    select(VitalSigns.recorded_at, *TREND_COLUMNS)
+                    .where(
+                        VitalSigns.patient_id == patient_id,
+                        VitalSigns.recorded_at >= start_time
+                    )
+                    .order_by(VitalSigns.recorded_at)
+                    .execution_options(yield_per=1000)
+                )
                 
                 # Organize data by vital sign type
-                trends = {
-                    'heart_rate': [],
-                    'systolic_bp': [],
-                    'diastolic_bp': [],
-                    'temperature': [],
-                    'oxygen_saturation': [],
-                    'respiratory_rate': [],
-                    'blood_glucose': []
-                }
+                trends = {column.key: [] for column in TREND_COLUMNS}
+                trend_lists = [trends[column.key] for column in TREND_COLUMNS]
                 
-                for vs in vital_signs:
-                    if vs.heart_rate is not None:
-                        trends['heart_rate'].append({
-                            'value': vs.heart_rate,
-                            'timestamp': vs.recorded_at.isoformat()
-                        })
-                    if vs.systolic_bp is not None:
-                        trends['systolic_bp'].append({
-                            'value': vs.systolic_bp,
-                            'timestamp': vs.recorded_at.isoformat()
-                        })
-                    if vs.diastolic_bp is not None:
-                        trends['diastolic_bp'].append({
-                            'value': vs.diastolic_bp,
-                            'timestamp': vs.recorded_at.isoformat()
-                        })
-                    if vs.temperature is not None:
-                        trends['temperature'].append({
-                            'value': vs.temperature,
-                            'timestamp': vs.recorded_at.isoformat()
-                        })
-                    if vs.oxygen_saturation is not None:
-                        trends['oxygen_saturation'].append({
-                            'value': vs.oxygen_saturation,
-                            'timestamp': vs.recorded_at.isoformat()
-                        })
-                    if vs.respiratory_rate is not None:
-                        trends['respiratory_rate'].append({
-                            'value': vs.respiratory_rate,
-                            'timestamp': vs.recorded_at.isoformat()
-                        })
-                    if vs.blood_glucose is not None:
-                        trends['blood_glucose'].append({
-                            'value': vs.blood_glucose,
-                            'timestamp': vs.recorded_at.isoformat()
-                        })
+                total_readings = 0
+                for recorded_at, *values in vital_signs:
+                    total_readings += 1
+                    timestamp = recorded_at.isoformat()
+                    for trend_list, value in zip(trend_lists, values):
+                        if value is not None:
+                            trend_list.append({
+                                'value': value,
+                                'timestamp': timestamp
+                            })
                 
                 return {
                     'success': True,
                     'patient_id': patient_id,
                     'time_period_hours': hours,
                     'trends': trends,
-                    'total_readings': len(vital_signs)
+                    'total_readings': total_readings
                 }
                 
         except Exception as e:
@@ -5,14 +5,225 @@ This agent handles appointment scheduling, resource management, calendar coordin
 and scheduling optimization for healthcare facilities.
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Iterable, Iterator
 from langchain_core.tools import BaseTool
 from agents.base_agent import BaseHealthcareAgent
 from utils.logger import log_agent_event
+from utils.prompt_formatting import join_or_str
 from database.models import Appointment, Patient, AppointmentStatus
 from database.connection import get_db_session
+from sqlalchemy import select, update, exists, func, case, and_, or_, text
 from datetime import datetime, timedelta
+from cachetools import TTLCache
+import asyncio
+from functools import partial
+import heapq
+import threading
 import json
+import re
+import uuid
+
+# Tagged lines in the scheduling LLM output, mapped to (result key, converter)
+SCHEDULING_LINE_PATTERN = re.compile(
+    r'^(RECOMMENDED_DATE|RECOMMENDED_TIME|ASSIGNED_DOCTOR|ASSIGNED_ROOM|DURATION|PRIORITY|ALTERNATIVES|NOTES):\s*(.*)$'
+)
+SCHEDULING_FIELDS = {
+    'RECOMMENDED_DATE': ('recommended_date', str),
+    'RECOMMENDED_TIME': ('recommended_time', str),
+    'ASSIGNED_DOCTOR': ('assigned_doctor', str),
+    'ASSIGNED_ROOM': ('assigned_room', str),
+    'DURATION': ('duration', int),
+    'PRIORITY': ('priority', str.lower),
+    'NOTES': ('notes', str)
+}
+
+# Standard business hours: 9 AM to 5 PM, in 30-minute slots
+BUSINESS_START_HOUR = 9
+BUSINESS_END_HOUR = 17
+SLOT_MINUTES = 30
+
+# Slot start offsets from the opening hour, computed once
+SLOT_OFFSETS = tuple(
+    timedelta(minutes=minutes)
+    for minutes in range(0, (BUSINESS_END_HOUR - BUSINESS_START_HOUR) * 60, SLOT_MINUTES)
+)
+BUSINESS_DAY_LENGTH = timedelta(hours=BUSINESS_END_HOUR - BUSINESS_START_HOUR)
+
+# Appointment end time in SQL; appointments without a duration occupy one slot
+APPOINTMENT_END = func.timestampadd(
+    text('MINUTE'), func.coalesce(Appointment.duration, SLOT_MINUTES), Appointment.scheduled_date
+)
+
+# Cancelled appointments free their slot; every other status holds it
+BOOKED_APPOINTMENT = Appointment.status != AppointmentStatus.CANCELLED
+
+# Days the slot solver may search ahead, by scheduling priority
+SLOT_SEARCH_HORIZON_DAYS = {'high': 2, 'medium': 7, 'low': 14}
+
+# Scheduling prompts; {details} receives the assembled request information
+SCHEDULING_PROMPT_TEMPLATE = """
+Please schedule an appointment for this patient:
+
+{details}
+
+Based on the above information, please:
+1. Determine optimal appointment timing
+2. Assign appropriate provider and room
+3. Consider urgency and patient needs
+4. Suggest alternative times if needed
+5. Provide scheduling recommendations
+6. Consider resource availability
+
+Format your response as:
+RECOMMENDED_DATE: [optimal appointment date]
+RECOMMENDED_TIME: [optimal appointment time]
+ASSIGNED_DOCTOR: [assigned doctor ID]
+ASSIGNED_ROOM: [assigned room number]
+DURATION: [appointment duration in minutes]
+PRIORITY: [high/medium/low priority]
+ALTERNATIVES: [alternative appointment times if needed]
+NOTES: [scheduling notes and recommendations]
+"""
+
+RESCHEDULING_PROMPT_TEMPLATE = """
+Please reschedule this appointment:
+
+{details}
+
+Based on the above information, please:
+1. Determine new optimal appointment timing
+2. Consider availability of current provider
+3. Suggest alternative providers if needed
+4. Maintain appointment quality and patient care
+5. Provide rescheduling recommendations
+
+Format your response as:
+RECOMMENDED_DATE: [new optimal appointment date]
+RECOMMENDED_TIME: [new optimal appointment time]
+ASSIGNED_DOCTOR: [assigned doctor ID]
+ASSIGNED_ROOM: [assigned room number]
+DURATION: [appointment duration in minutes]
+PRIORITY: [high/medium/low priority]
+ALTERNATIVES: [alternative appointment times if needed]
+NOTES: [rescheduling notes and recommendations]
+"""
+
+# Status enum -> reported value, in declaration order
+APPOINTMENT_STATUS_VALUES = {status: status.value for status in AppointmentStatus}
+
+# Requests carrying all of these are booked directly when the slot is free
+DIRECT_SCHEDULING_FIELDS = ('preferred_date', 'preferred_time', 'doctor_id', 'duration')
+DIRECT_SCHEDULING_ASSESSMENT = "Requested date, time and doctor were available; scheduled without AI review."
+
+# Fallback format for LLM times that are not zero-padded ISO (e.g. "9:00")
+SCHEDULE_DATETIME_FORMAT = '%Y-%m-%d %H:%M'
+
+def parse_schedule_datetime(date_str: str, time_str: str) -> datetime:
+    """Combine a recommended date and time, using the C ISO parser when possible"""
+    try:
+        return datetime.fromisoformat(f"{date_str}T{time_str}")
+    except ValueError:
+        return datetime.strptime(f"{date_str} {time_str}", SCHEDULE_DATETIME_FORMAT)
+
+def merge_intervals(busy: Iterable[tuple]) -> Iterator[list]:
+    """Lazily merge (start, end) intervals that arrive sorted by start"""
+    current = None
+    for busy_start, busy_end in busy:
+        if current and busy_start <= current[1]:
+            current[1] = max(current[1], busy_end)
+        else:
+            if current:
+                yield current
+            current = [busy_start, busy_end]
+    if current:
+        yield current
+
+def free_starts(starts: List[datetime], length: timedelta, busy: Iterable[tuple]) -> List[datetime]:
+    """Return the sorted starts whose [start, start + length) overlaps no busy interval.
+
+    Busy intervals must be sorted by start; they are merged on the fly so their
+    ends are monotonic, then walked once against the starts with two pointers.
+    Intervals past the last start are never pulled from the iterable.
+    """
+    merged = merge_intervals(busy)
+    current = next(merged, None)
+    
+    free = []
+    for start in starts:
+        while current is not None and current[1] <= start:
+            current = next(merged, None)
+        if current is None or current[0] >= start + length:
+            free.append(start)
+    return free
+
+def overlapping_appointments(start, end, exclude_id: Optional[str] = None) -> list:
+    """Conditions matching booked appointments that overlap [start, end), other than exclude_id"""
+    conditions = [BOOKED_APPOINTMENT, Appointment.scheduled_date < end, APPOINTMENT_END > start]
+    if exclude_id:
+        conditions.append(Appointment.id != exclude_id)
+    return conditions
+
+def held_resources(doctor_id: str, room_number: Optional[str]):
+    """Condition matching appointments that hold the doctor or, when given, the room"""
+    resources = [Appointment.doctor_id == doctor_id]
+    if room_number:
+        resources.append(Appointment.room_number == room_number)
+    return or_(*resources)
+
+def claimed_intervals(claimed: Iterable[tuple], doctor_id: str, room_number: Optional[str]) -> List[tuple]:
+    """Sorted (start, end) of (start, end, doctor_id, room_number) claims holding the doctor or room"""
+    return sorted(
+        (start, end)
+        for start, end, claimed_doctor, claimed_room in claimed
+        if claimed_doctor == doctor_id or (room_number and claimed_room == room_number)
+    )
+
+def bookable_start(start: datetime, length: timedelta, now: datetime) -> bool:
+    """Whether start is a future slot on the grid whose appointment ends by closing time"""
+    offset = start - datetime.combine(start.date(), datetime.min.time().replace(hour=BUSINESS_START_HOUR))
+    return start >= now and offset in SLOT_OFFSETS and offset + length <= BUSINESS_DAY_LENGTH
+
+def prepend_note(note: str):
+    """SQL expression putting a note ahead of the stored notes without reading them.
+
+    Uses CONCAT because MySQL treats || as logical OR by default.
+    """
+    return func.concat(f"{note}\n\n", func.coalesce(Appointment.notes, ''))
+
+# Prompt fields as (input key, label, formatter), in prompt order
+SCHEDULING_INPUT_FIELDS = (
+    # Patient information
+    ('patient_id', 'Patient ID', str),
+    ('patient_name', 'Patient Name', str),
+    ('age', 'Age', str),
+    # Appointment details
+    ('appointment_type', 'Appointment Type', str),
+    ('department', 'Department', str),
+    ('doctor_id', 'Requested Doctor', str),
+    ('urgency', 'Urgency', str),
+    ('preferred_date', 'Preferred Date', str),
+    ('preferred_time', 'Preferred Time', str),
+    ('duration', 'Estimated Duration', lambda value: f"{value} minutes"),
+    # Medical context
+    ('reason', 'Reason for Visit', str),
+    ('symptoms', 'Symptoms', join_or_str),
+    ('medical_history', 'Medical History', join_or_str),
+    # Special requirements
+    ('special_requirements', 'Special Requirements', join_or_str),
+    # Additional context
+    ('additional_context', 'Additional Context', str)
+)
+
+RESCHEDULING_INPUT_FIELDS = (
+    ('new_preferred_date', 'New Preferred Date', str),
+    ('new_preferred_time', 'New Preferred Time', str),
+    ('new_urgency', 'New Urgency', str),
+    ('reason_for_reschedule', 'Reason for Reschedule', str),
+    ('new_requirements', 'New Requirements', join_or_str)
+)
+
+# Appointments flushed per executemany batch in schedule_appointments_bulk
+BULK_INSERT_BATCH_SIZE = 2000
 
 class SchedulingAgent(BaseHealthcareAgent):
     """AI agent for appointment and resource scheduling"""
@@ -36,37 +247,107 @@ Always strive for efficiency and patient satisfaction."""
         scheduling_tools = [tool for tool in scheduling_tools if tool is not None]
         super().__init__("SchedulingAgent", system_prompt, scheduling_tools)
         self.logger = log_agent_event
+        # Available-slot results keyed on (doctor_id, date); cleared when appointments change
+        self._slot_cache = TTLCache(maxsize=1024, ttl=30)
+        self._slot_cache_lock = threading.Lock()
+    
+    def _invalidate_slot_cache(self, doctor_id: Optional[str], scheduled_date: Optional[datetime]):
+        """Drop cached slots for the doctor's day and the all-doctors view of that day"""
+        if scheduled_date is None:
+            return
+        day = scheduled_date.date()
+        with self._slot_cache_lock:
+            self._slot_cache.pop((doctor_id or None, day), None)
+            self._slot_cache.pop((None, day), None)
+    
+    def _clear_slot_cache(self):
+        """Drop every cached slot listing"""
+        with self._slot_cache_lock:
+            self._slot_cache.clear()
     
     def schedule_appointment(self, appointment_data: Dict[str, Any]) -> Dict[str, Any]:
         """Schedule a new appointment"""
         try:
-            # Prepare scheduling input
-            scheduling_input = self._prepare_scheduling_input(appointment_data)
+            # Fully specified requests for a free slot need no LLM reasoning
+            scheduling_result = self._requested_slot_if_free(appointment_data)
             
-            # Execute appointment scheduling
-            result = self.execute(scheduling_input)
-            
-            if result['success']:
-                # Parse scheduling result
-                scheduling_result = self._parse_scheduling_result(result['result'])
+            if scheduling_result:
+                assessment = DIRECT_SCHEDULING_ASSESSMENT
+            else:
+                # Prepare scheduling input
+                scheduling_input = self._prepare_scheduling_input(appointment_data)
                 
-                # Create appointment in database
-                appointment_record = self._create_appointment_record(appointment_data, scheduling_result, result['result'])
+                # Execute appointment scheduling
+                result = self.execute(scheduling_input)
                 
-                # Log appointment scheduling
-                self.logger("SchedulingAgent", "appointment_scheduled", 
-                           f"Appointment scheduled for patient {appointment_data.get('patient_id', 'unknown')}")
+                if not result['success']:
+                    self.logger("SchedulingAgent", "scheduling_failed", 
+                               f"Appointment scheduling failed: {result.get('error', 'Unknown error')}")
+                    return result
                 
-                return {
-                    'success': True,
-                    'appointment': scheduling_result,
-                    'appointment_id': appointment_record.get('id') if appointment_record else None,
-                    'assessment': result['result']
-                }
+                # Parse scheduling result and place it on a free slot
+                scheduling_result = self._parse_scheduling_result(result['result'])
+                scheduling_result = self._assign_free_slot(appointment_data, scheduling_result)
+                assessment = result['result']
+            
+            # Create appointment in database
+            appointment_record = self._create_appointment_record(appointment_data, scheduling_result, assessment)
+            
+            # Log appointment scheduling
+            self.logger("SchedulingAgent", "appointment_scheduled", 
+                       f"Appointment scheduled for patient {appointment_data.get('patient_id', 'unknown')}")
+            
+            return {
+                'success': True,
+                'appointment': scheduling_result,
+                'appointment_id': appointment_record.get('id') if appointment_record else None,
+                'assessment': assessment
+            }
+                
+        except Exception as e:
+            self.logger("SchedulingAgent", "scheduling_error", f"Appointment scheduling error: {str(e)}")
+            return {
+                'success': False,
+                'error': f"Appointment scheduling failed: {str(e)}"
+            }
+    
+    async def schedule_appointment_async(self, appointment_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Schedule a new appointment without blocking the event loop"""
+        try:
+            # Fully specified requests for a free slot need no LLM reasoning
+            scheduling_result = await asyncio.to_thread(self._requested_slot_if_free, appointment_data)
+            
+            if scheduling_result:
+                assessment = DIRECT_SCHEDULING_ASSESSMENT
             else:
-                self.logger("SchedulingAgent", "scheduling_failed", 
-                           f"Appointment scheduling failed: {result.get('error', 'Unknown error')}")
-                return result
+                # Execute appointment scheduling off the event loop
+                result = await self.execute_async(self._prepare_scheduling_input(appointment_data))
+                
+                if not result['success']:
+                    self.logger("SchedulingAgent", "scheduling_failed", 
+                               f"Appointment scheduling failed: {result.get('error', 'Unknown error')}")
+                    return result
+                
+                # Parse scheduling result and place it on a free slot
+                scheduling_result = self._parse_scheduling_result(result['result'])
+                scheduling_result = await asyncio.to_thread(self._assign_free_slot, appointment_data, scheduling_result)
+                assessment = result['result']
+            
+            # Create appointment in database; a worker thread keeps the pooled sync engine off the loop
+            appointment_record = await asyncio.to_thread(
+                self._create_appointment_record, appointment_data, scheduling_result, assessment
+            )
+            
+            # Log appointment scheduling
+            self.logger("SchedulingAgent", "appointment_scheduled", 
+                       f"Appointment scheduled for patient {appointment_data.get('patient_id', 'unknown')}")
+            
+            return {
+                'success': True,
+                'appointment': scheduling_result,
+                'appointment_id': appointment_record.get('id') if appointment_record else None,
+                'assessment': assessment
+            }
                 
         except Exception as e:
             self.logger("SchedulingAgent", "scheduling_error", f"Appointment scheduling error: {str(e)}")
@@ -75,101 +356,86 @@ Always strive for efficiency and patient satisfaction."""
                 'error': f"Appointment scheduling failed: {str(e)}"
             }
     
-    def _prepare_scheduling_input(self, appointment_data: Dict[str, Any]) -> str:
-        """Prepare input for appointment scheduling"""
-        input_parts = []
-        
-        # Patient information
-        if 'patient_id' in appointment_data:
-            input_parts.append(f"Patient ID: {appointment_data['patient_id']}")
-        
-        if 'patient_name' in appointment_data:
-            input_parts.append(f"Patient Name: {appointment_data['patient_name']}")
-        
-        if 'age' in appointment_data:
-            input_parts.append(f"Age: {appointment_data['age']}")
-        
-        # Appointment details
-        if 'appointment_type' in appointment_data:
-            input_parts.append(f"Appointment Type: {appointment_data['appointment_type']}")
-        
-        if 'department' in appointment_data:
-            input_parts.append(f"Department: {appointment_data['department']}")
-        
-        if 'doctor_id' in appointment_data:
-            input_parts.append(f"Requested Doctor: {appointment_data['doctor_id']}")
-        
-        if 'urgency' in appointment_data:
-            input_parts.append(f"Urgency: {appointment_data['urgency']}")
-        
-        if 'preferred_date' in appointment_data:
-            input_parts.append(f"Preferred Date: {appointment_data['preferred_date']}")
-        
-        if 'preferred_time' in appointment_data:
-            input_parts.append(f"Preferred Time: {appointment_data['preferred_time']}")
-        
-        if 'duration' in appointment_data:
-            input_parts.append(f"Estimated Duration: {appointment_data['duration']} minutes")
+    def _slot_is_free(self, doctor_id: str, room_number: Optional[str], start: datetime, duration: int,
+                      claimed: Iterable[tuple] = (), exclude_id: Optional[str] = None) -> bool:
+        """Whether the slot follows the solver's rules and is clear for the doctor and room.
+
+        claimed holds (start, end, doctor_id, room_number) intervals taken but not yet stored,
+        e.g. by earlier items of the same bulk request; exclude_id is an appointment being moved.
+        """
+        # Same rules as the slot solver: a future grid slot inside business hours
+        length = timedelta(minutes=duration)
+        if not doctor_id or duration <= 0 or not bookable_start(start, length, datetime.now()):
+            return False
         
-        # Medical context
-        if 'reason' in appointment_data:
-            input_parts.append(f"Reason for Visit: {appointment_data['reason']}")
+        end = start + length
+        if any(busy_start < end and busy_end > start
+               for busy_start, busy_end in claimed_intervals(claimed, doctor_id, room_number)):
+            return False
         
-        if 'symptoms' in appointment_data:
-            symptoms = appointment_data['symptoms']
-            if isinstance(symptoms, list):
-                symptoms_str = ", ".join(symptoms)
-            else:
-                symptoms_str = str(symptoms)
-            input_parts.append(f"Symptoms: {symptoms_str}")
+        with get_db_session() as session:
+            return not session.execute(
+                select(exists().where(
+                    held_resources(doctor_id, room_number),
+                    *overlapping_appointments(start, end, exclude_id)
+                ))
+            ).scalar()
+    
+    def _scheduled_slot_is_free(self, scheduling_result: Dict[str, Any], claimed: Iterable[tuple] = (),
+                                exclude_id: Optional[str] = None) -> bool:
+        """Check the slot a scheduling result ended up on, e.g. after the solver found nothing better"""
+        try:
+            start = parse_schedule_datetime(scheduling_result['recommended_date'], scheduling_result['recommended_time'])
+        except (TypeError, ValueError):
+            return False
+        return self._slot_is_free(
+            scheduling_result['assigned_doctor'], scheduling_result['assigned_room'] or None,
+            start, scheduling_result['duration'] or SLOT_MINUTES, claimed, exclude_id
+        )
+    
+    def _claim(self, scheduling_result: Dict[str, Any]) -> tuple:
+        """(start, end, doctor_id, room_number) interval a scheduling result takes"""
+        start = parse_schedule_datetime(scheduling_result['recommended_date'], scheduling_result['recommended_time'])
+        end = start + timedelta(minutes=scheduling_result['duration'] or SLOT_MINUTES)
+        return (start, end, scheduling_result['assigned_doctor'], scheduling_result['assigned_room'] or None)
+    
+    def _requested_slot_if_free(self, appointment_data: Dict[str, Any], claimed: Iterable[tuple] = ()) -> Optional[Dict[str, Any]]:
+        """Build a scheduling result for the requested slot when it is fully specified and free"""
+        if not all(appointment_data.get(key) for key in DIRECT_SCHEDULING_FIELDS):
+            return None
         
-        if 'medical_history' in appointment_data:
-            history = appointment_data['medical_history']
-            if isinstance(history, list):
-                history_str = ", ".join(history)
-            else:
-                history_str = str(history)
-            input_parts.append(f"Medical History: {history_str}")
+        try:
+            start = parse_schedule_datetime(appointment_data['preferred_date'], appointment_data['preferred_time'])
+            duration = int(appointment_data['duration'])
+        except (TypeError, ValueError):
+            return None
         
-        # Special requirements
-        if 'special_requirements' in appointment_data:
-            requirements = appointment_data['special_requirements']
-            if isinstance(requirements, list):
-                requirements_str = ", ".join(requirements)
-            else:
-                requirements_str = str(requirements)
-            input_parts.append(f"Special Requirements: {requirements_str}")
+        doctor_id = appointment_data['doctor_id']
+        if not self._slot_is_free(doctor_id, appointment_data.get('room_number'), start, duration, claimed):
+            return None
         
-        # Additional context
-        if 'additional_context' in appointment_data:
-            input_parts.append(f"Additional Context: {appointment_data['additional_context']}")
+        urgency = str(appointment_data.get('urgency', 'medium')).lower()
+        return {
+            'recommended_date': start.strftime('%Y-%m-%d'),
+            'recommended_time': start.strftime('%H:%M'),
+            'assigned_doctor': doctor_id,
+            'assigned_room': appointment_data.get('room_number', ''),
+            'duration': duration,
+            'priority': urgency if urgency in SLOT_SEARCH_HORIZON_DAYS else 'medium',
+            'alternatives': [],
+            'notes': 'Requested slot was available'
+        }
+    
+    def _prepare_scheduling_input(self, appointment_data: Dict[str, Any]) -> str:
+        """Prepare input for appointment scheduling"""
+        input_parts = [
+            f"{label}: {formatter(appointment_data[key])}"
+            for key, label, formatter in SCHEDULING_INPUT_FIELDS
+            if key in appointment_data
+        ]
         
         # Create scheduling prompt
-        scheduling_prompt = f"""
-Please schedule an appointment for this patient:
-
-{chr(10).join(input_parts)}
-
-Based on the above information, please:
-1. Determine optimal appointment timing
-2. Assign appropriate provider and room
-3. Consider urgency and patient needs
-4. Suggest alternative times if needed
-5. Provide scheduling recommendations
-6. Consider resource availability
-
-Format your response as:
-RECOMMENDED_DATE: [optimal appointment date]
-RECOMMENDED_TIME: [optimal appointment time]
-ASSIGNED_DOCTOR: [assigned doctor ID]
-ASSIGNED_ROOM: [assigned room number]
-DURATION: [appointment duration in minutes]
-PRIORITY: [high/medium/low priority]
-ALTERNATIVES: [alternative appointment times if needed]
-NOTES: [scheduling notes and recommendations]
-"""
-        
-        return scheduling_prompt
+        return SCHEDULING_PROMPT_TEMPLATE.format(details='\n'.join(input_parts))
     
     def _parse_scheduling_result(self, result: str) -> Dict[str, Any]:
         """Parse scheduling result from agent output"""
@@ -190,32 +456,17 @@ NOTES: [scheduling notes and recommendations]
             
             for line in lines:
                 line = line.strip()
-                if line.startswith('RECOMMENDED_DATE:'):
-                    date = line.split(':', 1)[1].strip()
-                    scheduling['recommended_date'] = date
-                elif line.startswith('RECOMMENDED_TIME:'):
-                    time = line.split(':', 1)[1].strip()
-                    scheduling['recommended_time'] = time
-                elif line.startswith('ASSIGNED_DOCTOR:'):
-                    doctor = line.split(':', 1)[1].strip()
-                    scheduling['assigned_doctor'] = doctor
-                elif line.startswith('ASSIGNED_ROOM:'):
-                    room = line.split(':', 1)[1].strip()
-                    scheduling['assigned_room'] = room
-                elif line.startswith('DURATION:'):
-                    duration_str = line.split(':', 1)[1].strip()
+                match = SCHEDULING_LINE_PATTERN.match(line)
+                if match:
+                    tag, value = match.groups()
+                    if tag == 'ALTERNATIVES':
+                        current_section = 'alternatives'
+                        continue
+                    key, convert = SCHEDULING_FIELDS[tag]
                     try:
-                        scheduling['duration'] = int(duration_str)
+                        scheduling[key] = convert(value)
                     except ValueError:
                         pass
-                elif line.startswith('PRIORITY:'):
-                    priority = line.split(':', 1)[1].strip().lower()
-                    scheduling['priority'] = priority
-                elif line.startswith('ALTERNATIVES:'):
-                    current_section = 'alternatives'
-                elif line.startswith('NOTES:'):
-                    notes = line.split(':', 1)[1].strip()
-                    scheduling['notes'] = notes
                 elif line and current_section and line.startswith('-'):
                     item = line[1:].strip()
                     if current_section in scheduling:
@@ -236,95 +487,230 @@ NOTES: [scheduling notes and recommendations]
                 'notes': 'Standard appointment scheduling'
             }
     
+    def schedule_appointments_bulk(self, appointments_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Schedule several appointments and store them in a single transaction"""
+        if len(appointments_data) <= 1:
+            return {
+                'success': True,
+                'appointments': [self.schedule_appointment(data) for data in appointments_data]
+            }
+        
+        try:
+            results = []
+            scheduled = []
+            # Slots taken by earlier items; they are not in the database until the batch is stored
+            claimed = []
+            for appointment_data in appointments_data:
+                # Same path as schedule_appointment: direct booking, else the LLM plus the slot solver
+                scheduling_result = self._requested_slot_if_free(appointment_data, claimed)
+                if scheduling_result:
+                    assessment = DIRECT_SCHEDULING_ASSESSMENT
+                else:
+                    result = self.execute(self._prepare_scheduling_input(appointment_data))
+                    if not result['success']:
+                        results.append(result)
+                        continue
+                    
+                    scheduling_result = self._parse_scheduling_result(result['result'])
+                    scheduling_result = self._assign_free_slot(appointment_data, scheduling_result, claimed)
+                    assessment = result['result']
+                    
+                    # The solver keeps the LLM's slot when it finds nothing free; never store a conflict
+                    if not self._scheduled_slot_is_free(scheduling_result, claimed):
+                        results.append({
+                            'success': False,
+                            'error': 'No free slot found for the requested appointment'
+                        })
+                        continue
+                
+                claimed.append(self._claim(scheduling_result))
+                response = {
+                    'success': True,
+                    'appointment': scheduling_result,
+                    'appointment_id': None,
+                    'assessment': assessment
+                }
+                results.append(response)
+                scheduled.append((response, appointment_data, scheduling_result, assessment))
+            
+            # Create all appointments in database
+            records = self._create_appointment_records([item[1:] for item in scheduled])
+            for (response, _, _, _), record in zip(scheduled, records):
+                response['appointment_id'] = record.get('id') if record else None
+            
+            self.logger("SchedulingAgent", "appointments_bulk_scheduled", 
+                       f"{sum(1 for record in records if record)} of {len(appointments_data)} appointments scheduled")
+            
+            return {
+                'success': True,
+                'appointments': results
+            }
+            
+        except Exception as e:
+            self.logger("SchedulingAgent", "bulk_scheduling_error", f"Bulk appointment scheduling error: {str(e)}")
+            return {
+                'success': False,
+                'error': f"Bulk appointment scheduling failed: {str(e)}"
+            }
+    
+    def _build_appointment(self, appointment_data: Dict[str, Any], scheduling_result: Dict[str, Any], assessment_result: str) -> Appointment:
+        """Build an unsaved appointment from a scheduling result"""
+        # Combine date and time
+        scheduled_datetime = parse_schedule_datetime(scheduling_result['recommended_date'], scheduling_result['recommended_time'])
+        
+        return Appointment(
+            id=str(uuid.uuid4()),
+            patient_id=appointment_data['patient_id'],
+            doctor_id=scheduling_result['assigned_doctor'],
+            department=appointment_data.get('department', ''),
+            appointment_type=appointment_data.get('appointment_type', 'consultation'),
+            scheduled_date=scheduled_datetime,
+            duration=scheduling_result['duration'],
+            status=AppointmentStatus.SCHEDULED,
+            notes=f"{scheduling_result['notes']}\n\n{assessment_result}",
+            room_number=scheduling_result['assigned_room']
+        )
+    
+    def _appointment_record(self, appointment: Appointment) -> Dict[str, Any]:
+        """Summarize a stored appointment"""
+        return {
+            'id': str(appointment.id),
+            'scheduled_date': appointment.scheduled_date.isoformat(),
+            'doctor_id': appointment.doctor_id,
+            'room_number': appointment.room_number,
+            'status': appointment.status.value
+        }
+    
     def _create_appointment_record(self, appointment_data: Dict[str, Any], scheduling_result: Dict[str, Any], assessment_result: str) -> Optional[Dict[str, Any]]:
         """Create appointment record in database"""
         try:
             with get_db_session() as session:
-                # Combine date and time
-                scheduled_datetime_str = f"{scheduling_result['recommended_date']} {scheduling_result['recommended_time']}"
-                scheduled_datetime = datetime.strptime(scheduled_datetime_str, '%Y-%m-%d %H:%M')
-                
-                appointment = Appointment(
-                    patient_id=appointment_data['patient_id'],
-                    doctor_id=scheduling_result['assigned_doctor'],
-                    department=appointment_data.get('department', ''),
-                    appointment_type=appointment_data.get('appointment_type', 'consultation'),
-                    scheduled_date=scheduled_datetime,
-                    duration=scheduling_result['duration'],
-                    status=AppointmentStatus.SCHEDULED,
-                    notes=f"{scheduling_result['notes']}\n\n{assessment_result}",
-                    room_number=scheduling_result['assigned_room']
-                )
+                appointment = self._build_appointment(appointment_data, scheduling_result, assessment_result)
                 
                 session.add(appointment)
                 session.commit()
                 session.refresh(appointment)
+                # Only once the outermost block commits; earlier, readers could re-cache the old slots
+                session.after_commit(partial(self._invalidate_slot_cache, appointment.doctor_id, appointment.scheduled_date))
                 
-                return {
-                    'id': str(appointment.id),
-                    'scheduled_date': appointment.scheduled_date.isoformat(),
-                    'doctor_id': appointment.doctor_id,
-                    'room_number': appointment.room_number,
-                    'status': appointment.status.value
-                }
+                return self._appointment_record(appointment)
                 
         except Exception as e:
             self.logger("SchedulingAgent", "database_error", f"Failed to create appointment record: {str(e)}")
             return None
     
-    def reschedule_appointment(self, appointment_id: str, new_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Reschedule an existing appointment"""
+    def _create_appointment_records(self, scheduled: List[tuple]) -> List[Optional[Dict[str, Any]]]:
+        """Insert many appointments with batched executemany and a single commit"""
+        records: List[Optional[Dict[str, Any]]] = []
         try:
             with get_db_session() as session:
-                appointment = session.query(Appointment).filter(Appointment.id == appointment_id).first()
-                
-                if not appointment:
-                    return {
-                        'success': False,
-                        'error': 'Appointment not found'
-                    }
+                pending = []
+                for appointment_data, scheduling_result, assessment_result in scheduled:
+                    try:
+                        appointment = self._build_appointment(appointment_data, scheduling_result, assessment_result)
+                    except (KeyError, ValueError) as e:
+                        self.logger("SchedulingAgent", "database_error", f"Skipping invalid appointment: {str(e)}")
+                        records.append(None)
+                        continue
+                    
+                    pending.append(appointment)
+                    records.append(self._appointment_record(appointment))
+                    if len(pending) >= BULK_INSERT_BATCH_SIZE:
+                        session.bulk_save_objects(pending)
+                        session.flush()
+                        pending = []
+                
+                if pending:
+                    session.bulk_save_objects(pending)
+                session.commit()
                 
-                # Prepare rescheduling input
-                rescheduling_input = self._prepare_rescheduling_input(appointment, new_data)
+                for record in records:
+                    if record:
+                        session.after_commit(partial(
+                            self._invalidate_slot_cache, record['doctor_id'], datetime.fromisoformat(record['scheduled_date'])
+                        ))
                 
-                # Execute rescheduling
-                result = self.execute(rescheduling_input)
+                return records
                 
-                if result['success']:
-                    # Parse rescheduling result
-                    rescheduling_result = self._parse_scheduling_result(result['result'])
-                    
-                    # Update appointment
-                    if rescheduling_result['recommended_date'] and rescheduling_result['recommended_time']:
-                        scheduled_datetime_str = f"{rescheduling_result['recommended_date']} {rescheduling_result['recommended_time']}"
-                        scheduled_datetime = datetime.strptime(scheduled_datetime_str, '%Y-%m-%d %H:%M')
-                        appointment.scheduled_date = scheduled_datetime
-                    
-                    if rescheduling_result['assigned_doctor']:
-                        appointment.doctor_id = rescheduling_result['assigned_doctor']
-                    
-                    if rescheduling_result['assigned_room']:
-                        appointment.room_number = rescheduling_result['assigned_room']
-                    
-                    if rescheduling_result['duration']:
-                        appointment.duration = rescheduling_result['duration']
-                    
-                    appointment.notes = f"Rescheduled: {rescheduling_result['notes']}\n\n{result['result']}"
-                    appointment.updated_at = datetime.utcnow()
-                    
-                    session.commit()
-                    
-                    self.logger("SchedulingAgent", "appointment_rescheduled", 
-                               f"Appointment {appointment_id} rescheduled successfully")
-                    
-                    return {
-                        'success': True,
-                        'appointment_id': appointment_id,
-                        'new_schedule': rescheduling_result,
-                        'updated_at': appointment.updated_at.isoformat()
-                    }
-                else:
-                    return result
+        except Exception as e:
+            self.logger("SchedulingAgent", "database_error", f"Failed to create appointment records: {str(e)}")
+            return [None] * len(scheduled)
+    
+    def reschedule_appointment(self, appointment_id: str, new_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Reschedule an existing appointment"""
+        try:
+            # Read only the fields the prompt needs as a plain row; the session is closed before the LLM call
+            with get_db_session() as session:
+                appointment = session.execute(
+                    select(
+                        Appointment.id, Appointment.scheduled_date, Appointment.doctor_id,
+                        Appointment.room_number, Appointment.duration
+                    ).where(Appointment.id == appointment_id)
+                ).first()
+            
+            if not appointment:
+                return {
+                    'success': False,
+                    'error': 'Appointment not found'
+                }
+            
+            # Prepare rescheduling input
+            rescheduling_input = self._prepare_rescheduling_input(appointment, new_data)
+            
+            # Execute rescheduling
+            result = self.execute(rescheduling_input)
+            
+            if not result['success']:
+                return result
+            
+            # Parse rescheduling result, keeping the current value for anything the LLM left out
+            rescheduling_result = self._parse_scheduling_result(result['result'])
+            if not (rescheduling_result['recommended_date'] and rescheduling_result['recommended_time']):
+                rescheduling_result['recommended_date'] = appointment.scheduled_date.strftime('%Y-%m-%d')
+                rescheduling_result['recommended_time'] = appointment.scheduled_date.strftime('%H:%M')
+            rescheduling_result['assigned_doctor'] = rescheduling_result['assigned_doctor'] or appointment.doctor_id
+            rescheduling_result['assigned_room'] = rescheduling_result['assigned_room'] or appointment.room_number or ''
+            rescheduling_result['duration'] = rescheduling_result['duration'] or appointment.duration or SLOT_MINUTES
+            
+            # Same slot rules as a new booking; the appointment's own current slot does not count as busy
+            rescheduling_result = self._assign_free_slot(new_data, rescheduling_result, exclude_id=appointment_id)
+            if not self._scheduled_slot_is_free(rescheduling_result, exclude_id=appointment_id):
+                return {
+                    'success': False,
+                    'error': 'No free slot found for the rescheduled appointment'
+                }
+            
+            # Update appointment in a short second session
+            updated_at = datetime.utcnow()
+            changes = {
+                'scheduled_date': parse_schedule_datetime(
+                    rescheduling_result['recommended_date'], rescheduling_result['recommended_time']
+                ),
+                'doctor_id': rescheduling_result['assigned_doctor'],
+                'room_number': rescheduling_result['assigned_room'] or None,
+                'duration': rescheduling_result['duration'],
+                'notes': f"Rescheduled: {rescheduling_result['notes']}\n\n{result['result']}",
+                'updated_at': updated_at
+            }
+            with get_db_session() as session:
+                session.execute(
+                    update(Appointment)
+                    .where(Appointment.id == appointment_id)
+                    .values(**changes)
+                    .execution_options(synchronize_session=False)
+                )
+                session.after_commit(partial(self._invalidate_slot_cache, appointment.doctor_id, appointment.scheduled_date))
+                session.after_commit(partial(self._invalidate_slot_cache, changes['doctor_id'], changes['scheduled_date']))
+            
+            self.logger("SchedulingAgent", "appointment_rescheduled", 
+                       f"Appointment {appointment_id} rescheduled successfully")
+            
+            return {
+                'success': True,
+                'appointment_id': appointment_id,
+                'new_schedule': rescheduling_result,
+                'updated_at': updated_at.isoformat()
+            }
                 
         except Exception as e:
             self.logger("SchedulingAgent", "reschedule_error", f"Failed to reschedule appointment: {str(e)}")
@@ -333,7 +719,7 @@ NOTES: [scheduling notes and recommendations]
                 'error': f"Failed to reschedule appointment: {str(e)}"
             }
     
-    def _prepare_rescheduling_input(self, appointment: Appointment, new_data: Dict[str, Any]) -> str:
+    def _prepare_rescheduling_input(self, appointment: Any, new_data: Dict[str, Any]) -> str:
         """Prepare input for appointment rescheduling"""
         input_parts = []
         
@@ -345,79 +731,50 @@ NOTES: [scheduling notes and recommendations]
         input_parts.append(f"Current Duration: {appointment.duration} minutes")
         
         # New requirements
-        if 'new_preferred_date' in new_data:
-            input_parts.append(f"New Preferred Date: {new_data['new_preferred_date']}")
-        
-        if 'new_preferred_time' in new_data:
-            input_parts.append(f"New Preferred Time: {new_data['new_preferred_time']}")
-        
-        if 'new_urgency' in new_data:
-            input_parts.append(f"New Urgency: {new_data['new_urgency']}")
-        
-        if 'reason_for_reschedule' in new_data:
-            input_parts.append(f"Reason for Reschedule: {new_data['reason_for_reschedule']}")
-        
-        if 'new_requirements' in new_data:
-            requirements = new_data['new_requirements']
-            if isinstance(requirements, list):
-                requirements_str = ", ".join(requirements)
-            else:
-                requirements_str = str(requirements)
-            input_parts.append(f"New Requirements: {requirements_str}")
+        input_parts.extend(
+            f"{label}: {formatter(new_data[key])}"
+            for key, label, formatter in RESCHEDULING_INPUT_FIELDS
+            if key in new_data
+        )
         
         # Create rescheduling prompt
-        rescheduling_prompt = f"""
-Please reschedule this appointment:
-
-{chr(10).join(input_parts)}
-
-Based on the above information, please:
-1. Determine new optimal appointment timing
-2. Consider availability of current provider
-3. Suggest alternative providers if needed
-4. Maintain appointment quality and patient care
-5. Provide rescheduling recommendations
-
-Format your response as:
-RECOMMENDED_DATE: [new optimal appointment date]
-RECOMMENDED_TIME: [new optimal appointment time]
-ASSIGNED_DOCTOR: [assigned doctor ID]
-ASSIGNED_ROOM: [assigned room number]
-DURATION: [appointment duration in minutes]
-PRIORITY: [high/medium/low priority]
-ALTERNATIVES: [alternative appointment times if needed]
-NOTES: [rescheduling notes and recommendations]
-"""
-        
-        return rescheduling_prompt
+        return RESCHEDULING_PROMPT_TEMPLATE.format(details='\n'.join(input_parts))
     
     def get_available_slots(self, doctor_id: Optional[str] = None, date: Optional[str] = None) -> Dict[str, Any]:
         """Get available appointment slots"""
         try:
+            base_date = datetime.now().date()
+            if date:
+                base_date = datetime.fromisoformat(date).date()
+            
+            cache_key = (doctor_id or None, base_date)
+            with self._slot_cache_lock:
+                cached_slots = self._slot_cache.get(cache_key)
+            if cached_slots is not None:
+                return cached_slots
+            
             with get_db_session() as session:
-                # Get existing appointments
-                query = session.query(Appointment)
-                
+                # Count existing appointments for the day
+                count_query = select(func.count(Appointment.id)).where(
+                    Appointment.scheduled_date >= base_date,
+                    Appointment.scheduled_date < base_date + timedelta(days=1)
+                )
                 if doctor_id:
-                    query = query.filter(Appointment.doctor_id == doctor_id)
-                
-                if date:
-                    date_obj = datetime.strptime(date, '%Y-%m-%d').date()
-                    query = query.filter(
-                        Appointment.scheduled_date >= date_obj,
-                        Appointment.scheduled_date < date_obj + timedelta(days=1)
-                    )
-                
-                existing_appointments = query.all()
+                    count_query = count_query.where(Appointment.doctor_id == doctor_id)
+                existing_appointments = session.execute(count_query).scalar()
                 
                 # Generate available slots (simplified - in real system would check provider schedules)
-                available_slots = self._generate_available_slots(existing_appointments, doctor_id, date)
+                available_slots = self._generate_available_slots(session, doctor_id, base_date)
                 
-                return {
+                slots_result = {
                     'success': True,
                     'available_slots': available_slots,
-                    'existing_appointments': len(existing_appointments)
+                    'existing_appointments': existing_appointments
                 }
+                with self._slot_cache_lock:
+                    self._slot_cache[cache_key] = slots_result
+                
+                return slots_result
                 
         except Exception as e:
             self.logger("SchedulingAgent", "slots_error", f"Failed to get available slots: {str(e)}")
@@ -426,83 +783,153 @@ NOTES: [rescheduling notes and recommendations]
                 'error': f"Failed to get available slots: {str(e)}"
             }
     
-    def _generate_available_slots(self, existing_appointments: List[Appointment], doctor_id: Optional[str], date: Optional[str]) -> List[Dict[str, Any]]:
-        """Generate available appointment slots"""
-        # Simplified slot generation - in real system would check provider schedules
-        base_date = datetime.now().date()
-        if date:
-            base_date = datetime.strptime(date, '%Y-%m-%d').date()
+    def _generate_available_slots(self, session, doctor_id: Optional[str], base_date) -> List[Dict[str, Any]]:
+        """Generate available appointment slots, filtering conflicts in the database"""
+        slot_duration = SLOT_MINUTES
         
-        # Standard business hours: 9 AM to 5 PM
-        start_hour = 9
-        end_hour = 17
-        slot_duration = 30  # minutes
+        # Candidate slots stay in Python; only the conflict tests run in SQL
+        opening = datetime.combine(base_date, datetime.min.time().replace(hour=BUSINESS_START_HOUR))
+        slot_length = timedelta(minutes=slot_duration)
+        slot_starts = [opening + offset for offset in SLOT_OFFSETS]
         
-        available_slots = []
+        # One EXISTS column per slot in a single round trip. Each compares against bound constants,
+        # which MySQL converts to DATETIME; a UNION of bound literals would come back as strings.
+        doctor_filter = [Appointment.doctor_id == doctor_id] if doctor_id else []
+        taken = session.execute(select(*[
+            exists().where(*overlapping_appointments(start, start + slot_length), *doctor_filter)
+            for start in slot_starts
+        ])).one()
         
-        for hour in range(start_hour, end_hour):
-            for minute in [0, 30]:
-                slot_time = datetime.combine(base_date, datetime.min.time().replace(hour=hour, minute=minute))
-                
-                # Check if slot conflicts with existing appointments
-                slot_end = slot_time + timedelta(minutes=slot_duration)
-                conflict = False
-                
-                for appointment in existing_appointments:
-                    appointment_end = appointment.scheduled_date + timedelta(minutes=appointment.duration)
-                    if (slot_time < appointment_end and slot_end > appointment.scheduled_date):
-                        conflict = True
-                        break
+        return [
+            {
+                'time': slot_time.strftime('%H:%M'),
+                'datetime': slot_time.isoformat(),
+                'duration': slot_duration,
+                'available': True
+            }
+            for slot_time, slot_taken in zip(slot_starts, taken)
+            if not slot_taken
+        ]
+    
+    def _assign_free_slot(self, appointment_data: Dict[str, Any], scheduling_result: Dict[str, Any],
+                          claimed: Iterable[tuple] = (), exclude_id: Optional[str] = None) -> Dict[str, Any]:
+        """Move the recommended date/time onto a slot that is free for the doctor and room"""
+        doctor_id = scheduling_result['assigned_doctor'] or appointment_data.get('doctor_id')
+        if not doctor_id:
+            return scheduling_result
+        
+        try:
+            # Prefer the LLM recommendation, then the patient's preference, then now
+            try:
+                preferred_start = parse_schedule_datetime(
+                    scheduling_result['recommended_date'], scheduling_result['recommended_time']
+                )
+            except ValueError:
+                if appointment_data.get('preferred_date'):
+                    preferred_start = parse_schedule_datetime(
+                        appointment_data['preferred_date'], appointment_data.get('preferred_time') or '09:00'
+                    )
+                else:
+                    preferred_start = datetime.now()
+            
+            with get_db_session() as session:
+                slot_start = self._solve_slot(
+                    session,
+                    doctor_id,
+                    scheduling_result['assigned_room'] or None,
+                    preferred_start,
+                    scheduling_result['duration'] or SLOT_MINUTES,
+                    SLOT_SEARCH_HORIZON_DAYS.get(scheduling_result['priority'], 7),
+                    claimed,
+                    exclude_id
+                )
+            
+            if slot_start:
+                scheduling_result['recommended_date'] = slot_start.strftime('%Y-%m-%d')
+                scheduling_result['recommended_time'] = slot_start.strftime('%H:%M')
+                scheduling_result['assigned_doctor'] = doctor_id
                 
-                if not conflict:
-                    available_slots.append({
-                        'time': slot_time.strftime('%H:%M'),
-                        'datetime': slot_time.isoformat(),
-                        'duration': slot_duration,
-                        'available': True
-                    })
+        except Exception as e:
+            self.logger("SchedulingAgent", "solver_error", f"Failed to assign free slot: {str(e)}")
+        
+        return scheduling_result
+    
+    def _solve_slot(self, session, doctor_id: str, room_number: Optional[str], preferred_start: datetime, duration: int, horizon_days: int,
+                    claimed: Iterable[tuple] = (), exclude_id: Optional[str] = None) -> Optional[datetime]:
+        """Find the start closest to the preferred time that overlaps no doctor or room booking"""
+        now = datetime.now()
+        first_day = max(preferred_start, now).date()
+        horizon_start = datetime.combine(first_day, datetime.min.time().replace(hour=BUSINESS_START_HOUR))
+        horizon_end = datetime.combine(
+            first_day + timedelta(days=horizon_days - 1), datetime.min.time().replace(hour=BUSINESS_END_HOUR)
+        )
+        
+        # Busy intervals for the doctor and room over the whole horizon, streamed in start order
+        busy = session.execute(
+            select(Appointment.scheduled_date, APPOINTMENT_END).where(
+                held_resources(doctor_id, room_number),
+                *overlapping_appointments(horizon_start, horizon_end, exclude_id)
+            ).order_by(Appointment.scheduled_date).execution_options(yield_per=256)
+        )
+        
+        # Candidate starts that fit the appointment inside business hours, in time order
+        length = timedelta(minutes=duration)
+        candidates = [
+            start
+            for day_offset in range(horizon_days)
+            for start in (horizon_start + timedelta(days=day_offset) + offset for offset in SLOT_OFFSETS)
+            if bookable_start(start, length, now)
+        ]
+        
+        # Minimize distance from the preferred start, earliest first on ties
+        stored = ((busy_start, busy_end) for busy_start, busy_end in busy)
+        available = free_starts(candidates, length, heapq.merge(stored, claimed_intervals(claimed, doctor_id, room_number)))
+        busy.close()
+        if available:
+            return min(available, key=lambda start: (abs(start - preferred_start), start))
         
-        return available_slots
+        return None
     
     def get_scheduling_statistics(self, doctor_id: Optional[str] = None) -> Dict[str, Any]:
         """Get scheduling statistics"""
         try:
             with get_db_session() as session:
-                # Base query
-                appointments_query = session.query(Appointment)
-                
+                # Base filter
+                filters = []
                 if doctor_id:
-                    appointments_query = appointments_query.filter(Appointment.doctor_id == doctor_id)
-                
-                # Get appointment statistics
-                total_appointments = appointments_query.count()
-                
-                # Get appointments by status
-                status_counts = {}
-                for status in AppointmentStatus:
-                    count = appointments_query.filter(Appointment.status == status).count()
-                    status_counts[status.value] = count
-                
-                # Get appointments by type
+                    filters.append(Appointment.doctor_id == doctor_id)
+                
+                # Count every (status, type) bucket with its upcoming (next 7 days) and today share in one query
+                now = datetime.utcnow()
+                next_week = now + timedelta(days=7)
+                today = now.date()
+                bucket_rows = session.query(
+                    Appointment.status,
+                    Appointment.appointment_type,
+                    func.count(Appointment.id),
+                    func.sum(case((and_(
+                        Appointment.scheduled_date >= now,
+                        Appointment.scheduled_date <= next_week
+                    ), 1), else_=0)),
+                    func.sum(case((and_(
+                        Appointment.scheduled_date >= today,
+                        Appointment.scheduled_date < today + timedelta(days=1)
+                    ), 1), else_=0))
+                ).filter(*filters).group_by(Appointment.status, Appointment.appointment_type).all()
+                
+                # Fan the buckets out into status, type and time totals
+                total_appointments = 0
+                upcoming_appointments = 0
+                today_appointments = 0
+                status_counts = dict.fromkeys(APPOINTMENT_STATUS_VALUES.values(), 0)
                 type_counts = {}
-                appointment_types = session.query(Appointment.appointment_type).distinct().all()
-                for appt_type in appointment_types:
-                    count = appointments_query.filter(Appointment.appointment_type == appt_type[0]).count()
-                    type_counts[appt_type[0]] = count
-                
-                # Get recent appointments (next 7 days)
-                next_week = datetime.utcnow() + timedelta(days=7)
-                upcoming_appointments = appointments_query.filter(
-                    Appointment.scheduled_date >= datetime.utcnow(),
-                    Appointment.scheduled_date <= next_week
-                ).count()
-                
-                # Get today's appointments
-                today = datetime.utcnow().date()
-                today_appointments = appointments_query.filter(
-                    Appointment.scheduled_date >= today,
-                    Appointment.scheduled_date < today + timedelta(days=1)
-                ).count()
+                for status, appt_type, count, upcoming, today_count in bucket_rows:
+                    total_appointments += count
+                    upcoming_appointments += int(upcoming or 0)
+                    today_appointments += int(today_count or 0)
+                    if status is not None:
+                        status_counts[APPOINTMENT_STATUS_VALUES[status]] += count
+                    type_counts[appt_type] = type_counts.get(appt_type, 0) + count
                 
                 return {
                     'success': True,
@@ -526,20 +953,28 @@ NOTES: [rescheduling notes and recommendations]
         """Cancel an appointment"""
         try:
             with get_db_session() as session:
-                appointment = session.query(Appointment).filter(Appointment.id == appointment_id).first()
+                # Update appointment status in place; notes are prefixed server-side
+                cancelled_at = datetime.utcnow()
+                update_result = session.execute(
+                    update(Appointment)
+                    .where(Appointment.id == appointment_id)
+                    .values(
+                        status=AppointmentStatus.CANCELLED,
+                        notes=prepend_note(f"Cancelled: {reason}"),
+                        updated_at=cancelled_at
+                    )
+                    .execution_options(synchronize_session=False)
+                )
                 
-                if not appointment:
+                if update_result.rowcount == 0:
                     return {
                         'success': False,
                         'error': 'Appointment not found'
                     }
                 
-                # Update appointment status
-                appointment.status = AppointmentStatus.CANCELLED
-                appointment.notes = f"Cancelled: {reason}\n\n{appointment.notes or ''}"
-                appointment.updated_at = datetime.utcnow()
-                
                 session.commit()
+                # MySQL has no UPDATE ... RETURNING, so the appointment's day is unknown here
+                session.after_commit(self._clear_slot_cache)
                 
                 self.logger("SchedulingAgent", "appointment_cancelled", 
                            f"Appointment {appointment_id} cancelled: {reason}")
@@ -547,7 +982,7 @@ NOTES: [rescheduling notes and recommendations]
                 return {
                     'success': True,
                     'appointment_id': appointment_id,
-                    'cancelled_at': appointment.updated_at.isoformat(),
+                    'cancelled_at': cancelled_at.isoformat(),
                     'reason': reason
                 }
                 
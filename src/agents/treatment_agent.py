@@ -5,14 +5,141 @@ This agent handles treatment planning, medication management, care coordination,
 and treatment outcome monitoring for patients.
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
 from langchain_core.tools import BaseTool
 from agents.base_agent import BaseHealthcareAgent
 from utils.logger import log_agent_event
+from utils.prompt_formatting import join_or_str, format_vital_signs, format_lab_results
 from database.models import Treatment, MedicalRecord, Alert, AlertSeverity
 from database.connection import get_db_session
+from sqlalchemy import func, case
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from cachetools import TTLCache, LRUCache
+import asyncio
+import threading
 import json
+import uuid
+import hashlib
+import re
+
+# Prompt fields as (patient_data key, label, formatter), in prompt order;
+# fields that are missing or format to an empty string are skipped
+TREATMENT_INPUT_FIELDS = (
+    # Patient information
+    ('patient_id', 'Patient ID', str),
+    ('age', 'Age', str),
+    ('gender', 'Gender', str),
+    # Clinical details
+    ('diagnoses', 'Diagnoses', join_or_str),
+    ('medical_history', 'Medical History', join_or_str),
+    ('current_medications', 'Current Medications', join_or_str),
+    ('allergies', 'Allergies', join_or_str),
+    ('vital_signs', 'Current Vital Signs', format_vital_signs),
+    ('lab_results', 'Lab Results', format_lab_results),
+    ('treatment_goals', 'Treatment Goals', join_or_str),
+    ('additional_context', 'Additional Context', str)
+)
+
+TREATMENT_PROMPT_TEMPLATE = """
+Please create a comprehensive treatment plan for this patient:
+
+{details}
+
+Based on the above patient information, please develop a treatment plan that includes:
+1. Recommended medications with dosages and schedules
+2. Non-pharmacological interventions
+3. Monitoring requirements and frequency
+4. Expected outcomes and timelines
+5. Potential side effects and management
+6. Follow-up schedule and criteria
+7. Patient education and self-care instructions
+
+Format your response as:
+TREATMENT_TYPE: [primary treatment category]
+MEDICATIONS: [list of medications with dosages and schedules]
+INTERVENTIONS: [non-pharmacological treatments]
+MONITORING: [required monitoring and frequency]
+TIMELINE: [expected treatment duration and milestones]
+SIDE_EFFECTS: [potential side effects and management]
+FOLLOW_UP: [follow-up schedule and criteria]
+EDUCATION: [patient education topics]
+ASSESSMENT: [brief treatment plan summary]
+"""
+
+INTERACTION_PROMPT_TEMPLATE = """
+Please check for potential interactions between these medications:
+
+Medications: {medications}
+
+Please identify:
+1. Any known drug-drug interactions
+2. Potential side effects when taken together
+3. Recommendations for monitoring
+4. Alternative medication options if needed
+
+Format your response as:
+INTERACTIONS: [list any drug interactions found]
+SIDE_EFFECTS: [potential side effects]
+MONITORING: [recommended monitoring]
+ALTERNATIVES: [alternative options if needed]
+SAFETY: [overall safety assessment]
+"""
+
+# Response header -> parsed field; scalar fields take the rest of the header line,
+# the others collect the "-" bullet lines that follow
+TREATMENT_PLAN_HEADERS = {
+    'TREATMENT_TYPE': 'treatment_type',
+    'MEDICATIONS': 'medications',
+    'INTERVENTIONS': 'interventions',
+    'MONITORING': 'monitoring',
+    'TIMELINE': 'timeline',
+    'SIDE_EFFECTS': 'side_effects',
+    'FOLLOW_UP': 'follow_up',
+    'EDUCATION': 'education',
+    'ASSESSMENT': 'assessment',
+}
+TREATMENT_PLAN_SCALARS = frozenset({'treatment_type', 'timeline', 'assessment'})
+
+INTERACTION_HEADERS = {
+    'INTERACTIONS': 'interactions',
+    'SIDE_EFFECTS': 'side_effects',
+    'MONITORING': 'monitoring',
+    'ALTERNATIVES': 'alternatives',
+    'SAFETY': 'safety',
+}
+INTERACTION_SCALARS = frozenset({'safety'})
+
+# One pattern for every header either parser understands; each parser maps its own
+SECTION_HEADER_PATTERN = re.compile(
+    r'^(TREATMENT_TYPE|MEDICATIONS|INTERVENTIONS|MONITORING|TIMELINE|SIDE_EFFECTS|FOLLOW_UP|EDUCATION|ASSESSMENT|INTERACTIONS|ALTERNATIVES|SAFETY):\s*(.*)$'
+)
+
+# Treatment columns that update_treatment_plan may set; the primary key is never rewritten
+TREATMENT_UPDATABLE_FIELDS = frozenset(column.name for column in Treatment.__table__.columns) - {'id'}
+
+# Non-empty lines of an agent response
+RESPONSE_LINE_PATTERN = re.compile(r'[^\n]+')
+
+def iter_lines(text: str) -> Iterator[str]:
+    """Yield the non-empty lines of text without copying or splitting it up front"""
+    for match in RESPONSE_LINE_PATTERN.finditer(text):
+        yield match.group()
+
+def iter_section_items(lines: Iterable[str], headers: Dict[str, str], scalars: frozenset) -> Iterator[Tuple[str, str]]:
+    """Yield (field, value) pairs from a stream of response lines as each line completes"""
+    current_section = None
+    for line in lines:
+        line = line.strip()
+        match = SECTION_HEADER_PATTERN.match(line)
+        if match:
+            section = headers.get(match.group(1))
+            if section in scalars:
+                yield section, match.group(2)
+            elif section:
+                current_section = section
+        elif current_section and line.startswith('-'):
+            yield current_section, line[1:].strip()
 
 class TreatmentAgent(BaseHealthcareAgent):
     """AI agent for treatment planning and management"""
@@ -36,10 +163,38 @@ Always prioritize patient well-being and adhere to best medical practices."""
         treatment_tools = [tool for tool in treatment_tools if tool is not None]
         super().__init__("TreatmentAgent", system_prompt, treatment_tools)
         self.logger = log_agent_event
+        # Interaction checks for the same medication set are answered from cache for an hour
+        self._interaction_cache = TTLCache(maxsize=1024, ttl=3600)
+        self._interaction_cache_lock = threading.Lock()
+        # Statistics per patient (None for all patients), dropped on treatment writes
+        self._stats_cache = TTLCache(maxsize=512, ttl=60)
+        self._stats_cache_lock = threading.Lock()
+        # Planning prompts for recently seen patient data (retries, repeated replans)
+        self._prompt_cache = LRUCache(maxsize=256)
+        self._prompt_cache_lock = threading.Lock()
+        # Background writer for create_treatment_plan(persist='async')
+        self._io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='treatment-io')
+    
+    def _invalidate_stats_cache(self, patient_id: Optional[str]):
+        """Drop cached statistics for a patient and the all-patient totals"""
+        with self._stats_cache_lock:
+            self._stats_cache.pop(patient_id, None)
+            self._stats_cache.pop(None, None)
     
-    def create_treatment_plan(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a comprehensive treatment plan for a patient"""
+    def _interaction_cache_key(self, medications: List[str]) -> tuple:
+        """Build an order- and case-insensitive cache key for a medication list"""
+        return tuple(sorted({str(medication).strip().lower() for medication in medications}))
+    
+    def create_treatment_plan(self, patient_data: Dict[str, Any], persist: str = 'sync') -> Dict[str, Any]:
+        """Create a comprehensive treatment plan for a patient
+        
+        With persist='async' the records are written on the agent's I/O pool; the
+        response carries the ids they will be stored under and save_status 'pending'.
+        """
         try:
+            if persist not in ('sync', 'async'):
+                raise ValueError(f"persist must be 'sync' or 'async', got {persist!r}")
+            
             # Prepare treatment planning input
             planning_input = self._prepare_treatment_input(patient_data)
             
@@ -50,11 +205,30 @@ Always prioritize patient well-being and adhere to best medical practices."""
                 # Parse treatment plan from result
                 treatment_plan = self._parse_treatment_plan(result['result'])
                 
-                # Create treatment record
-                treatment_record = self._create_treatment_record(patient_data, treatment_plan, result['result'])
+                if persist == 'async':
+                    # Ids are chosen here so the response can carry them without waiting on the commit
+                    treatment_id = str(uuid.uuid4())
+                    medical_record_id = str(uuid.uuid4())
+                    save_future = self._io_pool.submit(
+                        self._save_treatment_plan, patient_data, treatment_plan, result['result'],
+                        treatment_id, medical_record_id
+                    )
+                    save_future.add_done_callback(self._report_background_save)
+                    
+                    self.logger("TreatmentAgent", "treatment_plan_created", 
+                               f"Treatment plan created for patient {patient_data.get('patient_id', 'unknown')}")
+                    
+                    return {
+                        'success': True,
+                        'treatment_plan': treatment_plan,
+                        'treatment_id': treatment_id,
+                        'medical_record_id': medical_record_id,
+                        'save_status': 'pending',
+                        'assessment': result['result']
+                    }
                 
-                # Create medical record for treatment plan
-                medical_record = self._create_medical_record(patient_data, treatment_plan, result['result'])
+                # Create treatment and medical records in one transaction
+                treatment_record, medical_record = self._save_treatment_plan(patient_data, treatment_plan, result['result'])
                 
                 # Log treatment planning
                 self.logger("TreatmentAgent", "treatment_plan_created", 
@@ -79,112 +253,84 @@ Always prioritize patient well-being and adhere to best medical practices."""
                 'error': f"Treatment planning failed: {str(e)}"
             }
     
-    def _prepare_treatment_input(self, patient_data: Dict[str, Any]) -> str:
-        """Prepare input for treatment planning"""
-        input_parts = []
-        
-        # Patient information
-        if 'patient_id' in patient_data:
-            input_parts.append(f"Patient ID: {patient_data['patient_id']}")
-        
-        if 'age' in patient_data:
-            input_parts.append(f"Age: {patient_data['age']}")
-        
-        if 'gender' in patient_data:
-            input_parts.append(f"Gender: {patient_data['gender']}")
-        
-        # Diagnoses
-        if 'diagnoses' in patient_data:
-            diagnoses = patient_data['diagnoses']
-            if isinstance(diagnoses, list):
-                diagnoses_str = ", ".join(diagnoses)
-            else:
-                diagnoses_str = str(diagnoses)
-            input_parts.append(f"Diagnoses: {diagnoses_str}")
-        
-        # Medical history
-        if 'medical_history' in patient_data:
-            history = patient_data['medical_history']
-            if isinstance(history, list):
-                history_str = ", ".join(history)
-            else:
-                history_str = str(history)
-            input_parts.append(f"Medical History: {history_str}")
-        
-        # Current medications
-        if 'current_medications' in patient_data:
-            meds = patient_data['current_medications']
-            if isinstance(meds, list):
-                meds_str = ", ".join(meds)
-            else:
-                meds_str = str(meds)
-            input_parts.append(f"Current Medications: {meds_str}")
-        
-        # Allergies
-        if 'allergies' in patient_data:
-            allergies = patient_data['allergies']
-            if isinstance(allergies, list):
-                allergies_str = ", ".join(allergies)
+    async def acreate_treatment_plan(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a treatment plan without blocking the event loop"""
+        try:
+            # Execute treatment planning off the event loop
+            result = await self.execute_async(self._prepare_treatment_input(patient_data))
+            
+            if result['success']:
+                treatment_plan = self._parse_treatment_plan(result['result'])
+                
+                # Create treatment and medical records in a worker thread
+                treatment_record, medical_record = await asyncio.to_thread(
+                    self._save_treatment_plan, patient_data, treatment_plan, result['result']
+                )
+                
+                self.logger("TreatmentAgent", "treatment_plan_created", 
+                           f"Treatment plan created for patient {patient_data.get('patient_id', 'unknown')}")
+                
+                return {
+                    'success': True,
+                    'treatment_plan': treatment_plan,
+                    'treatment_id': treatment_record.get('id') if treatment_record else None,
+                    'medical_record_id': medical_record.get('id') if medical_record else None,
+                    'assessment': result['result']
+                }
             else:
-                allergies_str = str(allergies)
-            input_parts.append(f"Allergies: {allergies_str}")
-        
-        # Vital signs
-        if 'vital_signs' in patient_data:
-            vitals = patient_data['vital_signs']
-            vitals_str = []
-            for vital, value in vitals.items():
-                if value is not None:
-                    vitals_str.append(f"{vital}: {value}")
-            if vitals_str:
-                input_parts.append(f"Current Vital Signs: {', '.join(vitals_str)}")
+                self.logger("TreatmentAgent", "treatment_planning_failed", 
+                           f"Treatment planning failed: {result.get('error', 'Unknown error')}")
+                return result
+                
+        except Exception as e:
+            self.logger("TreatmentAgent", "treatment_planning_error", f"Treatment planning error: {str(e)}")
+            return {
+                'success': False,
+                'error': f"Treatment planning failed: {str(e)}"
+            }
+    
+    async def plan_and_check(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a treatment plan and check current medications concurrently"""
+        medications = patient_data.get('current_medications') or []
+        if isinstance(medications, str):
+            medications = [medications]
         
-        # Lab results
-        if 'lab_results' in patient_data:
-            labs = patient_data['lab_results']
-            if isinstance(labs, dict):
-                labs_str = json.dumps(labs)
-                input_parts.append(f"Lab Results: {labs_str}")
+        # The two LLM calls are independent, so latency is the slower of the two
+        plan, interactions = await asyncio.gather(
+            self.acreate_treatment_plan(patient_data),
+            self.acheck_medication_interactions(medications)
+        )
         
-        # Treatment goals
-        if 'treatment_goals' in patient_data:
-            goals = patient_data['treatment_goals']
-            if isinstance(goals, list):
-                goals_str = ", ".join(goals)
-            else:
-                goals_str = str(goals)
-            input_parts.append(f"Treatment Goals: {goals_str}")
+        return {
+            'success': plan['success'] and interactions['success'],
+            'plan': plan,
+            'interactions': interactions
+        }
+    
+    def _prepare_treatment_input(self, patient_data: Dict[str, Any]) -> str:
+        """Prepare input for treatment planning"""
+        # The prompt is a pure function of patient_data, so identical inputs share one build
+        cache_key = hashlib.blake2b(
+            json.dumps(patient_data, sort_keys=True, default=str).encode(), digest_size=16
+        ).hexdigest()
+        with self._prompt_cache_lock:
+            cached_prompt = self._prompt_cache.get(cache_key)
+        if cached_prompt is not None:
+            return cached_prompt
         
-        # Additional context
-        if 'additional_context' in patient_data:
-            input_parts.append(f"Additional Context: {patient_data['additional_context']}")
+        input_parts = []
+        for key, label, formatter in TREATMENT_INPUT_FIELDS:
+            value = patient_data.get(key)
+            if value is None:
+                continue
+            text = formatter(value)
+            if text:
+                input_parts.append(f"{label}: {text}")
         
         # Create treatment planning prompt
-        treatment_prompt = f"""
-Please create a comprehensive treatment plan for this patient:
-
-{chr(10).join(input_parts)}
-
-Based on the above patient information, please develop a treatment plan that includes:
-1. Recommended medications with dosages and schedules
-2. Non-pharmacological interventions
-3. Monitoring requirements and frequency
-4. Expected outcomes and timelines
-5. Potential side effects and management
-6. Follow-up schedule and criteria
-7. Patient education and self-care instructions
-
-Format your response as:
-TREATMENT_TYPE: [primary treatment category]
-MEDICATIONS: [list of medications with dosages and schedules]
-INTERVENTIONS: [non-pharmacological treatments]
-MONITORING: [required monitoring and frequency]
-TIMELINE: [expected treatment duration and milestones]
-SIDE_EFFECTS: [potential side effects and management]
-FOLLOW_UP: [follow-up schedule and criteria]
-EDUCATION: [patient education topics]
-ASSESSMENT: [brief treatment plan summary]
-"""
+        treatment_prompt = TREATMENT_PROMPT_TEMPLATE.format(details="\n".join(input_parts))
+        with self._prompt_cache_lock:
+            self._prompt_cache[cache_key] = treatment_prompt
         
         return treatment_prompt
     
@@ -203,36 +349,12 @@ ASSESSMENT: [brief treatment plan summary]
                 'assessment': ''
             }
             
-            lines = result.split('\n')
-            current_section = None
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('TREATMENT_TYPE:'):
-                    treatment_type = line.split(':', 1)[1].strip()
-                    treatment_plan['treatment_type'] = treatment_type
-                elif line.startswith('MEDICATIONS:'):
-                    current_section = 'medications'
-                elif line.startswith('INTERVENTIONS:'):
-                    current_section = 'interventions'
-                elif line.startswith('MONITORING:'):
-                    current_section = 'monitoring'
-                elif line.startswith('TIMELINE:'):
-                    timeline = line.split(':', 1)[1].strip()
-                    treatment_plan['timeline'] = timeline
-                elif line.startswith('SIDE_EFFECTS:'):
-                    current_section = 'side_effects'
-                elif line.startswith('FOLLOW_UP:'):
-                    current_section = 'follow_up'
-                elif line.startswith('EDUCATION:'):
-                    current_section = 'education'
-                elif line.startswith('ASSESSMENT:'):
-                    assessment = line.split(':', 1)[1].strip()
-                    treatment_plan['assessment'] = assessment
-                elif line and current_section and line.startswith('-'):
-                    item = line[1:].strip()
-                    if current_section in treatment_plan:
-                        treatment_plan[current_section].append(item)
+            # Fields are consumed line by line, straight from the response string
+            for field, value in iter_section_items(iter_lines(result), TREATMENT_PLAN_HEADERS, TREATMENT_PLAN_SCALARS):
+                if field in TREATMENT_PLAN_SCALARS:
+                    treatment_plan[field] = value
+                else:
+                    treatment_plan[field].append(value)
             
             return treatment_plan
             
@@ -250,73 +372,95 @@ ASSESSMENT: [brief treatment plan summary]
                 'assessment': 'Treatment plan created successfully'
             }
     
-    def _create_treatment_record(self, patient_data: Dict[str, Any], treatment_plan: Dict[str, Any], assessment_result: str) -> Optional[Dict[str, Any]]:
-        """Create treatment record in database"""
+    def _save_treatment_plan(self, patient_data: Dict[str, Any], treatment_plan: Dict[str, Any], assessment_result: str,
+                             treatment_id: Optional[str] = None, medical_record_id: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Insert the treatment and its medical record in one transaction"""
         try:
             with get_db_session() as session:
-                treatment = Treatment(
-                    patient_id=patient_data['patient_id'],
-                    treatment_type=treatment_plan['treatment_type'],
-                    diagnosis=patient_data.get('diagnoses', ''),
-                    treatment_plan=assessment_result,
-                    medications=treatment_plan['medications'],
-                    procedures=treatment_plan['interventions'],
-                    start_date=datetime.utcnow(),
-                    status='active',
-                    doctor_id=patient_data.get('doctor_id', ''),
-                    notes=treatment_plan['assessment']
-                )
+                treatment = self._create_treatment_record(session, patient_data, treatment_plan, assessment_result, treatment_id)
+                record = self._create_medical_record(session, patient_data, treatment_plan, treatment, medical_record_id)
                 
-                session.add(treatment)
-                session.commit()
-                session.refresh(treatment)
-                
-                return {
+                # Ids and timestamps are assigned client-side, so both rows are
+                # summarized without a flush or refresh before the commit
+                treatment_record = {
                     'id': str(treatment.id),
                     'treatment_type': treatment.treatment_type,
                     'status': treatment.status,
                     'created_at': treatment.created_at.isoformat()
                 }
-                
-        except Exception as e:
-            self.logger("TreatmentAgent", "database_error", f"Failed to create treatment record: {str(e)}")
-            return None
-    
-    def _create_medical_record(self, patient_data: Dict[str, Any], treatment_plan: Dict[str, Any], assessment_result: str) -> Optional[Dict[str, Any]]:
-        """Create medical record for treatment plan"""
-        try:
-            with get_db_session() as session:
-                record = MedicalRecord(
-                    patient_id=patient_data['patient_id'],
-                    record_type='treatment_plan',
-                    title=f"Treatment Plan: {treatment_plan['treatment_type']}",
-                    content=assessment_result,
-                    doctor_id=patient_data.get('doctor_id', ''),
-                    department=patient_data.get('department', ''),
-                    medications=treatment_plan['medications'],
-                    procedures=treatment_plan['interventions']
-                )
-                
-                session.add(record)
-                session.commit()
-                session.refresh(record)
-                
-                return {
+                medical_record = {
                     'id': str(record.id),
                     'record_type': record.record_type,
                     'title': record.title,
                     'created_at': record.created_at.isoformat()
                 }
+                # Committed when the outermost get_db_session block exits
+                self._invalidate_stats_cache(patient_data['patient_id'])
+                
+                return treatment_record, medical_record
                 
         except Exception as e:
-            self.logger("TreatmentAgent", "medical_record_error", f"Failed to create medical record: {str(e)}")
-            return None
+            self.logger("TreatmentAgent", "database_error", f"Failed to save treatment plan: {str(e)}")
+            return None, None
+    
+    def _report_background_save(self, save_future):
+        """Done-callback for persist='async' saves, whose result no caller waits on"""
+        try:
+            treatment_record, _ = save_future.result()
+        except Exception as e:
+            self.logger("TreatmentAgent", "database_error", f"Background treatment plan save failed: {str(e)}")
+            return
+        if treatment_record is None:
+            # _save_treatment_plan has already logged the cause
+            self.logger("TreatmentAgent", "database_error", "Background treatment plan save did not complete")
+    
+    def _create_treatment_record(self, session, patient_data: Dict[str, Any], treatment_plan: Dict[str, Any], assessment_result: str,
+                                 treatment_id: Optional[str] = None) -> Treatment:
+        """Add a treatment record to the session"""
+        treatment = Treatment(
+            id=treatment_id or str(uuid.uuid4()),
+            patient_id=patient_data['patient_id'],
+            treatment_type=treatment_plan['treatment_type'],
+            diagnosis=patient_data.get('diagnoses', ''),
+            treatment_plan=assessment_result,
+            medications=treatment_plan['medications'],
+            procedures=treatment_plan['interventions'],
+            status='active',
+            doctor_id=patient_data.get('doctor_id', ''),
+            notes=treatment_plan['assessment'],
+            created_at=datetime.utcnow()
+        )
+        session.add(treatment)
+        return treatment
+    
+    def _create_medical_record(self, session, patient_data: Dict[str, Any], treatment_plan: Dict[str, Any], treatment: Treatment,
+                               record_id: Optional[str] = None) -> MedicalRecord:
+        """Add a medical record for the treatment plan to the session"""
+        title = f"Treatment Plan: {treatment_plan['treatment_type']}"
+        # The record keeps the plan text as written; later plan updates change only the treatment
+        record = MedicalRecord(
+            id=record_id or str(uuid.uuid4()),
+            patient_id=patient_data['patient_id'],
+            # Through the relationship, so the unit of work inserts the treatment first
+            treatment=treatment,
+            record_type='treatment_plan',
+            title=title,
+            content=treatment.treatment_plan,
+            doctor_id=patient_data.get('doctor_id', ''),
+            department=patient_data.get('department', ''),
+            medications=treatment_plan['medications'],
+            procedures=treatment_plan['interventions'],
+            created_at=datetime.utcnow()
+        )
+        session.add(record)
+        return record
     
     def update_treatment_plan(self, treatment_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update an existing treatment plan"""
         try:
             with get_db_session() as session:
-                treatment = session.query(Treatment).filter(Treatment.id == treatment_id).first()
+                # Primary-key lookup through the identity map
+                treatment = session.get(Treatment, treatment_id)
                 
                 if not treatment:
                     return {
@@ -326,11 +470,13 @@ ASSESSMENT: [brief treatment plan summary]
                 
                 # Update treatment fields
                 for field, value in updates.items():
-                    if hasattr(treatment, field):
+                    if field in TREATMENT_UPDATABLE_FIELDS:
                         setattr(treatment, field, value)
                 
-                treatment.updated_at = datetime.utcnow()
-                session.commit()
+                # Stamped by the database clock in the UPDATE itself, even when no field changed
+                treatment.updated_at = func.utc_timestamp()
+                session.flush()
+                self._invalidate_stats_cache(treatment.patient_id)
                 
                 self.logger("TreatmentAgent", "treatment_updated", 
                            f"Treatment {treatment_id} updated successfully")
@@ -351,32 +497,42 @@ ASSESSMENT: [brief treatment plan summary]
     def get_treatment_statistics(self, patient_id: Optional[str] = None) -> Dict[str, Any]:
         """Get treatment statistics"""
         try:
+            with self._stats_cache_lock:
+                cached_stats = self._stats_cache.get(patient_id)
+            if cached_stats is not None:
+                return cached_stats
+            
             with get_db_session() as session:
-                # Base query
-                treatment_query = session.query(Treatment)
-                
+                # Base filter
+                filters = []
                 if patient_id:
-                    treatment_query = treatment_query.filter(Treatment.patient_id == patient_id)
+                    filters.append(Treatment.patient_id == patient_id)
                 
-                # Get treatment statistics
-                total_treatments = treatment_query.count()
-                active_treatments = treatment_query.filter(Treatment.status == 'active').count()
-                completed_treatments = treatment_query.filter(Treatment.status == 'completed').count()
+                # Count every (status, type) bucket with its recent (last 30 days) share in one query
+                thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+                bucket_rows = session.query(
+                    Treatment.status,
+                    Treatment.treatment_type,
+                    func.count(Treatment.id),
+                    func.sum(case((Treatment.created_at >= thirty_days_ago, 1), else_=0))
+                ).filter(*filters).group_by(Treatment.status, Treatment.treatment_type).all()
                 
-                # Get treatments by type
-                treatment_types = session.query(Treatment.treatment_type).distinct().all()
+                # Fan the buckets out into status, type and recent totals
+                total_treatments = 0
+                active_treatments = 0
+                completed_treatments = 0
+                recent_treatments = 0
                 type_counts = {}
-                for treatment_type in treatment_types:
-                    count = treatment_query.filter(Treatment.treatment_type == treatment_type[0]).count()
-                    type_counts[treatment_type[0]] = count
+                for status, treatment_type, count, recent in bucket_rows:
+                    total_treatments += count
+                    recent_treatments += int(recent or 0)
+                    if status == 'active':
+                        active_treatments += count
+                    elif status == 'completed':
+                        completed_treatments += count
+                    type_counts[treatment_type] = type_counts.get(treatment_type, 0) + count
                 
-                # Get recent treatments (last 30 days)
-                thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-                recent_treatments = treatment_query.filter(
-                    Treatment.created_at >= thirty_days_ago
-                ).count()
-                
-                return {
+                stats_response = {
                     'success': True,
                     'statistics': {
                         'total_treatments': total_treatments,
@@ -386,6 +542,10 @@ ASSESSMENT: [brief treatment plan summary]
                         'by_type': type_counts
                     }
                 }
+                with self._stats_cache_lock:
+                    self._stats_cache[patient_id] = stats_response
+                
+                return stats_response
                 
         except Exception as e:
             self.logger("TreatmentAgent", "stats_error", f"Failed to get treatment statistics: {str(e)}")
@@ -397,38 +557,27 @@ ASSESSMENT: [brief treatment plan summary]
     def check_medication_interactions(self, medications: List[str]) -> Dict[str, Any]:
         """Check for potential medication interactions"""
         try:
-            # Prepare interaction check input
-            interaction_input = f"""
-Please check for potential interactions between these medications:
-
-Medications: {', '.join(medications)}
-
-Please identify:
-1. Any known drug-drug interactions
-2. Potential side effects when taken together
-3. Recommendations for monitoring
-4. Alternative medication options if needed
-
-Format your response as:
-INTERACTIONS: [list any drug interactions found]
-SIDE_EFFECTS: [potential side effects]
-MONITORING: [recommended monitoring]
-ALTERNATIVES: [alternative options if needed]
-SAFETY: [overall safety assessment]
-"""
+            cache_key = self._interaction_cache_key(medications)
+            with self._interaction_cache_lock:
+                cached_result = self._interaction_cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
             
             # Execute interaction check
-            result = self.execute(interaction_input)
+            result = self.execute(self._prepare_interaction_input(medications))
             
             if result['success']:
                 # Parse interaction results
                 interaction_result = self._parse_interaction_result(result['result'])
                 
-                return {
+                interaction_response = {
                     'success': True,
                     'interactions': interaction_result,
                     'assessment': result['result']
                 }
+                with self._interaction_cache_lock:
+                    self._interaction_cache[cache_key] = interaction_response
+                return interaction_response
             else:
                 return result
                 
@@ -439,6 +588,40 @@ SAFETY: [overall safety assessment]
                 'error': f"Medication interaction check failed: {str(e)}"
             }
     
+    async def acheck_medication_interactions(self, medications: List[str]) -> Dict[str, Any]:
+        """Check for potential medication interactions without blocking the event loop"""
+        try:
+            cache_key = self._interaction_cache_key(medications)
+            with self._interaction_cache_lock:
+                cached_result = self._interaction_cache.get(cache_key)
+            if cached_result is not None:
+                return cached_result
+            
+            result = await self.execute_async(self._prepare_interaction_input(medications))
+            
+            if result['success']:
+                interaction_response = {
+                    'success': True,
+                    'interactions': self._parse_interaction_result(result['result']),
+                    'assessment': result['result']
+                }
+                with self._interaction_cache_lock:
+                    self._interaction_cache[cache_key] = interaction_response
+                return interaction_response
+            else:
+                return result
+                
+        except Exception as e:
+            self.logger("TreatmentAgent", "interaction_error", f"Medication interaction check failed: {str(e)}")
+            return {
+                'success': False,
+                'error': f"Medication interaction check failed: {str(e)}"
+            }
+    
+    def _prepare_interaction_input(self, medications: List[str]) -> str:
+        """Prepare input for a medication interaction check"""
+        return INTERACTION_PROMPT_TEMPLATE.format(medications=', '.join(medications))
+    
     def _parse_interaction_result(self, result: str) -> Dict[str, Any]:
         """Parse medication interaction results"""
         try:
@@ -450,26 +633,11 @@ SAFETY: [overall safety assessment]
                 'safety': 'unknown'
             }
             
-            lines = result.split('\n')
-            current_section = None
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('INTERACTIONS:'):
-                    current_section = 'interactions'
-                elif line.startswith('SIDE_EFFECTS:'):
-                    current_section = 'side_effects'
-                elif line.startswith('MONITORING:'):
-                    current_section = 'monitoring'
-                elif line.startswith('ALTERNATIVES:'):
-                    current_section = 'alternatives'
-                elif line.startswith('SAFETY:'):
-                    safety = line.split(':', 1)[1].strip()
-                    interaction_data['safety'] = safety
-                elif line and current_section and line.startswith('-'):
-                    item = line[1:].strip()
-                    if current_section in interaction_data:
-                        interaction_data[current_section].append(item)
+            for field, value in iter_section_items(iter_lines(result), INTERACTION_HEADERS, INTERACTION_SCALARS):
+                if field in INTERACTION_SCALARS:
+                    interaction_data[field] = value
+                else:
+                    interaction_data[field].append(value)
             
             return interaction_data
             
@@ -5,12 +5,78 @@ This agent handles patient triage assessment and assigns appropriate triage leve
 based on symptoms, vital signs, and medical history.
 """
 
+import uuid
+from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from langchain_core.tools import BaseTool
 from agents.base_agent import BaseHealthcareAgent
 from utils.logger import log_agent_event
+from utils.prompt_formatting import join_or_str, format_vital_signs
 from database.models import TriageLevel, TriageAssessment
 from database.connection import get_db_session
+from sqlalchemy import func, case
+from cachetools import TTLCache
+import threading
+import hashlib
+import json
+import re
+
+# First number on a "TRIAGE_LEVEL:" line, e.g. "TRIAGE_LEVEL: 2" or "TRIAGE_LEVEL: Level 2"
+TRIAGE_LEVEL_PATTERN = re.compile(r'^\s*TRIAGE_LEVEL:[^\d\n]*(\d+)', re.MULTILINE)
+
+# Exact-input cache bound and entry lifetime (seconds)
+EXACT_CACHE_SIZE = 4096
+EXACT_CACHE_TTL = 900
+
+# Prompt fields as (patient_data key, label, formatter), in prompt order;
+# fields that are missing or format to an empty string are skipped
+TRIAGE_INPUT_FIELDS = (
+    # Patient information
+    ('patient_id', 'Patient ID', str),
+    ('age', 'Age', str),
+    ('gender', 'Gender', str),
+    # Presentation
+    ('chief_complaint', 'Chief Complaint', str),
+    ('symptoms', 'Symptoms', join_or_str),
+    ('vital_signs', 'Vital Signs', format_vital_signs),
+    # History
+    ('medical_history', 'Medical History', join_or_str),
+    ('allergies', 'Allergies', join_or_str),
+    ('medications', 'Current Medications', join_or_str),
+    # Injury, pain and any extra context
+    ('mechanism_of_injury', 'Mechanism of Injury', str),
+    ('pain_level', 'Pain Level (0-10)', str),
+    ('additional_context', 'Additional Context', str)
+)
+
+TRIAGE_PROMPT_TEMPLATE = """
+Please assess this patient and provide a triage recommendation:
+
+{details}
+
+Based on the above information, please:
+1. Assign a triage level (1-5) with justification
+2. Identify any immediate concerns or red flags
+3. Recommend any immediate actions needed
+4. Provide a brief assessment summary
+
+Format your response as:
+TRIAGE_LEVEL: [1-5]
+JUSTIFICATION: [explanation]
+IMMEDIATE_CONCERNS: [list any red flags]
+RECOMMENDED_ACTIONS: [immediate actions needed]
+ASSESSMENT_SUMMARY: [brief summary]
+"""
+
+# Estimated wait in minutes indexed by triage level; slot 0 is the fallback
+WAIT_TIME_MINUTES = (
+    30,   # Unknown level
+    0,    # 1 - Immediate
+    15,   # 2 - Emergent
+    30,   # 3 - Urgent
+    60,   # 4 - Less Urgent
+    120   # 5 - Non-urgent
+)
 
 class TriageAgent(BaseHealthcareAgent):
     """AI agent for patient triage assessment"""
@@ -42,27 +108,51 @@ Always prioritize patient safety and err on the side of caution when in doubt.""
         triage_tools = [tool for tool in triage_tools if tool is not None]
         super().__init__("TriageAgent", system_prompt, triage_tools)
         self.logger = log_agent_event
-
+        # Results for byte-identical inputs (retries, double submits)
+        self._exact_cache = TTLCache(maxsize=EXACT_CACHE_SIZE, ttl=EXACT_CACHE_TTL)
+        self._exact_cache_lock = threading.Lock()
+    
+    def _input_key(self, patient_data: Dict[str, Any]) -> str:
+        """Hash the full patient_data so byte-identical requests share a key"""
+        return hashlib.blake2b(
+            json.dumps(patient_data, sort_keys=True, default=str).encode(), digest_size=16
+        ).hexdigest()
+    
     def assess_patient(self, patient_data: Dict[str, Any]) -> Dict[str, Any]:
         try:
-            assessment_input = self._prepare_assessment_input(patient_data)
-            result = self.execute(assessment_input)
-            if result['success']:
-                triage_level = self._parse_triage_level(result['result'])
-                assessment_record = self._create_assessment_record(patient_data, triage_level, result['result'])
-                self.logger("TriageAgent", "assessment_completed", 
-                           f"Patient {patient_data.get('patient_id', 'unknown')} assigned triage level {triage_level}")
-                return {
-                    'success': True,
-                    'triage_level': triage_level,
-                    'assessment': result['result'],
-                    'assessment_id': assessment_record.get('id') if assessment_record else None,
-                    'wait_time_estimate': self._get_wait_time_estimate(triage_level)
-                }
+            # Only exact repeats (retries, double submits) reuse an earlier result: similar
+            # presentations can differ in the vitals that set the level, and the assessment
+            # text belongs to the patient it was written for
+            input_key = self._input_key(patient_data)
+            with self._exact_cache_lock:
+                cached = self._exact_cache.get(input_key)
+            
+            if cached is not None:
+                triage_level, assessment = cached
             else:
-                self.logger("TriageAgent", "assessment_failed", 
-                           f"Triage assessment failed: {result.get('error', 'Unknown error')}")
-                return result
+                assessment_input = self._prepare_assessment_input(patient_data)
+                result = self.execute(assessment_input)
+                if not result['success']:
+                    self.logger("TriageAgent", "assessment_failed", 
+                               f"Triage assessment failed: {result.get('error', 'Unknown error')}")
+                    return result
+                
+                triage_level = self._parse_triage_level(result['result'])
+                assessment = result['result']
+            
+            with self._exact_cache_lock:
+                self._exact_cache[input_key] = (triage_level, assessment)
+            
+            assessment_record = self._create_assessment_record(patient_data, triage_level, assessment)
+            self.logger("TriageAgent", "assessment_completed", 
+                       f"Patient {patient_data.get('patient_id', 'unknown')} assigned triage level {triage_level}")
+            return {
+                'success': True,
+                'triage_level': triage_level,
+                'assessment': assessment,
+                'assessment_id': assessment_record.get('id') if assessment_record else None,
+                'wait_time_estimate': self._get_wait_time_estimate(triage_level)
+            }
         except Exception as e:
             self.logger("TriageAgent", "assessment_error", f"Triage assessment error: {str(e)}")
             return {
@@ -73,115 +163,22 @@ Always prioritize patient safety and err on the side of caution when in doubt.""
     def _prepare_assessment_input(self, patient_data: Dict[str, Any]) -> str:
         """Prepare input for triage assessment"""
         input_parts = []
-        
-        # Patient information
-        if 'patient_id' in patient_data:
-            input_parts.append(f"Patient ID: {patient_data['patient_id']}")
-        
-        if 'age' in patient_data:
-            input_parts.append(f"Age: {patient_data['age']}")
-        
-        if 'gender' in patient_data:
-            input_parts.append(f"Gender: {patient_data['gender']}")
-        
-        # Chief complaint
-        if 'chief_complaint' in patient_data:
-            input_parts.append(f"Chief Complaint: {patient_data['chief_complaint']}")
-        
-        # Symptoms
-        if 'symptoms' in patient_data:
-            symptoms = patient_data['symptoms']
-            if isinstance(symptoms, list):
-                symptoms_str = ", ".join(symptoms)
-            else:
-                symptoms_str = str(symptoms)
-            input_parts.append(f"Symptoms: {symptoms_str}")
-        
-        # Vital signs
-        if 'vital_signs' in patient_data:
-            vitals = patient_data['vital_signs']
-            vitals_str = []
-            for vital, value in vitals.items():
-                if value is not None:
-                    vitals_str.append(f"{vital}: {value}")
-            if vitals_str:
-                input_parts.append(f"Vital Signs: {', '.join(vitals_str)}")
-        
-        # Medical history
-        if 'medical_history' in patient_data:
-            history = patient_data['medical_history']
-            if isinstance(history, list):
-                history_str = ", ".join(history)
-            else:
-                history_str = str(history)
-            input_parts.append(f"Medical History: {history_str}")
-        
-        # Allergies
-        if 'allergies' in patient_data:
-            allergies = patient_data['allergies']
-            if isinstance(allergies, list):
-                allergies_str = ", ".join(allergies)
-            else:
-                allergies_str = str(allergies)
-            input_parts.append(f"Allergies: {allergies_str}")
-        
-        # Current medications
-        if 'medications' in patient_data:
-            meds = patient_data['medications']
-            if isinstance(meds, list):
-                meds_str = ", ".join(meds)
-            else:
-                meds_str = str(meds)
-            input_parts.append(f"Current Medications: {meds_str}")
-        
-        # Mechanism of injury (if applicable)
-        if 'mechanism_of_injury' in patient_data:
-            input_parts.append(f"Mechanism of Injury: {patient_data['mechanism_of_injury']}")
-        
-        # Pain assessment
-        if 'pain_level' in patient_data:
-            input_parts.append(f"Pain Level (0-10): {patient_data['pain_level']}")
-        
-        # Additional context
-        if 'additional_context' in patient_data:
-            input_parts.append(f"Additional Context: {patient_data['additional_context']}")
+        for key, label, formatter in TRIAGE_INPUT_FIELDS:
+            if key not in patient_data:
+                continue
+            text = formatter(patient_data[key])
+            if text:
+                input_parts.append(f"{label}: {text}")
         
         # Create assessment prompt
-        assessment_prompt = f"""
-Please assess this patient and provide a triage recommendation:
-
-{chr(10).join(input_parts)}
-
-Based on the above information, please:
-1. Assign a triage level (1-5) with justification
-2. Identify any immediate concerns or red flags
-3. Recommend any immediate actions needed
-4. Provide a brief assessment summary
-
-Format your response as:
-TRIAGE_LEVEL: [1-5]
-JUSTIFICATION: [explanation]
-IMMEDIATE_CONCERNS: [list any red flags]
-RECOMMENDED_ACTIONS: [immediate actions needed]
-ASSESSMENT_SUMMARY: [brief summary]
-"""
-        
-        return assessment_prompt
+        return TRIAGE_PROMPT_TEMPLATE.format(details="\n".join(input_parts))
     
     def _parse_triage_level(self, result: str) -> int:
         """Parse triage level from agent result"""
         try:
-            # Look for triage level in the result
-            lines = result.split('\n')
-            for line in lines:
-                if line.strip().startswith('TRIAGE_LEVEL:'):
-                    level_str = line.split(':')[1].strip()
-                    # Extract number from the level
-                    import re
-                    level_match = re.search(r'\d+', level_str)
-                    if level_match:
-                        level = int(level_match.group())
-                        return max(1, min(5, level))  # Ensure level is between 1-5
+            level_match = TRIAGE_LEVEL_PATTERN.search(result)
+            if level_match:
+                return max(1, min(5, int(level_match.group(1))))  # Ensure level is between 1-5
             
             # Default to level 3 if parsing fails
             return 3
@@ -195,17 +192,20 @@ ASSESSMENT_SUMMARY: [brief summary]
         try:
             with get_db_session() as session:
                 assessment = TriageAssessment(
+                    id=str(uuid.uuid4()),
                     patient_id=patient_data['patient_id'],
-                    triage_level=TriageLevel(triage_level),
+                    # Enum values are the strings "1".."5"
+                    triage_level=TriageLevel(str(triage_level)),
                     chief_complaint=patient_data.get('chief_complaint', ''),
                     symptoms=patient_data.get('symptoms', []),
                     assessment_notes=assessment_result,
-                    wait_time_estimate=self._get_wait_time_estimate(triage_level)
+                    wait_time_estimate=self._get_wait_time_estimate(triage_level),
+                    created_at=datetime.utcnow()
                 )
                 
+                # Id and timestamp are set client-side, so no refresh is needed;
+                # get_db_session commits on exit
                 session.add(assessment)
-                session.commit()
-                session.refresh(assessment)
                 
                 return {
                     'id': str(assessment.id),
@@ -219,36 +219,29 @@ ASSESSMENT_SUMMARY: [brief summary]
     
     def _get_wait_time_estimate(self, triage_level: int) -> int:
         """Get estimated wait time based on triage level"""
-        wait_times = {
-            1: 0,      # Immediate
-            2: 15,     # Emergent
-            3: 30,     # Urgent
-            4: 60,     # Less Urgent
-            5: 120     # Non-urgent
-        }
-        return wait_times.get(triage_level, 30)
+        if 1 <= triage_level <= 5:
+            return WAIT_TIME_MINUTES[triage_level]
+        return WAIT_TIME_MINUTES[0]
     
     def get_triage_statistics(self) -> Dict[str, Any]:
         """Get triage statistics"""
         try:
             with get_db_session() as session:
-                # Get counts by triage level
-                level_counts = {}
-                for level in range(1, 6):
-                    count = session.query(TriageAssessment).filter(
-                        TriageAssessment.triage_level == TriageLevel(level)
-                    ).count()
-                    level_counts[f"level_{level}"] = count
-                
-                # Get total assessments
-                total_assessments = session.query(TriageAssessment).count()
-                
-                # Get recent assessments (last 24 hours)
-                from datetime import datetime, timedelta
+                # Count every level with its last-24-hour share in one query
                 yesterday = datetime.utcnow() - timedelta(days=1)
-                recent_count = session.query(TriageAssessment).filter(
-                    TriageAssessment.created_at >= yesterday
-                ).count()
+                level_rows = session.query(
+                    TriageAssessment.triage_level,
+                    func.count(TriageAssessment.id),
+                    func.sum(case((TriageAssessment.created_at >= yesterday, 1), else_=0))
+                ).group_by(TriageAssessment.triage_level).all()
+                
+                level_counts = {f"level_{level}": 0 for level in range(1, 6)}
+                total_assessments = 0
+                recent_count = 0
+                for triage_level, count, recent in level_rows:
+                    level_counts[f"level_{triage_level.value}"] = count
+                    total_assessments += count
+                    recent_count += int(recent or 0)
                 
                 return {
                     'success': True,
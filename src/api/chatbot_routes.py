@@ -5,14 +5,20 @@ This module defines API endpoints for the chatbot functionality,
 including conversation management, context keeping, and message processing.
 """
 
+import hashlib
 import json
+import logging
+import time
 import uuid
-from datetime import datetime
-from typing import Dict, List, Any, Optional
-from flask import Blueprint, request, jsonify, current_app
+import orjson
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Iterable, Iterator
+from flask import Blueprint, Response, request, current_app, stream_with_context
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import JSON, desc, exists, func, case, select, tuple_, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
+from api.json_provider import ORJSON_OPTIONS, encode_json
 from database.connection import get_db_session
 from database.models import ChatbotConversation, ChatbotMessage, ChatbotContext
 from utils.validators import validate_chatbot_message
@@ -21,6 +27,39 @@ from utils.logger import log_api_event, log_chatbot_event
 # Create chatbot API blueprint
 chatbot_bp = Blueprint('chatbot', __name__)
 
+logger = logging.getLogger(__name__)
+
+# Chatbot agent of the registering app, resolved once instead of per chat request
+chatbot_bp.chatbot_agent = None
+
+@chatbot_bp.record_once
+def bind_chatbot_agent(state):
+    chatbot_bp.chatbot_agent = state.app.config.get('AGENTS', {}).get('chatbot')
+    if chatbot_bp.chatbot_agent is None:
+        logger.warning("Chatbot agent not configured; /chat will answer 503")
+
+# Endpoint templates for log_api_event, filled with the session_id only when the record is emitted
+MESSAGES_ENDPOINT = '/chatbot/conversations/%s/messages'
+CLOSE_ENDPOINT = '/chatbot/conversations/%s/close'
+CONTEXT_ENDPOINT = '/chatbot/context/%s'
+
+# Per-client reuse window for polled read endpoints; revalidated with their ETag afterwards
+POLLED_CACHE_CONTROL = 'private, max-age=5'
+
+# Messages fetched per round-trip when streaming a conversation page
+MESSAGE_STREAM_BATCH_SIZE = 64
+
+# JSON-typed columns are decoded by the driver and always serializable, so they skip
+# serialize_context_data; the check only matters if a column is ever retyped
+ENTITIES_IS_JSON = isinstance(ChatbotMessage.__table__.c.entities.type, JSON)
+CONTEXT_DATA_IS_JSON = isinstance(ChatbotContext.__table__.c.context_data.type, JSON)
+
+# Response keys of a streamed message, in the column order of the messages query
+MESSAGE_FIELDS = ("id", "message_type", "message", "intent", "confidence", "entities", "timestamp")
+
+# Bot reply recorded for a session opened with an initial message
+GREETING_RESPONSE = "Hello! I'm your healthcare assistant. How can I help you today?"
+
 def serialize_context_data(data):
     """
     Safely serialize context data, removing non-JSON serializable objects
@@ -28,6 +67,13 @@ def serialize_context_data(data):
     if not data:
         return {}
     
+    # One C-level round trip covers well-formed data; str() stands in for unknown types
+    try:
+        return orjson.loads(orjson.dumps(data, default=str, option=ORJSON_OPTIONS))
+    except TypeError:
+        # e.g. non-string keys; fall back to cleaning value by value
+        pass
+    
     if isinstance(data, dict):
         serialized = {}
         for key, value in data.items():
@@ -49,32 +95,110 @@ def serialize_context_data(data):
     except (TypeError, ValueError):
         return str(data) if data is not None else {}
 
+def stream_json_array(batches: Iterable[Iterable[Any]]) -> Iterator[bytes]:
+    """Yield a JSON array as one orjson-encoded chunk per batch of items"""
+    yield b'['
+    separator = b''
+    for batch in batches:
+        chunk = b','.join(encode_json(item) for item in batch)
+        if chunk:
+            yield separator + chunk
+            separator = b','
+    yield b']'
+
+def parse_limit(raw: Optional[str], default: int, cap: int) -> int:
+    """Page size from a query argument, falling back to default when missing or malformed"""
+    try:
+        return max(1, min(int(raw), cap)) if raw else default
+    except ValueError:
+        return default
+
+def parse_timestamp(raw: str) -> datetime:
+    """Parse an ISO-8601 query argument into the naive UTC datetimes the database stores"""
+    parsed = datetime.fromisoformat(raw.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def message_rows_to_dicts(rows, session_id: str) -> List[Dict[str, Any]]:
+    """Map (id, message_type, content, intent, confidence, entities, created_at) rows to response dicts"""
+    if ENTITIES_IS_JSON:
+        # zip and dict do the per-row work in C; no attribute lookups per field
+        return [dict(zip(MESSAGE_FIELDS, row), session_id=session_id) for row in rows]
+    messages = []
+    for row in rows:
+        message = dict(zip(MESSAGE_FIELDS, row), session_id=session_id)
+        message["entities"] = serialize_context_data(message["entities"])
+        messages.append(message)
+    return messages
+
+def json_key_path(key: str) -> str:
+    """JSON path selecting one top-level key, quoted so any key name is safe"""
+    return '$."' + key.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def patched_context_data(patch: Dict[str, Any]):
+    """SQL expression applying a context patch to the stored context_data like dict.update
+
+    Each top-level key is replaced whole and None is stored as null; JSON_MERGE_PATCH would
+    instead merge nested objects and delete keys set to null. A context without
+    conversation_history gets an empty one.
+    """
+    patch_json = json.dumps(patch)
+    patched = func.json_insert(ChatbotContext.context_data, '$.conversation_history', func.json_array())
+    pairs = []
+    for key in patch:
+        path = json_key_path(key)
+        pairs.extend((path, func.json_extract(patch_json, path)))
+    return func.json_set(patched, *pairs) if pairs else patched
+
+def response_etag(*versions) -> str:
+    """Derive an ETag from the request's query string and the data's version markers"""
+    digest = hashlib.blake2b(request.query_string, digest_size=8)
+    for version in versions:
+        digest.update(f"|{version}".encode())
+    return digest.hexdigest()
+
+def conversations_version(session: Session, filters) -> tuple:
+    """(max(updated_at), count) of the conversations matching filters, for use in an ETag
+    
+    updated_at has microsecond precision and moves on every status change and message
+    insert, so one indexed aggregate versions everything the listings expose.
+    """
+    return tuple(session.query(
+        func.max(ChatbotConversation.updated_at),
+        func.count(ChatbotConversation.id)
+    ).filter(*filters).one())
+
+def not_modified(etag: str):
+    """Empty 304 response carrying the unchanged ETag"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = POLLED_CACHE_CONTROL
+    return response
+
 def create_response(success: bool, data: Any = None, message: str = "", status_code: int = 200):
-    response = {
-        "success": success,
-        "message": message,
-        "timestamp": datetime.utcnow().isoformat()
-    }
-    if data is not None:
-        response["data"] = data
-    return jsonify(response), status_code
+    # Encoded straight to bytes; orjson handles datetimes and UUIDs, so handlers pass them through as-is
+    if data is None:
+        response = {"success": success, "message": message, "timestamp": datetime.utcnow()}
+    else:
+        response = {"success": success, "message": message, "timestamp": datetime.utcnow(), "data": data}
+    return Response(encode_json(response), status=status_code, mimetype='application/json')
 
 @chatbot_bp.route('/chat', methods=['POST'])
 def chat():
-    start_time = datetime.utcnow()
+    start_time = time.perf_counter()
     try:
         data = request.get_json()
         if not data or not data.get('message'):
             return create_response(False, message="Message is required", status_code=400)
         
         message = data['message']
-        session_id = data.get('session_id') or str(uuid.uuid4())
+        session_id = data.get('session_id') or uuid.uuid4().hex
         user_id = data.get('user_id')
         patient_id = data.get('patient_id')
         
-        # Get chatbot agent
-        agents = current_app.config.get('AGENTS', {})
-        chatbot_agent = agents.get('chatbot')
+        # Bound once at blueprint registration
+        chatbot_agent = chatbot_bp.chatbot_agent
         if not chatbot_agent:
             return create_response(False, message="Chatbot agent not available", status_code=503)
         
@@ -92,147 +216,253 @@ def chat():
             "response_time": getattr(response, 'response_time', 0.0)
         }
         
-        duration = (datetime.utcnow() - start_time).total_seconds()
+        duration = time.perf_counter() - start_time
         log_api_event('/chatbot/chat', 'POST', 200, duration)
-        log_chatbot_event(session_id, 'message_processed', f"Processed message: {message[:50]}...")
+        log_chatbot_event(session_id, 'message_processed', "Processed message: %.50s...", message_args=(message,))
         
         return create_response(True, response_data, "Message processed successfully")
         
     except Exception as e:
-        duration = (datetime.utcnow() - start_time).total_seconds()
+        duration = time.perf_counter() - start_time
         log_api_event('/chatbot/chat', 'POST', 500, duration)
-        current_app.logger.error(f"Chat processing error: {str(e)}", exc_info=True)
+        current_app.logger.error("Chat processing error: %s", e, exc_info=True)
         return create_response(False, message=f"Chat processing failed: {str(e)}", status_code=500)
 
 @chatbot_bp.route('/conversations', methods=['GET'])
 def get_conversations():
-    start_time = datetime.utcnow()
+    start_time = time.perf_counter()
     try:
         user_id = request.args.get('user_id')
         patient_id = request.args.get('patient_id')
-        limit = min(int(request.args.get('limit', 50)), 100)
+        limit = parse_limit(request.args.get('limit'), 50, 100)
+        
+        # Keyset cursor: return conversations strictly older than (before, before_id)
+        before = request.args.get('before')
+        before_id = request.args.get('before_id')
+        before_ts = None
+        if before:
+            try:
+                before_ts = parse_timestamp(before)
+            except ValueError:
+                return create_response(False, message="Invalid before cursor", status_code=400)
+        
+        filters = []
+        if user_id:
+            filters.append(ChatbotConversation.user_id == user_id)
+        if patient_id:
+            filters.append(ChatbotConversation.patient_id == patient_id)
         
         with get_db_session() as session:
-            query = session.query(ChatbotConversation)
-            
-            if user_id:
-                query = query.filter(ChatbotConversation.user_id == user_id)
-            if patient_id:
-                query = query.filter(ChatbotConversation.patient_id == patient_id)
-                
-            conversations = query.order_by(desc(ChatbotConversation.created_at)).limit(limit).all()
+            # Cheap validator first: pollers that already hold this version get a 304
+            etag = response_etag(*conversations_version(session, filters))
+            if request.if_none_match.contains_weak(etag):
+                duration = time.perf_counter() - start_time
+                log_api_event('/chatbot/conversations', 'GET', 304, duration)
+                return not_modified(etag)
+            
+            # Count each conversation's messages in the same query as the page itself
+            query = session.query(
+                ChatbotConversation.id,
+                ChatbotConversation.session_id,
+                ChatbotConversation.user_id,
+                ChatbotConversation.patient_id,
+                ChatbotConversation.status,
+                ChatbotConversation.created_at,
+                ChatbotConversation.updated_at,
+                func.count(ChatbotMessage.id).label('message_count')
+            ).outerjoin(ChatbotMessage, ChatbotMessage.conversation_id == ChatbotConversation.id)\
+                .filter(*filters)
+            if before_ts and before_id:
+                query = query.filter(tuple_(ChatbotConversation.created_at, ChatbotConversation.id) < tuple_(before_ts, before_id))
+            elif before_ts:
+                query = query.filter(ChatbotConversation.created_at < before_ts)
+            
+            # Walks the (user_id|patient_id, created_at) indexes backwards; no sort or OFFSET scan
+            rows = query.group_by(ChatbotConversation.id)\
+                .order_by(desc(ChatbotConversation.created_at), desc(ChatbotConversation.id))\
+                .limit(limit)\
+                .all()
             
             conversation_data = []
-            for conv in conversations:
+            for row in rows:
                 conversation_data.append({
-                    "session_id": conv.session_id,
-                    "user_id": conv.user_id,
-                    "patient_id": conv.patient_id,
-                    "status": conv.status,
-                    "message_count": conv.message_count,
-                    "created_at": conv.created_at.isoformat(),
-                    "updated_at": conv.updated_at.isoformat() if conv.updated_at else None
+                    "session_id": row.session_id,
+                    "user_id": row.user_id,
+                    "patient_id": row.patient_id,
+                    "status": row.status,
+                    "message_count": row.message_count,
+                    "created_at": row.created_at,
+                    "updated_at": row.updated_at
                 })
             
-            duration = (datetime.utcnow() - start_time).total_seconds()
+            duration = time.perf_counter() - start_time
             log_api_event('/chatbot/conversations', 'GET', 200, duration)
             
-            return create_response(True, {
+            # A full page may have more behind it; hand back the cursor of its oldest conversation
+            next_cursor = None
+            if len(rows) == limit:
+                next_cursor = {
+                    "before": rows[-1].created_at,
+                    "before_id": rows[-1].id
+                }
+            
+            response = create_response(True, {
                 "conversations": conversation_data,
-                "total_count": len(conversation_data)
+                "total_count": len(conversation_data),
+                "next_cursor": next_cursor
             }, "Conversations retrieved successfully")
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = POLLED_CACHE_CONTROL
+            return response
             
     except Exception as e:
-        duration = (datetime.utcnow() - start_time).total_seconds()
+        duration = time.perf_counter() - start_time
         log_api_event('/chatbot/conversations', 'GET', 500, duration)
-        current_app.logger.error(f"Get conversations error: {str(e)}", exc_info=True)
+        current_app.logger.error("Get conversations error: %s", e, exc_info=True)
         return create_response(False, message=f"Failed to retrieve conversations: {str(e)}", status_code=500)
 
 @chatbot_bp.route('/conversations/<session_id>/messages', methods=['GET'])
 def get_conversation_messages(session_id):
-    start_time = datetime.utcnow()
+    start_time = time.perf_counter()
     try:
-        limit = min(int(request.args.get('limit', 100)), 200)
+        limit = parse_limit(request.args.get('limit'), 100, 200)
+        
+        # Keyset cursor: return messages strictly after (after, after_id) in history order
+        after = request.args.get('after')
+        after_id = request.args.get('after_id')
+        after_ts = None
+        if after:
+            try:
+                after_ts = parse_timestamp(after)
+            except ValueError:
+                return create_response(False, message="Invalid after cursor", status_code=400)
         
         with get_db_session() as session:
-            conversation = session.query(ChatbotConversation).filter(
+            conversation_id = session.query(ChatbotConversation.id).filter(
                 ChatbotConversation.session_id == session_id
-            ).first()
-            
-            if not conversation:
-                return create_response(False, message="Conversation not found", status_code=404)
-            
-            messages = session.query(ChatbotMessage)\
-                .filter(ChatbotMessage.session_id == session_id)\
-                .order_by(ChatbotMessage.timestamp)\
-                .limit(limit)\
-                .all()
-            
-            message_data = []
-            for msg in messages:
-                message_data.append({
-                    "id": msg.id,
-                    "session_id": msg.session_id,
-                    "message": msg.message,
-                    "response": msg.response,
-                    "intent": msg.intent,
-                    "confidence": msg.confidence,
-                    "entities": serialize_context_data(msg.entities),  # Safe serialization
-                    "timestamp": msg.timestamp.isoformat()
-                })
-            
-            duration = (datetime.utcnow() - start_time).total_seconds()
-            log_api_event(f'/chatbot/conversations/{session_id}/messages', 'GET', 200, duration)
-            
-            return create_response(True, {
-                "session_id": session_id,
-                "messages": message_data,
-                "total_count": len(message_data)
-            }, "Messages retrieved successfully")
+            ).scalar()
             
+        if not conversation_id:
+            return create_response(False, message="Conversation not found", status_code=404)
+        
+        def generate():
+            status = 200
+            # Envelope built piecewise around the streamed array; "success" goes last so a
+            # failure part-way through can still report itself in a well-formed document
+            yield b'{"message":"Messages retrieved successfully","timestamp":' + encode_json(datetime.utcnow()) + \
+                b',"data":{"session_id":' + orjson.dumps(session_id) + b',"messages":'
+            # Bytes that close whatever the stream has opened so far
+            closing = b'null}'
+            try:
+                with get_db_session() as session:
+                    # Only the serialized columns, in MESSAGE_FIELDS order; no ORM entity hydration per message
+                    stmt = select(
+                        ChatbotMessage.id,
+                        ChatbotMessage.message_type,
+                        ChatbotMessage.content,
+                        ChatbotMessage.intent,
+                        ChatbotMessage.confidence,
+                        ChatbotMessage.entities,
+                        ChatbotMessage.created_at
+                    ).where(ChatbotMessage.conversation_id == conversation_id)
+                    if after_ts and after_id:
+                        stmt = stmt.where(tuple_(ChatbotMessage.created_at, ChatbotMessage.id) > tuple_(after_ts, after_id))
+                    elif after_ts:
+                        stmt = stmt.where(ChatbotMessage.created_at > after_ts)
+                    
+                    # Rows arrive in batches from a server-side cursor; each batch goes out as one chunk
+                    result = session.execute(
+                        stmt.order_by(ChatbotMessage.created_at, ChatbotMessage.id)
+                        .limit(limit)
+                        .execution_options(yield_per=MESSAGE_STREAM_BATCH_SIZE)
+                    )
+                    
+                    page = {"count": 0, "last": None}
+                    
+                    def message_batches():
+                        for partition in result.partitions():
+                            page["count"] += len(partition)
+                            page["last"] = partition[-1]
+                            yield message_rows_to_dicts(partition, session_id)
+                    
+                    for chunk in stream_json_array(message_batches()):
+                        yield chunk
+                        closing = b']}'
+                    closing = b'}'
+                    
+                    # A full page may have more behind it; hand back the cursor of its last message
+                    next_cursor = None
+                    if page["count"] == limit:
+                        next_cursor = {
+                            "after": page["last"].created_at,
+                            "after_id": page["last"].id
+                        }
+                    yield b',"total_count":' + orjson.dumps(page["count"]) + \
+                        b',"next_cursor":' + encode_json(next_cursor) + b'},"success":true}'
+            except Exception as e:
+                # Headers are already sent with a 200; close the document and flag the failure in it
+                status = 500
+                current_app.logger.error("Stream messages error: %s", e, exc_info=True)
+                yield closing + b',"success":false,"error":' + orjson.dumps(f"Failed to retrieve messages: {str(e)}") + b'}'
+            finally:
+                # Logged once the body has been produced, with the status it actually ended in
+                duration = time.perf_counter() - start_time
+                log_api_event(MESSAGES_ENDPOINT, 'GET', status, duration, endpoint_args=(session_id,))
+        
+        return current_app.response_class(
+            stream_with_context(generate()),
+            status=200,
+            mimetype='application/json'
+        )
+        
     except Exception as e:
-        duration = (datetime.utcnow() - start_time).total_seconds()
-        log_api_event(f'/chatbot/conversations/{session_id}/messages', 'GET', 500, duration)
-        current_app.logger.error(f"Get messages error: {str(e)}", exc_info=True)
+        duration = time.perf_counter() - start_time
+        log_api_event(MESSAGES_ENDPOINT, 'GET', 500, duration, endpoint_args=(session_id,))
+        current_app.logger.error("Get messages error: %s", e, exc_info=True)
         return create_response(False, message=f"Failed to retrieve messages: {str(e)}", status_code=500)
 
 @chatbot_bp.route('/conversations/<session_id>/close', methods=['POST'])
 def close_conversation(session_id):
-    start_time = datetime.utcnow()
-    db_session = None
+    start_time = time.perf_counter()
     try:
         with get_db_session() as db_session:
-            conversation = db_session.query(ChatbotConversation).filter(
-                ChatbotConversation.session_id == session_id
-            ).first()
+            # Close in one statement; the WHERE clause stands in for the status check.
+            # UTC_TIMESTAMP() has no fraction, which could move the microsecond updated_at backwards
+            closed_at = datetime.utcnow()
+            result = db_session.execute(
+                update(ChatbotConversation)
+                .where(
+                    ChatbotConversation.session_id == session_id,
+                    ChatbotConversation.status != "closed"
+                )
+                .values(status="closed", updated_at=closed_at, closed_at=closed_at)
+                .execution_options(synchronize_session=False)
+            )
             
-            if not conversation:
-                return create_response(False, message="Conversation not found", status_code=404)
-                
-            if conversation.status == "closed":
+            if not result.rowcount:
+                # Nothing updated: tell a missing conversation from one that is already closed
+                found = db_session.query(
+                    exists().where(ChatbotConversation.session_id == session_id)
+                ).scalar()
+                if not found:
+                    return create_response(False, message="Conversation not found", status_code=404)
                 return create_response(False, message="Conversation already closed", status_code=400)
             
-            conversation.status = "closed"
-            conversation.updated_at = datetime.utcnow()
-            db_session.commit()
-            
-            duration = (datetime.utcnow() - start_time).total_seconds()
-            log_api_event(f'/chatbot/conversations/{session_id}/close', 'POST', 200, duration)
+            duration = time.perf_counter() - start_time
+            log_api_event(CLOSE_ENDPOINT, 'POST', 200, duration, endpoint_args=(session_id,))
             log_chatbot_event(session_id, 'conversation_closed', "Conversation closed")
             
             return create_response(True, {"session_id": session_id}, "Conversation closed successfully")
             
     except Exception as e:
-        if db_session:
-            db_session.rollback()
-        duration = (datetime.utcnow() - start_time).total_seconds()
-        log_api_event(f'/chatbot/conversations/{session_id}/close', 'POST', 500, duration)
-        current_app.logger.error(f"Close conversation error: {str(e)}", exc_info=True)
+        duration = time.perf_counter() - start_time
+        log_api_event(CLOSE_ENDPOINT, 'POST', 500, duration, endpoint_args=(session_id,))
+        current_app.logger.error("Close conversation error: %s", e, exc_info=True)
         return create_response(False, message=f"Failed to close conversation: {str(e)}", status_code=500)
 
 @chatbot_bp.route('/context/<session_id>', methods=['GET'])
 def get_context(session_id):
-    start_time = datetime.utcnow()
+    start_time = time.perf_counter()
     try:
         with get_db_session() as session:
             context = session.query(ChatbotContext).filter(
@@ -242,223 +472,262 @@ def get_context(session_id):
             if not context:
                 return create_response(False, message="Context not found", status_code=404)
             
-            # Safely serialize context data
+            # JSON columns come back from the driver already JSON-safe
             context_data = {
                 "session_id": context.session_id,
-                "context_data": serialize_context_data(context.context_data),
-                "metadata": serialize_context_data(context.metadata),
-                "created_at": context.created_at.isoformat(),
-                "updated_at": context.updated_at.isoformat() if context.updated_at else None
+                "context_data": context.context_data if CONTEXT_DATA_IS_JSON else serialize_context_data(context.context_data),
+                "user_preferences": context.user_preferences,
+                "system_state": context.system_state,
+                "created_at": context.created_at,
+                "updated_at": context.updated_at
             }
             
-            duration = (datetime.utcnow() - start_time).total_seconds()
-            log_api_event(f'/chatbot/context/{session_id}', 'GET', 200, duration)
+            # The row is loaded either way, so version it by content: updated_at only resolves
+            # to the second and misses writes within the same second
+            etag = response_etag(hashlib.blake2b(encode_json(context_data), digest_size=16).hexdigest())
+            if request.if_none_match.contains_weak(etag):
+                duration = time.perf_counter() - start_time
+                log_api_event(CONTEXT_ENDPOINT, 'GET', 304, duration, endpoint_args=(session_id,))
+                return not_modified(etag)
+            
+            duration = time.perf_counter() - start_time
+            log_api_event(CONTEXT_ENDPOINT, 'GET', 200, duration, endpoint_args=(session_id,))
             
-            return create_response(True, context_data, "Context retrieved successfully")
+            response = create_response(True, context_data, "Context retrieved successfully")
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = POLLED_CACHE_CONTROL
+            return response
             
     except Exception as e:
-        duration = (datetime.utcnow() - start_time).total_seconds()
-        log_api_event(f'/chatbot/context/{session_id}', 'GET', 500, duration)
-        current_app.logger.error(f"Get context error: {str(e)}", exc_info=True)
+        duration = time.perf_counter() - start_time
+        log_api_event(CONTEXT_ENDPOINT, 'GET', 500, duration, endpoint_args=(session_id,))
+        current_app.logger.error("Get context error: %s", e, exc_info=True)
         return create_response(False, message=f"Failed to retrieve context: {str(e)}", status_code=500)
 
 @chatbot_bp.route('/context/<session_id>', methods=['PUT'])
 def update_context(session_id):
-    start_time = datetime.utcnow()
-    db_session = None
+    start_time = time.perf_counter()
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
+        
+        context_patch = data.get('context_data', {})
+        now = datetime.utcnow()
+        now_iso = now.isoformat()
+        
+        # New context with conversation_history initialized, used when the session has none yet
+        initial_context_data = {
+            "conversation_history": [],  # Initialize empty conversation history
+            "user_preferences": {},
+            "session_metadata": {
+                "created_at": now_iso,
+                "last_activity": now_iso
+            }
+        }
+        initial_context_data.update(context_patch)
+        
+        stmt = mysql_insert(ChatbotContext).values(
+            id=str(uuid.uuid4()),
+            session_id=session_id,
+            context_data=initial_context_data,
+            user_preferences=data.get('user_preferences'),
+            system_state=data.get('system_state'),
+            last_activity=now,
+            created_at=now,
+            updated_at=now
+        )
+        
+        # Existing row: apply the patch server-side so concurrent updaters don't lose keys
+        on_existing = {
+            "context_data": patched_context_data(context_patch),
+            "last_activity": stmt.inserted.last_activity,
+            "updated_at": stmt.inserted.updated_at
+        }
+        for column in ('user_preferences', 'system_state'):
+            if column in data:
+                on_existing[column] = stmt.inserted[column]
         
         with get_db_session() as db_session:
-            context = db_session.query(ChatbotContext).filter(
-                ChatbotContext.session_id == session_id
-            ).first()
+            # Create-or-merge in one statement, keyed on the unique session_id
+            db_session.execute(stmt.on_duplicate_key_update(**on_existing))
             
-            if not context:
-                # Create new context with conversation_history initialized
-                initial_context_data = {
-                    "conversation_history": [],  # Initialize empty conversation history
-                    "user_preferences": {},
-                    "session_metadata": {
-                        "created_at": datetime.utcnow().isoformat(),
-                        "last_activity": datetime.utcnow().isoformat()
-                    }
-                }
-                initial_context_data.update(data.get('context_data', {}))
-                
-                context = ChatbotContext(
-                    session_id=session_id,
-                    context_data=initial_context_data,
-                    metadata=data.get('metadata', {})
-                )
-                db_session.add(context)
-            else:
-                # Update existing context, ensuring conversation_history exists
-                existing_context = context.context_data or {}
-                if 'conversation_history' not in existing_context:
-                    existing_context['conversation_history'] = []
-                
-                # Merge new context data
-                new_context_data = data.get('context_data', {})
-                existing_context.update(new_context_data)
-                
-                context.context_data = existing_context
-                context.metadata = data.get('metadata', context.metadata or {})
-                context.updated_at = datetime.utcnow()
-            
-            db_session.commit()
-            
-            duration = (datetime.utcnow() - start_time).total_seconds()
-            log_api_event(f'/chatbot/context/{session_id}', 'PUT', 200, duration)
+            duration = time.perf_counter() - start_time
+            log_api_event(CONTEXT_ENDPOINT, 'PUT', 200, duration, endpoint_args=(session_id,))
             log_chatbot_event(session_id, 'context_updated', "Context updated")
             
             return create_response(True, {"session_id": session_id}, "Context updated successfully")
             
     except Exception as e:
-        if db_session:
-            db_session.rollback()
-        duration = (datetime.utcnow() - start_time).total_seconds()
-        log_api_event(f'/chatbot/context/{session_id}', 'PUT', 500, duration)
-        current_app.logger.error(f"Update context error: {str(e)}", exc_info=True)
+        duration = time.perf_counter() - start_time
+        log_api_event(CONTEXT_ENDPOINT, 'PUT', 500, duration, endpoint_args=(session_id,))
+        current_app.logger.error("Update context error: %s", e, exc_info=True)
         return create_response(False, message=f"Failed to update context: {str(e)}", status_code=500)
 
+def persist_new_session(session_id: str, data: Dict[str, Any]):
+    """Write the conversation, context and optional greeting exchange for a new session"""
+    # One clock read stamps every row and history entry of the new session
+    now = datetime.utcnow()
+    now_iso = now.isoformat()
+    initial_message = data.get('initial_message')
+    conversation_id = str(uuid.uuid4())
+    
+    # Every row is built in its final state, so the flush is inserts only (no follow-up UPDATEs)
+    conversation_history = []
+    messages = []
+    if initial_message:
+        conversation_history = [
+            {
+                "role": "user",
+                "message": initial_message,
+                "timestamp": now_iso
+            },
+            {
+                "role": "assistant", 
+                "message": GREETING_RESPONSE,
+                "timestamp": now_iso
+            }
+        ]
+        messages = [
+            ChatbotMessage(
+                conversation_id=conversation_id,
+                message_type='user',
+                content=initial_message,
+                intent="greeting",
+                confidence=1.0,
+                entities={},
+                created_at=now
+            ),
+            ChatbotMessage(
+                conversation_id=conversation_id,
+                message_type='bot',
+                content=GREETING_RESPONSE,
+                intent="greeting_response",
+                confidence=1.0,
+                entities={},
+                created_at=now
+            )
+        ]
+    
+    conversation = ChatbotConversation(
+        id=conversation_id,
+        session_id=session_id,
+        user_id=data.get('user_id'),
+        patient_id=data.get('patient_id'),
+        status="active",
+        message_count=len(messages),
+        conversation_metadata={
+            "created_by": "api",
+            "initial_message": initial_message,
+            "session_type": "chat",
+            "platform": data.get('platform', 'web')
+        }
+    )
+    
+    context = ChatbotContext(
+        session_id=session_id,
+        user_id=data.get('user_id'),
+        patient_id=data.get('patient_id'),
+        context_data={
+            "session_start": now_iso,
+            "user_id": data.get('user_id'),
+            "patient_id": data.get('patient_id'),
+            "conversation_history": conversation_history,
+            "user_preferences": {},
+            "current_topic": None,
+            "last_intent": None
+        }
+    )
+    
+    # get_db_session commits once on exit and rolls back on error
+    with get_db_session() as db_session:
+        db_session.add_all([conversation, context, *messages])
+    
+    log_chatbot_event(session_id, 'session_created', "New session created")
+
 @chatbot_bp.route('/sessions', methods=['POST'])
 def create_session():
-    start_time = datetime.utcnow()
-    db_session = None
+    start_time = time.perf_counter()
     try:
-        data = request.get_json()
-        session_id = str(uuid.uuid4())
+        data = request.get_json() or {}
+        session_id = uuid.uuid4().hex
         
-        with get_db_session() as db_session:
-            # Create conversation
-            conversation = ChatbotConversation(
-                session_id=session_id,
-                user_id=data.get('user_id'),
-                patient_id=data.get('patient_id'),
-                status="active",
-                message_count=0
-            )
-            db_session.add(conversation)
-            
-            # Create initial context with proper structure
-            initial_context_data = {
-                "session_start": datetime.utcnow().isoformat(),
-                "user_id": data.get('user_id'),
-                "patient_id": data.get('patient_id'),
-                "conversation_history": [],  # Initialize empty conversation history
-                "user_preferences": {},
-                "current_topic": None,
-                "last_intent": None
-            }
-            
-            context = ChatbotContext(
-                session_id=session_id,
-                context_data=initial_context_data,
-                metadata={
-                    "created_by": "api",
-                    "initial_message": data.get('initial_message'),
-                    "session_type": "chat",
-                    "platform": data.get('platform', 'web')
-                }
-            )
-            db_session.add(context)
-            
-            # Process initial message if provided
-            if data.get('initial_message'):
-                # Add user message
-                user_message = ChatbotMessage(
-                    session_id=session_id,
-                    message_type='user',
-                    message=data['initial_message'],
-                    intent="greeting",
-                    confidence=1.0,
-                    entities={},
-                    timestamp=datetime.utcnow()
-                )
-                db_session.add(user_message)
-                
-                # Add bot response message
-                bot_message = ChatbotMessage(
-                    session_id=session_id,
-                    message_type='bot',
-                    message="Hello! I'm your healthcare assistant. How can I help you today?",
-                    response="Hello! I'm your healthcare assistant. How can I help you today?",
-                    intent="greeting_response",
-                    confidence=1.0,
-                    entities={},
-                    timestamp=datetime.utcnow()
-                )
-                db_session.add(bot_message)
-                
-                conversation.message_count = 2
-                
-                # Update context with initial conversation
-                initial_context_data["conversation_history"] = [
-                    {
-                        "role": "user",
-                        "message": data['initial_message'],
-                        "timestamp": datetime.utcnow().isoformat()
-                    },
-                    {
-                        "role": "assistant", 
-                        "message": "Hello! I'm your healthcare assistant. How can I help you today?",
-                        "timestamp": datetime.utcnow().isoformat()
-                    }
-                ]
-                context.context_data = initial_context_data
-            
-            db_session.commit()
-            
-            duration = (datetime.utcnow() - start_time).total_seconds()
-            log_api_event('/chatbot/sessions', 'POST', 201, duration)
-            log_chatbot_event(session_id, 'session_created', "New session created")
-            
-            return create_response(True, {
-                "session_id": session_id,
-                "user_id": data.get('user_id'),
-                "patient_id": data.get('patient_id'),
-                "status": "active"
-            }, "Session created successfully", 201)
+        # Written before responding, so follow-up calls for this session find its rows
+        persist_new_session(session_id, data)
+        
+        duration = time.perf_counter() - start_time
+        log_api_event('/chatbot/sessions', 'POST', 201, duration)
+        
+        return create_response(True, {
+            "session_id": session_id,
+            "user_id": data.get('user_id'),
+            "patient_id": data.get('patient_id'),
+            "status": "active"
+        }, "Session created successfully", 201)
             
     except Exception as e:
-        if db_session:
-            db_session.rollback()
-        duration = (datetime.utcnow() - start_time).total_seconds()
+        duration = time.perf_counter() - start_time
         log_api_event('/chatbot/sessions', 'POST', 500, duration)
-        current_app.logger.error(f"Create session error: {str(e)}", exc_info=True)
+        current_app.logger.error("Create session error: %s", e, exc_info=True)
         return create_response(False, message=f"Failed to create session: {str(e)}", status_code=500)
 
 @chatbot_bp.route('/analytics', methods=['GET'])
 def get_chatbot_analytics():
-    start_time = datetime.utcnow()
+    start_time = time.perf_counter()
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
         with get_db_session() as session:
-            query = session.query(ChatbotConversation)
+            filters = []
             
             if start_date:
                 try:
-                    start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                    query = query.filter(ChatbotConversation.created_at >= start_dt)
+                    start_dt = parse_timestamp(start_date)
+                    filters.append(ChatbotConversation.created_at >= start_dt)
                 except ValueError:
                     return create_response(False, message="Invalid start_date format", status_code=400)
                     
             if end_date:
                 try:
-                    end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                    query = query.filter(ChatbotConversation.created_at <= end_dt)
+                    end_dt = parse_timestamp(end_date)
+                    filters.append(ChatbotConversation.created_at <= end_dt)
                 except ValueError:
                     return create_response(False, message="Invalid end_date format", status_code=400)
             
-            conversations = query.all()
+            # Cheap validator first: pollers that already hold this version get a 304
+            # The intent distribution counts messages of every conversation, so version on all of them
+            etag = response_etag(*conversations_version(session, []))
+            if request.if_none_match.contains_weak(etag):
+                duration = time.perf_counter() - start_time
+                log_api_event('/chatbot/analytics', 'GET', 304, duration)
+                return not_modified(etag)
+            
+            # Conversation totals as plain conditional sums over conversations (no join fan-out or
+            # DISTINCT); the message total rides along as a scalar subquery in the same round-trip
+            message_total = session.query(func.count(ChatbotMessage.id))\
+                .join(ChatbotConversation, ChatbotConversation.id == ChatbotMessage.conversation_id)\
+                .filter(*filters)\
+                .correlate(None)\
+                .scalar_subquery()
+            stats = session.query(
+                func.count(ChatbotConversation.id).label('total'),
+                func.coalesce(func.sum(case((ChatbotConversation.status == "active", 1), else_=0)), 0).label('active'),
+                func.coalesce(func.sum(case((ChatbotConversation.status == "closed", 1), else_=0)), 0).label('closed'),
+                message_total.label('messages')
+            ).filter(*filters).one()
+            total_conversations = stats.total
+            active_conversations = int(stats.active)
+            closed_conversations = int(stats.closed)
+            total_messages = stats.messages or 0
+            
+            # Intent distribution across messages in the period, aggregated in one pass
+            intent_query = session.query(ChatbotMessage.intent, func.count(ChatbotMessage.id))\
+                .filter(ChatbotMessage.intent.isnot(None))
+            if start_date:
+                intent_query = intent_query.filter(ChatbotMessage.created_at >= start_dt)
+            if end_date:
+                intent_query = intent_query.filter(ChatbotMessage.created_at <= end_dt)
+            intent_counts = dict(intent_query.group_by(ChatbotMessage.intent).all())
             
-            total_conversations = len(conversations)
-            active_conversations = len([c for c in conversations if c.status == "active"])
-            closed_conversations = len([c for c in conversations if c.status == "closed"])
-            total_messages = sum(c.message_count for c in conversations)
             avg_messages = total_messages / total_conversations if total_conversations > 0 else 0
             
             analytics_data = {
@@ -467,19 +736,23 @@ def get_chatbot_analytics():
                 "closed_conversations": closed_conversations,
                 "total_messages": total_messages,
                 "average_messages_per_conversation": round(avg_messages, 2),
+                "intent_distribution": intent_counts,
                 "period": {
                     "start_date": start_date,
                     "end_date": end_date
                 }
             }
             
-            duration = (datetime.utcnow() - start_time).total_seconds()
+            duration = time.perf_counter() - start_time
             log_api_event('/chatbot/analytics', 'GET', 200, duration)
             
-            return create_response(True, analytics_data, "Analytics retrieved successfully")
+            response = create_response(True, analytics_data, "Analytics retrieved successfully")
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = POLLED_CACHE_CONTROL
+            return response
             
     except Exception as e:
-        duration = (datetime.utcnow() - start_time).total_seconds()
+        duration = time.perf_counter() - start_time
         log_api_event('/chatbot/analytics', 'GET', 500, duration)
-        current_app.logger.error(f"Get analytics error: {str(e)}", exc_info=True)
+        current_app.logger.error("Get analytics error: %s", e, exc_info=True)
         return create_response(False, message=f"Failed to retrieve analytics: {str(e)}", status_code=500)
\ No newline at end of file
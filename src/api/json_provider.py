@@ -0,0 +1,42 @@
+"""
+API JSON Provider Module
+
+This module provides the orjson-backed JSON provider installed on the Flask
+application, so jsonify, request.get_json and direct encoders share one codec.
+"""
+
+from decimal import Decimal
+from typing import Any, Union
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+# Naive datetimes from the database are UTC
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_UUID | orjson.OPT_SERIALIZE_NUMPY
+
+def orjson_default(obj: Any) -> Any:
+    """Encode the types orjson does not handle natively"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, '__table__'):
+        # SQLAlchemy model: its column values
+        return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def encode_json(obj: Any) -> bytes:
+    """Encode obj to JSON bytes with the application's orjson options"""
+    return orjson.dumps(obj, default=orjson_default, option=ORJSON_OPTIONS)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes and decodes with orjson"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        option = ORJSON_OPTIONS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=orjson_default, option=option).decode()
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return orjson.loads(s)
@@ -17,11 +17,15 @@ logger = logging.getLogger(__name__)
 def setup_middleware(app):
     @app.before_request
     def before_request():
-        g.start_time = time.time()
+        g.start_time = time.perf_counter()
     
     @app.after_request
     def after_request(response):
-        # Your middleware logic here
+        # One record per request, written once the response is known
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Request: %s %s - IP: %s - Status: %d - Duration: %.3fs",
+                request.method, request.path, request.remote_addr, response.status_code,
+                time.perf_counter() - g.get('start_time', time.perf_counter())
+            )
         return response
-
-1
\ No newline at end of file
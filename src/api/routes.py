@@ -9,10 +9,11 @@ import json
 import time
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, current_app
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, desc
 
+from api.json_provider import encode_json
 from database.connection import get_db_session
 from database.models import (
     Patient, MedicalRecord, Appointment, VitalSigns, Alert, 
@@ -41,29 +42,26 @@ def get_request_data() -> Dict[str, Any]:
 
 def create_response(success: bool, data: Any = None, message: str = "", status_code: int = 200) -> tuple:
     """Create standardized API response"""
-    response = {
-        "success": success,
-        "message": message,
-        "timestamp": datetime.utcnow().isoformat()
-    }
+    # Encoded straight to bytes, skipping jsonify's per-call app and config lookups
+    if data is None:
+        response = {"success": success, "message": message, "timestamp": datetime.utcnow()}
+    else:
+        response = {"success": success, "message": message, "timestamp": datetime.utcnow(), "data": data}
     
-    if data is not None:
-        response["data"] = data
-    
-    return jsonify(response), status_code
+    return Response(encode_json(response), mimetype='application/json'), status_code
 
 # Health and System Endpoints
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         # Check database connection
         with get_db_session() as session:
             session.execute("SELECT 1")
         
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/health', 'GET', 200, duration)
         
         return create_response(True, {
@@ -73,14 +71,14 @@ def health_check():
         }, "System is healthy")
         
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/health', 'GET', 500, duration)
         return create_response(False, message=f"Health check failed: {str(e)}", status_code=500)
 
 @api_bp.route('/system/info', methods=['GET'])
 def system_info():
     """Get system information"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         info = {
@@ -94,13 +92,13 @@ def system_info():
             ]
         }
         
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/system/info', 'GET', 200, duration)
         
         return create_response(True, info, "System information retrieved")
         
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/system/info', 'GET', 500, duration)
         return create_response(False, message=f"Failed to get system info: {str(e)}", status_code=500)
 
@@ -108,7 +106,7 @@ def system_info():
 @api_bp.route('/patients', methods=['GET'])
 def get_patients():
     """Get patients with optional search and pagination"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         search = request.args.get('search')
@@ -142,7 +140,7 @@ def get_patients():
                     "created_at": patient.created_at.isoformat()
                 })
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_api_event('/patients', 'GET', 200, duration)
             
             return create_response(True, {
@@ -153,14 +151,14 @@ def get_patients():
             }, "Patients retrieved successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/patients', 'GET', 500, duration)
         return create_response(False, message=f"Failed to retrieve patients: {str(e)}", status_code=500)
 
 @api_bp.route('/patients', methods=['POST'])
 def create_patient():
     """Create a new patient"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         data = get_request_data()
@@ -188,7 +186,7 @@ def create_patient():
             session.commit()
             session.refresh(new_patient)
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_patient_event(new_patient.id, "created", "Patient created successfully")
             log_api_event('/patients', 'POST', 201, duration)
             
@@ -200,14 +198,14 @@ def create_patient():
             }, "Patient created successfully", 201)
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/patients', 'POST', 500, duration)
         return create_response(False, message=f"Failed to create patient: {str(e)}", status_code=500)
 
 @api_bp.route('/patients/<patient_id>', methods=['GET'])
 def get_patient(patient_id: str):
     """Get a specific patient by ID"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         with get_db_session() as session:
@@ -231,20 +229,20 @@ def get_patient(patient_id: str):
                 "updated_at": patient.updated_at.isoformat() if patient.updated_at else None
             }
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_api_event(f'/patients/{patient_id}', 'GET', 200, duration)
             
             return create_response(True, patient_data, "Patient retrieved successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event(f'/patients/{patient_id}', 'GET', 500, duration)
         return create_response(False, message=f"Failed to retrieve patient: {str(e)}", status_code=500)
 
 @api_bp.route('/patients/<patient_id>', methods=['PUT'])
 def update_patient(patient_id: str):
     """Update a patient's information"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         data = get_request_data()
@@ -263,14 +261,14 @@ def update_patient(patient_id: str):
             patient.updated_at = datetime.utcnow()
             session.commit()
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_patient_event(patient_id, "updated", "Patient information updated")
             log_api_event(f'/patients/{patient_id}', 'PUT', 200, duration)
             
             return create_response(True, {"id": patient.id}, "Patient updated successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event(f'/patients/{patient_id}', 'PUT', 500, duration)
         return create_response(False, message=f"Failed to update patient: {str(e)}", status_code=500)
 
@@ -278,7 +276,7 @@ def update_patient(patient_id: str):
 @api_bp.route('/vital-signs', methods=['POST'])
 def submit_vital_signs():
     """Submit vital signs for a patient"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         data = get_request_data()
@@ -310,7 +308,7 @@ def submit_vital_signs():
             session.commit()
             session.refresh(vital_signs)
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_patient_event(data['patient_id'], "vital_signs_submitted", "Vital signs recorded")
             log_api_event('/vital-signs', 'POST', 201, duration)
             
@@ -321,14 +319,14 @@ def submit_vital_signs():
             }, "Vital signs recorded successfully", 201)
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/vital-signs', 'POST', 500, duration)
         return create_response(False, message=f"Failed to record vital signs: {str(e)}", status_code=500)
 
 @api_bp.route('/vital-signs/<patient_id>', methods=['GET'])
 def get_patient_vital_signs(patient_id: str):
     """Get vital signs history for a patient"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         limit = min(request.args.get('limit', 50, type=int), 100)
@@ -360,7 +358,7 @@ def get_patient_vital_signs(patient_id: str):
                     "recorded_at": vital.recorded_at.isoformat()
                 })
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_api_event(f'/vital-signs/{patient_id}', 'GET', 200, duration)
             
             return create_response(True, {
@@ -370,7 +368,7 @@ def get_patient_vital_signs(patient_id: str):
             }, "Vital signs retrieved successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event(f'/vital-signs/{patient_id}', 'GET', 500, duration)
         return create_response(False, message=f"Failed to retrieve vital signs: {str(e)}", status_code=500)
 
@@ -378,7 +376,7 @@ def get_patient_vital_signs(patient_id: str):
 @api_bp.route('/alerts', methods=['GET'])
 def get_alerts():
     """Get alerts with optional filtering"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         status_filter = request.args.get('status')
@@ -409,7 +407,7 @@ def get_alerts():
                     "acknowledged_at": alert.acknowledged_at.isoformat() if alert.acknowledged_at else None
                 })
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_api_event('/alerts', 'GET', 200, duration)
             
             return create_response(True, {
@@ -418,14 +416,14 @@ def get_alerts():
             }, "Alerts retrieved successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/alerts', 'GET', 500, duration)
         return create_response(False, message=f"Failed to retrieve alerts: {str(e)}", status_code=500)
 
 @api_bp.route('/alerts/<alert_id>/acknowledge', methods=['POST'])
 def acknowledge_alert(alert_id: str):
     """Acknowledge an alert"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         with get_db_session() as session:
@@ -441,13 +439,13 @@ def acknowledge_alert(alert_id: str):
             alert.acknowledged_at = datetime.utcnow()
             session.commit()
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_api_event(f'/alerts/{alert_id}/acknowledge', 'POST', 200, duration)
             
             return create_response(True, {"id": alert.id}, "Alert acknowledged successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event(f'/alerts/{alert_id}/acknowledge', 'POST', 500, duration)
         return create_response(False, message=f"Failed to acknowledge alert: {str(e)}", status_code=500)
 
@@ -455,7 +453,7 @@ def acknowledge_alert(alert_id: str):
 @api_bp.route('/agents/triage', methods=['POST'])
 def triage_patient():
     """Process patient triage using AI agent"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         data = get_request_data()
@@ -490,21 +488,21 @@ def triage_patient():
             session.add(assessment)
             session.commit()
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_agent_event('triage', data['patient_id'], "Triage assessment completed")
             log_api_event('/agents/triage', 'POST', 200, duration)
             
             return create_response(True, triage_result, "Triage assessment completed successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/agents/triage', 'POST', 500, duration)
         return create_response(False, message=f"Triage processing failed: {str(e)}", status_code=500)
 
 @api_bp.route('/agents/emergency', methods=['POST'])
 def emergency_response():
     """Process emergency response using AI agent"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         data = get_request_data()
@@ -541,14 +539,14 @@ def emergency_response():
             session.add(response)
             session.commit()
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_agent_event('emergency', data['patient_id'], "Emergency response initiated")
             log_api_event('/agents/emergency', 'POST', 200, duration)
             
             return create_response(True, emergency_result, "Emergency response initiated successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/agents/emergency', 'POST', 500, duration)
         return create_response(False, message=f"Emergency processing failed: {str(e)}", status_code=500)
 
@@ -556,7 +554,7 @@ def emergency_response():
 @api_bp.route('/appointments', methods=['GET'])
 def get_appointments():
     """Get appointments with optional filtering"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         patient_id = request.args.get('patient_id')
@@ -589,7 +587,7 @@ def get_appointments():
                     "created_at": appointment.created_at.isoformat()
                 })
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_api_event('/appointments', 'GET', 200, duration)
             
             return create_response(True, {
@@ -598,14 +596,14 @@ def get_appointments():
             }, "Appointments retrieved successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/appointments', 'GET', 500, duration)
         return create_response(False, message=f"Failed to retrieve appointments: {str(e)}", status_code=500)
 
 @api_bp.route('/appointments', methods=['POST'])
 def create_appointment():
     """Create a new appointment"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         data = get_request_data()
@@ -635,7 +633,7 @@ def create_appointment():
             session.commit()
             session.refresh(appointment)
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_patient_event(data['patient_id'], "appointment_created", "Appointment scheduled")
             log_api_event('/appointments', 'POST', 201, duration)
             
@@ -646,7 +644,7 @@ def create_appointment():
             }, "Appointment created successfully", 201)
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/appointments', 'POST', 500, duration)
         return create_response(False, message=f"Failed to create appointment: {str(e)}", status_code=500)
 
@@ -654,7 +652,7 @@ def create_appointment():
 @api_bp.route('/medical-records/<patient_id>', methods=['GET'])
 def get_medical_records(patient_id: str):
     """Get medical records for a patient"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         record_type = request.args.get('record_type')
@@ -671,7 +669,7 @@ def get_medical_records(patient_id: str):
             if record_type:
                 query = query.filter(MedicalRecord.record_type == record_type)
             
-            records = query.order_by(desc(MedicalRecord.date_recorded)).limit(limit).all()
+            records = query.order_by(desc(MedicalRecord.created_at)).limit(limit).all()
             
             record_data = []
             for record in records:
@@ -680,11 +678,11 @@ def get_medical_records(patient_id: str):
                     "record_type": record.record_type,
                     "content": record.content,
                     "doctor_id": record.doctor_id,
-                    "date_recorded": record.date_recorded.isoformat(),
+                    "date_recorded": record.created_at.isoformat(),
                     "created_at": record.created_at.isoformat()
                 })
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_api_event(f'/medical-records/{patient_id}', 'GET', 200, duration)
             
             return create_response(True, {
@@ -694,14 +692,14 @@ def get_medical_records(patient_id: str):
             }, "Medical records retrieved successfully")
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event(f'/medical-records/{patient_id}', 'GET', 500, duration)
         return create_response(False, message=f"Failed to retrieve medical records: {str(e)}", status_code=500)
 
 @api_bp.route('/medical-records', methods=['POST'])
 def create_medical_record():
     """Create a new medical record"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         data = get_request_data()
@@ -730,7 +728,7 @@ def create_medical_record():
             session.commit()
             session.refresh(record)
             
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             log_patient_event(data['patient_id'], "medical_record_created", "Medical record added")
             log_api_event('/medical-records', 'POST', 201, duration)
             
@@ -742,6 +740,6 @@ def create_medical_record():
             }, "Medical record created successfully", 201)
             
     except Exception as e:
-        duration = time.time() - start_time
+        duration = time.perf_counter() - start_time
         log_api_event('/medical-records', 'POST', 500, duration)
         return create_response(False, message=f"Failed to create medical record: {str(e)}", status_code=500)
\ No newline at end of file
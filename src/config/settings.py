@@ -10,6 +10,11 @@ class Config:
     DATABASE_NAME = os.getenv('DATABASE_NAME', 'healthcare_db')
     DATABASE_USER = os.getenv('DATABASE_USER', 'postgres')
     DATABASE_PASSWORD = os.getenv('DATABASE_PASSWORD', 'password')
+    # Sync engine pool bounds
+    DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '20'))
+    DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', '40'))
+    # Connections opened at startup so the first requests skip connection setup
+    DATABASE_POOL_WARM = int(os.getenv('DATABASE_POOL_WARM', '5'))
     
     # LLM Configuration
     GROQ_API_KEY = os.getenv('GROQ_API_KEY')
@@ -11,13 +11,40 @@ from typing import AsyncGenerator, Generator
 from sqlalchemy import create_engine, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker, scoped_session, Session
 from sqlalchemy.exc import OperationalError
 from config.settings import Config
 from database.models import Base
 
 logger = logging.getLogger(__name__)
 
+class UnitOfWorkSession(Session):
+    """Session handed out by get_session
+    
+    Inside a nested get_session block, commit() only flushes and rollback() marks the
+    whole unit of work rollback-only, so the outermost block alone decides the outcome.
+    """
+    
+    def after_commit(self, callback):
+        """Run callback once the unit of work has really committed; dropped if it rolls back"""
+        self.info.setdefault('after_commit', []).append(callback)
+    
+    def commit(self):
+        if self.info.get('rollback_only'):
+            raise RuntimeError("Transaction is rollback-only: a nested database block failed")
+        if self.info.get('depth', 0) > 1:
+            self.flush()
+            return
+        super().commit()
+        for callback in self.info.pop('after_commit', ()):
+            callback()
+    
+    def rollback(self):
+        if self.info.get('depth', 0) > 1:
+            self.info['rollback_only'] = True
+        self.info.pop('after_commit', None)
+        super().rollback()
+
 class DatabaseManager:
     """Database connection and session manager with async support"""
     
@@ -26,6 +53,7 @@ class DatabaseManager:
         self.engine = None
         self.async_engine = None
         self.SessionLocal = None
+        self.ScopedSession = None
         self.AsyncSessionLocal = None
         self._initialized = False
     
@@ -35,8 +63,8 @@ class DatabaseManager:
             # Create synchronous database engine
             self.engine = create_engine(
                 self.config.database_url,
-                pool_size=10,
-                max_overflow=20,
+                pool_size=self.config.DATABASE_POOL_SIZE,
+                max_overflow=self.config.DATABASE_MAX_OVERFLOW,
                 pool_pre_ping=True,
                 pool_recycle=3600,
                 echo=False  # Set to True for SQL debugging
@@ -60,11 +88,7 @@ class DatabaseManager:
             )
             
             # Create session factories
-            self.SessionLocal = sessionmaker(
-                autocommit=False,
-                autoflush=False,
-                bind=self.engine
-            )
+            self.bind_session_factories(self.engine)
             
             self.AsyncSessionLocal = async_sessionmaker(
                 autocommit=False,
@@ -80,6 +104,9 @@ class DatabaseManager:
             # Create tables
             self.create_tables()
             
+            # Pre-open pooled connections before the first request needs them
+            self.warm_pool(self.config.DATABASE_POOL_WARM)
+            
             self._initialized = True
             logger.info("Database initialization completed")
             
@@ -90,6 +117,21 @@ class DatabaseManager:
             logger.error(f"Database initialization failed: {str(e)}")
             raise
     
+    def bind_session_factories(self, engine):
+        """Create the synchronous session factories for engine"""
+        self.SessionLocal = sessionmaker(
+            autocommit=False,
+            autoflush=False,
+            bind=engine
+        )
+        # Per-thread session for get_session, shared by blocks nested on the same thread
+        self.ScopedSession = scoped_session(sessionmaker(
+            class_=UnitOfWorkSession,
+            autocommit=False,
+            autoflush=False,
+            bind=engine
+        ))
+    
     async def initialize_async(self):
         """Initialize database connection asynchronously"""
         try:
@@ -135,6 +177,26 @@ class DatabaseManager:
             logger.error(f"Async database initialization failed: {str(e)}")
             raise
     
+    def warm_pool(self, connections: int):
+        """Open and release up to pool_size connections so they sit idle in the pool"""
+        connections = min(connections, self.engine.pool.size())
+        if connections <= 0:
+            return
+        
+        # Connections must be held together; opening them one at a time reuses a single one
+        opened = []
+        try:
+            for _ in range(connections):
+                connection = self.engine.connect()
+                opened.append(connection)
+                connection.execute(text("SELECT 1"))
+            logger.info(f"Database pool warmed with {len(opened)} connections")
+        except Exception as e:
+            logger.warning(f"Database pool warm-up stopped early: {str(e)}")
+        finally:
+            for connection in opened:
+                connection.close()
+    
     def create_tables(self):
         """Create all database tables"""
         try:
@@ -201,7 +263,23 @@ class DatabaseManager:
         if not self._initialized:
             raise RuntimeError("Database not initialized. Call initialize() first.")
         
-        session = self.SessionLocal()
+        session = self.ScopedSession()
+        if session.info.get('depth'):
+            # Nested block on this thread: join the outer unit of work, which commits once
+            session.info['depth'] += 1
+            try:
+                yield session
+                session.flush()
+            except Exception:
+                # Undo now and keep the outermost block from committing what is left
+                session.rollback()
+                raise
+            finally:
+                session.info['depth'] -= 1
+            return
+        
+        session.info['depth'] = 1
+        session.info['rollback_only'] = False
         try:
             yield session
             session.commit()
@@ -210,7 +288,14 @@ class DatabaseManager:
             logger.error(f"Database session error: {str(e)}")
             raise
         finally:
-            session.close()
+            # Close and unregister, so worker threads (executors, to_thread, the ASGI
+            # loop thread) keep no session once their outermost block ends
+            self.ScopedSession.remove()
+    
+    def remove_scoped_session(self):
+        """Discard this thread's registered session, if a block left one behind"""
+        if self.ScopedSession is not None:
+            self.ScopedSession.remove()
     
     async def get_async_session_direct(self) -> AsyncSession:
         """Get async database session directly"""
@@ -243,8 +328,8 @@ class DatabaseManager:
         """Get database connection information"""
         return {
             "database_url": self.config.database_url,
-            "pool_size": 10,
-            "max_overflow": 20,
+            "pool_size": self.config.DATABASE_POOL_SIZE,
+            "max_overflow": self.config.DATABASE_MAX_OVERFLOW,
             "initialized": self._initialized
         }
     
@@ -289,6 +374,10 @@ async def get_db_session_async() -> AsyncGenerator[AsyncSession, None]:
     async with db_manager.get_async_session() as session:
         yield session
 
+def remove_db_session():
+    """Discard the current thread's scoped session"""
+    db_manager.remove_scoped_session()
+
 def get_db_session_direct() -> Session:
     """Get database session directly (synchronous)"""
     return db_manager.get_session_direct()
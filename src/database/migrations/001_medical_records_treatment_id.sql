@@ -0,0 +1,8 @@
+-- Link treatment-plan medical records to the treatment they were written for
+-- Run once against databases created from a schema.sql without medical_records.treatment_id
+
+ALTER TABLE medical_records
+    ADD COLUMN treatment_id VARCHAR(36) NULL AFTER patient_id,
+    ADD INDEX idx_medical_records_treatment (treatment_id),
+    ADD CONSTRAINT fk_medical_records_treatment
+        FOREIGN KEY (treatment_id) REFERENCES treatments(id) ON DELETE SET NULL;
@@ -0,0 +1,8 @@
+-- Microsecond updated_at on chatbot conversations, with the indexes that version listings
+-- Run once against databases whose chatbot tables predate these columns and indexes
+
+ALTER TABLE chatbot_conversations
+    MODIFY COLUMN updated_at DATETIME(6) NULL,
+    ADD INDEX idx_chatbot_conversations_user_updated (user_id, updated_at),
+    ADD INDEX idx_chatbot_conversations_patient_updated (patient_id, updated_at),
+    ADD INDEX idx_chatbot_conversations_updated (updated_at);
@@ -9,8 +9,9 @@ from datetime import datetime, date
 from typing import Optional, List
 from sqlalchemy import (
     Column, Integer, String, DateTime, Date, Float, Boolean, 
-    Text, ForeignKey, Enum, JSON, Index
+    Text, ForeignKey, Enum, JSON, Index, func, text
 )
+from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 import uuid
@@ -18,6 +19,13 @@ import enum
 
 Base = declarative_base()
 
+# Column default from the database's UTC clock; MySQL requires the parentheses
+# around any function default other than CURRENT_TIMESTAMP
+UTC_TIMESTAMP_DEFAULT = text('(UTC_TIMESTAMP())')
+
+# Microsecond DATETIME on MySQL, where plain DATETIME only resolves to the second
+PRECISE_DATETIME = DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
+
 class TriageLevel(enum.Enum):
     """Triage levels for patient assessment"""
     IMMEDIATE = "1"
@@ -91,6 +99,7 @@ class MedicalRecord(Base):
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     patient_id = Column(String(36), ForeignKey('patients.id'), nullable=False)
+    treatment_id = Column(String(36), ForeignKey('treatments.id', ondelete='SET NULL'))  # Treatment the record was written for
     record_type = Column(String(50), nullable=False)  # diagnosis, treatment, lab_result, etc.
     title = Column(String(200), nullable=False)
     content = Column(Text, nullable=False)
@@ -105,6 +114,7 @@ class MedicalRecord(Base):
     
     # Relationships
     patient = relationship("Patient", back_populates="medical_records")
+    treatment = relationship("Treatment")
     
     def __repr__(self):
         return f"<MedicalRecord(id={self.id}, patient_id={self.patient_id}, type={self.record_type})>"
@@ -192,13 +202,14 @@ class Treatment(Base):
     treatment_plan = Column(Text, nullable=False)
     medications = Column(JSON)
     procedures = Column(JSON)
-    start_date = Column(DateTime, nullable=False)
+    start_date = Column(DateTime, nullable=False, server_default=UTC_TIMESTAMP_DEFAULT)
     end_date = Column(DateTime)
     status = Column(String(50), default='active')  # active, completed, discontinued
     doctor_id = Column(String(50))
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Stamped by the database clock so concurrent writers agree on ordering
+    updated_at = Column(DateTime, server_default=UTC_TIMESTAMP_DEFAULT, onupdate=func.utc_timestamp())
     
     # Relationships
     patient = relationship("Patient", back_populates="treatments")
@@ -265,7 +276,8 @@ class ChatbotConversation(Base):
     context_data = Column(JSON)  # Store conversation context
     conversation_metadata = Column(JSON)  # Additional metadata
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Moves on every status change and message insert; versions conversation listings
+    updated_at = Column(PRECISE_DATETIME, default=datetime.utcnow, onupdate=datetime.utcnow)
     closed_at = Column(DateTime)
     
     # Relationships
@@ -324,10 +336,14 @@ Index('idx_patients_status', Patient.status)
 Index('idx_patients_name', Patient.last_name, Patient.first_name)
 Index('idx_medical_records_patient', MedicalRecord.patient_id)
 Index('idx_medical_records_type', MedicalRecord.record_type)
+Index('idx_medical_records_treatment', MedicalRecord.treatment_id)
 Index('idx_appointments_patient', Appointment.patient_id)
 Index('idx_appointments_date', Appointment.scheduled_date)
 Index('idx_appointments_status', Appointment.status)
 Index('idx_appointments_patient_date', Appointment.patient_id, Appointment.scheduled_date)
+Index('idx_appointments_doctor_date', Appointment.doctor_id, Appointment.scheduled_date)
+Index('idx_appointments_room_date', Appointment.room_number, Appointment.scheduled_date)
+Index('idx_appointments_status_date', Appointment.status, Appointment.scheduled_date)
 Index('idx_vital_signs_patient', VitalSigns.patient_id)
 Index('idx_vital_signs_recorded', VitalSigns.recorded_at)
 Index('idx_vital_signs_patient_date', VitalSigns.patient_id, VitalSigns.recorded_at)
@@ -337,7 +353,17 @@ Index('idx_alerts_created', Alert.created_at)
 Index('idx_alerts_patient_severity', Alert.patient_id, Alert.severity)
 Index('idx_treatments_patient', Treatment.patient_id)
 Index('idx_treatments_status', Treatment.status)
+Index('idx_treatments_stats', Treatment.patient_id, Treatment.status, Treatment.treatment_type, Treatment.created_at)
 Index('idx_triage_patient', TriageAssessment.patient_id)
 Index('idx_triage_level', TriageAssessment.triage_level)
 Index('idx_emergency_patient', EmergencyResponse.patient_id)
-Index('idx_emergency_type', EmergencyResponse.emergency_type)   
\ No newline at end of file
+Index('idx_emergency_type', EmergencyResponse.emergency_type)
+Index('idx_chatbot_conversations_user_created', ChatbotConversation.user_id, ChatbotConversation.created_at)
+Index('idx_chatbot_conversations_patient_created', ChatbotConversation.patient_id, ChatbotConversation.created_at)
+Index('idx_chatbot_conversations_user_status_updated', ChatbotConversation.user_id, ChatbotConversation.status, ChatbotConversation.updated_at)
+Index('idx_chatbot_conversations_created', ChatbotConversation.created_at)
+Index('idx_chatbot_conversations_user_updated', ChatbotConversation.user_id, ChatbotConversation.updated_at)
+Index('idx_chatbot_conversations_patient_updated', ChatbotConversation.patient_id, ChatbotConversation.updated_at)
+Index('idx_chatbot_conversations_updated', ChatbotConversation.updated_at)
+Index('idx_chatbot_messages_conversation_created', ChatbotMessage.conversation_id, ChatbotMessage.created_at, ChatbotMessage.id)
+Index('idx_chatbot_messages_intent', ChatbotMessage.intent)
@@ -28,27 +28,6 @@ CREATE TABLE IF NOT EXISTS patients (
     INDEX idx_patients_name (last_name, first_name)
 );
 
--- Medical records table
-CREATE TABLE IF NOT EXISTS medical_records (
-    id VARCHAR(36) PRIMARY KEY DEFAULT (UUID()),
-    patient_id VARCHAR(36) NOT NULL,
-    record_type VARCHAR(50) NOT NULL,
-    title VARCHAR(200) NOT NULL,
-    content TEXT NOT NULL,
-    doctor_id VARCHAR(50),
-    department VARCHAR(100),
-    diagnosis_codes JSON,
-    medications JSON,
-    procedures JSON,
-    attachments JSON,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    
-    FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
-    INDEX idx_medical_records_patient (patient_id),
-    INDEX idx_medical_records_type (record_type)
-);
-
 -- Appointments table
 CREATE TABLE IF NOT EXISTS appointments (
     id VARCHAR(36) PRIMARY KEY DEFAULT (UUID()),
@@ -68,7 +47,10 @@ CREATE TABLE IF NOT EXISTS appointments (
     INDEX idx_appointments_patient (patient_id),
     INDEX idx_appointments_date (scheduled_date),
     INDEX idx_appointments_status (status),
-    INDEX idx_appointments_patient_date (patient_id, scheduled_date)
+    INDEX idx_appointments_patient_date (patient_id, scheduled_date),
+    INDEX idx_appointments_doctor_date (doctor_id, scheduled_date),
+    INDEX idx_appointments_room_date (room_number, scheduled_date),
+    INDEX idx_appointments_status_date (status, scheduled_date)
 );
 
 -- Vital signs table
@@ -125,17 +107,43 @@ CREATE TABLE IF NOT EXISTS treatments (
     treatment_plan TEXT NOT NULL,
     medications JSON,
     procedures JSON,
-    start_date TIMESTAMP NOT NULL,
-    end_date TIMESTAMP NULL,
+    -- UTC like the ORM model; updated_at is stamped with UTC_TIMESTAMP() by the application
+    start_date DATETIME NOT NULL DEFAULT (UTC_TIMESTAMP()),
+    end_date DATETIME NULL,
     status VARCHAR(50) DEFAULT 'active',
     doctor_id VARCHAR(50),
     notes TEXT,
+    created_at DATETIME DEFAULT (UTC_TIMESTAMP()),
+    updated_at DATETIME DEFAULT (UTC_TIMESTAMP()),
+    
+    FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
+    INDEX idx_treatments_patient (patient_id),
+    INDEX idx_treatments_status (status),
+    INDEX idx_treatments_stats (patient_id, status, treatment_type, created_at)
+);
+
+-- Medical records table (after treatments, which treatment_id references)
+CREATE TABLE IF NOT EXISTS medical_records (
+    id VARCHAR(36) PRIMARY KEY DEFAULT (UUID()),
+    patient_id VARCHAR(36) NOT NULL,
+    treatment_id VARCHAR(36) NULL,
+    record_type VARCHAR(50) NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    content TEXT NOT NULL,
+    doctor_id VARCHAR(50),
+    department VARCHAR(100),
+    diagnosis_codes JSON,
+    medications JSON,
+    procedures JSON,
+    attachments JSON,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
     FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
-    INDEX idx_treatments_patient (patient_id),
-    INDEX idx_treatments_status (status)
+    FOREIGN KEY (treatment_id) REFERENCES treatments(id) ON DELETE SET NULL,
+    INDEX idx_medical_records_patient (patient_id),
+    INDEX idx_medical_records_type (record_type),
+    INDEX idx_medical_records_treatment (treatment_id)
 );
 
 -- Triage assessments table
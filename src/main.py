@@ -19,11 +19,12 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from flask import Flask, send_from_directory, jsonify
 from config.settings import Config
-from database.connection import init_database
+from database.connection import init_database, remove_db_session
 from api.routes import api_bp
 from api.chatbot_routes import chatbot_bp
 from api.patient_entry_form import patient_form_bp
 from api.middleware import setup_middleware
+from api.json_provider import OrjsonProvider
 from utils.logger import setup_logging
 from agents.triage_agent import TriageAgent
 from agents.emergency_agent import EmergencyAgent
@@ -49,6 +50,7 @@ def create_app():
     app.config['SECRET_KEY'] = config.SECRET_KEY
     app.config['JSON_SORT_KEYS'] = False
     app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+    app.json = OrjsonProvider(app)
     
     # Setup logging
     setup_logging(config.LOG_LEVEL, config.LOG_FILE)
@@ -70,6 +72,10 @@ def create_app():
         agents = initialize_agents(tools)
         logger.info("Agents initialized successfully")
         
+        # Store agents and tools in app context before the blueprints bind to them
+        app.config['AGENTS'] = agents
+        app.config['TOOLS'] = tools
+        
         # Setup API routes
         logger.info("Setting up API routes...")
         app.register_blueprint(api_bp, url_prefix='/api')
@@ -83,14 +89,13 @@ def create_app():
         # Setup middleware
         setup_middleware(app)
         
-        # Store agents and tools in app context
-        app.config['AGENTS'] = agents
-        app.config['TOOLS'] = tools
+        # Drop each request thread's scoped DB session once the request is done
+        app.teardown_appcontext(lambda exc: remove_db_session())
         
         logger.info("Application initialization completed successfully")
         
     except Exception as e:
-        logger.error(f"Failed to initialize application: {str(e)}")
+        logger.error("Failed to initialize application: %s", e)
         raise
     
     return app
@@ -4,21 +4,44 @@ Logger Utility
 This module provides centralized logging functionality for the healthcare management system.
 """
 
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 from datetime import datetime, UTC
 from pathlib import Path
 from typing import Optional, Dict, Any
-import json
+
+import orjson
+
+# Background listener that drains the root logger's queue into the real handlers
+_queue_listener: Optional[logging.handlers.QueueListener] = None
+
+def _stop_queue_listener() -> None:
+    """Flush and stop the background listener, closing its handlers"""
+    global _queue_listener
+    if _queue_listener is None:
+        return
+    _queue_listener.stop()
+    for handler in _queue_listener.handlers:
+        handler.close()
+    _queue_listener = None
+
+atexit.register(_stop_queue_listener)
+
+def _to_json(data: Dict[str, Any]) -> str:
+    """Serialize a log payload with orjson, coercing non-string keys like the stdlib encoder"""
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
 
 # Configure logging
 def setup_logging(log_level: str = "INFO", log_file: Optional[str] = None) -> None:
-    """Setup logging configuration"""
+    """Setup logging configuration; records are queued and written by a background thread"""
+    global _queue_listener
     
-    # Create logs directory if it doesn't exist
-    logs_dir = Path("logs")
-    logs_dir.mkdir(exist_ok=True)
+    # Create logs directory if it doesn't exist; chatbot.log sits next to the main log file
+    logs_dir = Path(log_file).parent if log_file else Path("logs")
+    logs_dir.mkdir(parents=True, exist_ok=True)
     
     # Set log level
     level = getattr(logging, log_level.upper(), logging.INFO)
@@ -35,12 +58,12 @@ def setup_logging(log_level: str = "INFO", log_file: Optional[str] = None) -> No
     
     # Clear existing handlers
     root_logger.handlers.clear()
+    _stop_queue_listener()
     
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
     
     # File handler
     if log_file:
@@ -51,7 +74,6 @@ def setup_logging(log_level: str = "INFO", log_file: Optional[str] = None) -> No
         )
         file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
     else:
         # Default log file
         default_log_file = logs_dir / f"healthcare_system_{datetime.now(UTC).strftime('%Y%m%d')}.log"
@@ -62,15 +84,36 @@ def setup_logging(log_level: str = "INFO", log_file: Optional[str] = None) -> No
         )
         file_handler.setLevel(level)
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
+    
+    # Chatbot events are also kept as bare JSON lines in their own file
+    chatbot_handler = logging.handlers.RotatingFileHandler(
+        logs_dir / "chatbot.log",
+        maxBytes=10*1024*1024,  # 10MB
+        backupCount=5
+    )
+    chatbot_handler.addFilter(logging.Filter('chatbot'))
+    chatbot_handler.setFormatter(logging.Formatter('%(chatbot_entry)s'))
+    
+    # Logging threads only enqueue; stream and file writes happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _queue_listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, chatbot_handler, respect_handler_level=True
+    )
+    _queue_listener.start()
 
 def get_logger(name: str) -> logging.Logger:
     """Get a logger instance with the specified name"""
     return logging.getLogger(name)
 
+# Agent events are logged from every agent call path, so the logger is looked up once
+_agent_event_logger = get_logger("agent_events")
+
 def log_agent_event(agent_name: str, event_type: str, message: str, extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log agent events with structured data"""
-    logger = get_logger("agent_events")
+    logger = _agent_event_logger
+    if not logger.isEnabledFor(logging.INFO):
+        return
     
     log_data = {
         'agent_name': agent_name,
@@ -80,11 +123,13 @@ def log_agent_event(agent_name: str, event_type: str, message: str, extra_data:
         'extra_data': extra_data or {}
     }
     
-    logger.info(f"Agent Event: {json.dumps(log_data)}")
+    logger.info("Agent Event: %s", _to_json(log_data))
 
 def log_patient_event(patient_id: str, event_type: str, message: str, extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log patient-related events"""
     logger = get_logger("patient_events")
+    if not logger.isEnabledFor(logging.INFO):
+        return
     
     log_data = {
         'patient_id': patient_id,
@@ -94,11 +139,19 @@ def log_patient_event(patient_id: str, event_type: str, message: str, extra_data
         'extra_data': extra_data or {}
     }
     
-    logger.info(f"Patient Event: {json.dumps(log_data)}")
+    logger.info("Patient Event: %s", _to_json(log_data))
 
 def log_system_event(event_type: str, message: str, severity: str = "INFO", extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log system events"""
     logger = get_logger("system_events")
+    if severity.upper() == "ERROR":
+        level = logging.ERROR
+    elif severity.upper() == "WARNING":
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
         'event_type': event_type,
@@ -108,16 +161,13 @@ def log_system_event(event_type: str, message: str, severity: str = "INFO", extr
         'extra_data': extra_data or {}
     }
     
-    if severity.upper() == "ERROR":
-        logger.error(f"System Event: {json.dumps(log_data)}")
-    elif severity.upper() == "WARNING":
-        logger.warning(f"System Event: {json.dumps(log_data)}")
-    else:
-        logger.info(f"System Event: {json.dumps(log_data)}")
+    logger.log(level, "System Event: %s", _to_json(log_data))
 
 def log_security_event(event_type: str, message: str, user_id: Optional[str] = None, ip_address: Optional[str] = None, extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log security-related events"""
     logger = get_logger("security_events")
+    if not logger.isEnabledFor(logging.WARNING):
+        return
     
     log_data = {
         'event_type': event_type,
@@ -128,11 +178,13 @@ def log_security_event(event_type: str, message: str, user_id: Optional[str] = N
         'extra_data': extra_data or {}
     }
     
-    logger.warning(f"Security Event: {json.dumps(log_data)}")
+    logger.warning("Security Event: %s", _to_json(log_data))
 
 def log_performance_event(operation: str, duration: float, success: bool, extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log performance metrics"""
     logger = get_logger("performance_events")
+    if not logger.isEnabledFor(logging.INFO):
+        return
     
     log_data = {
         'operation': operation,
@@ -142,11 +194,14 @@ def log_performance_event(operation: str, duration: float, success: bool, extra_
         'extra_data': extra_data or {}
     }
     
-    logger.info(f"Performance Event: {json.dumps(log_data)}")
+    logger.info("Performance Event: %s", _to_json(log_data))
 
 def log_database_event(operation: str, table: str, record_id: Optional[str] = None, success: bool = True, extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log database operations"""
     logger = get_logger("database_events")
+    level = logging.INFO if success else logging.ERROR
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
         'operation': operation,
@@ -157,17 +212,19 @@ def log_database_event(operation: str, table: str, record_id: Optional[str] = No
         'extra_data': extra_data or {}
     }
     
-    if success:
-        logger.info(f"Database Event: {json.dumps(log_data)}")
-    else:
-        logger.error(f"Database Event: {json.dumps(log_data)}")
+    logger.log(level, "Database Event: %s", _to_json(log_data))
 
-def log_api_event(endpoint: str, method: str, status_code: int, duration: float, user_id: Optional[str] = None, extra_data: Optional[Dict[str, Any]] = None) -> None:
-    """Log API requests and responses"""
-    logger = get_logger("api_events")
+_api_event_logger = get_logger("api_events")
+
+def log_api_event(endpoint: str, method: str, status_code: int, duration: float, user_id: Optional[str] = None, extra_data: Optional[Dict[str, Any]] = None, endpoint_args: tuple = ()) -> None:
+    """Log API requests and responses; endpoint may be a %-template filled from endpoint_args"""
+    logger = _api_event_logger
+    level = logging.WARNING if status_code >= 400 else logging.INFO
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
-        'endpoint': endpoint,
+        'endpoint': endpoint % endpoint_args if endpoint_args else endpoint,
         'method': method,
         'status_code': status_code,
         'duration_seconds': duration,
@@ -176,14 +233,13 @@ def log_api_event(endpoint: str, method: str, status_code: int, duration: float,
         'extra_data': extra_data or {}
     }
     
-    if status_code >= 400:
-        logger.warning(f"API Event: {json.dumps(log_data)}")
-    else:
-        logger.info(f"API Event: {json.dumps(log_data)}")
+    logger.log(level, "API Event: %s", _to_json(log_data))
 
 def log_error(error: Exception, context: Optional[str] = None, extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log errors with context"""
     logger = get_logger("errors")
+    if not logger.isEnabledFor(logging.ERROR):
+        return
     
     log_data = {
         'error_type': type(error).__name__,
@@ -193,11 +249,13 @@ def log_error(error: Exception, context: Optional[str] = None, extra_data: Optio
         'extra_data': extra_data or {}
     }
     
-    logger.error(f"Error: {json.dumps(log_data)}", exc_info=True)
+    logger.error("Error: %s", _to_json(log_data), exc_info=True)
 
 def log_audit_trail(user_id: str, action: str, resource_type: str, resource_id: str, details: Optional[Dict[str, Any]] = None) -> None:
     """Log audit trail events"""
     logger = get_logger("audit_trail")
+    if not logger.isEnabledFor(logging.INFO):
+        return
     
     log_data = {
         'user_id': user_id,
@@ -208,11 +266,14 @@ def log_audit_trail(user_id: str, action: str, resource_type: str, resource_id:
         'details': details or {}
     }
     
-    logger.info(f"Audit Trail: {json.dumps(log_data)}")
+    logger.info("Audit Trail: %s", _to_json(log_data))
 
 def log_health_check(component: str, status: str, details: Optional[Dict[str, Any]] = None) -> None:
     """Log health check results"""
     logger = get_logger("health_checks")
+    level = logging.INFO if status.lower() == "healthy" else logging.WARNING
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
         'component': component,
@@ -221,14 +282,14 @@ def log_health_check(component: str, status: str, details: Optional[Dict[str, An
         'details': details or {}
     }
     
-    if status.lower() == "healthy":
-        logger.info(f"Health Check: {json.dumps(log_data)}")
-    else:
-        logger.warning(f"Health Check: {json.dumps(log_data)}")
+    logger.log(level, "Health Check: %s", _to_json(log_data))
 
 def log_notification(notification_type: str, recipient: str, success: bool, details: Optional[Dict[str, Any]] = None) -> None:
     """Log notification events"""
     logger = get_logger("notifications")
+    level = logging.INFO if success else logging.WARNING
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
         'notification_type': notification_type,
@@ -238,14 +299,14 @@ def log_notification(notification_type: str, recipient: str, success: bool, deta
         'details': details or {}
     }
     
-    if success:
-        logger.info(f"Notification: {json.dumps(log_data)}")
-    else:
-        logger.warning(f"Notification: {json.dumps(log_data)}")
+    logger.log(level, "Notification: %s", _to_json(log_data))
 
 def log_workflow_event(workflow_name: str, step: str, status: str, patient_id: Optional[str] = None, extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log workflow events"""
     logger = get_logger("workflow_events")
+    level = logging.ERROR if status.lower() == "failed" else logging.INFO
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
         'workflow_name': workflow_name,
@@ -256,16 +317,14 @@ def log_workflow_event(workflow_name: str, step: str, status: str, patient_id: O
         'extra_data': extra_data or {}
     }
     
-    if status.lower() == "completed":
-        logger.info(f"Workflow Event: {json.dumps(log_data)}")
-    elif status.lower() == "failed":
-        logger.error(f"Workflow Event: {json.dumps(log_data)}")
-    else:
-        logger.info(f"Workflow Event: {json.dumps(log_data)}")
+    logger.log(level, "Workflow Event: %s", _to_json(log_data))
 
 def log_alert_event(alert_type: str, severity: str, patient_id: str, message: str, extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log alert events"""
     logger = get_logger("alert_events")
+    level = logging.WARNING if severity.lower() in ["critical", "high"] else logging.INFO
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
         'alert_type': alert_type,
@@ -276,14 +335,14 @@ def log_alert_event(alert_type: str, severity: str, patient_id: str, message: st
         'extra_data': extra_data or {}
     }
     
-    if severity.lower() in ["critical", "high"]:
-        logger.warning(f"Alert Event: {json.dumps(log_data)}")
-    else:
-        logger.info(f"Alert Event: {json.dumps(log_data)}")
+    logger.log(level, "Alert Event: %s", _to_json(log_data))
 
 def log_data_validation(data_type: str, validation_result: Dict[str, Any], extra_data: Optional[Dict[str, Any]] = None) -> None:
     """Log data validation results"""
     logger = get_logger("data_validation")
+    level = logging.INFO if validation_result.get('is_valid', True) else logging.WARNING
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
         'data_type': data_type,
@@ -292,14 +351,14 @@ def log_data_validation(data_type: str, validation_result: Dict[str, Any], extra
         'extra_data': extra_data or {}
     }
     
-    if validation_result.get('is_valid', True):
-        logger.info(f"Data Validation: {json.dumps(log_data)}")
-    else:
-        logger.warning(f"Data Validation: {json.dumps(log_data)}")
+    logger.log(level, "Data Validation: %s", _to_json(log_data))
 
 def log_tool_usage(tool_name: str, input_data: Dict[str, Any], output_data: Dict[str, Any], duration: float, success: bool) -> None:
     """Log tool usage events"""
     logger = get_logger("tool_usage")
+    level = logging.INFO if success else logging.WARNING
+    if not logger.isEnabledFor(level):
+        return
     
     log_data = {
         'tool_name': tool_name,
@@ -310,36 +369,33 @@ def log_tool_usage(tool_name: str, input_data: Dict[str, Any], output_data: Dict
         'timestamp': datetime.now(UTC).isoformat()
     }
     
-    if success:
-        logger.info(f"Tool Usage: {json.dumps(log_data)}")
-    else:
-        logger.warning(f"Tool Usage: {json.dumps(log_data)}")
+    logger.log(level, "Tool Usage: %s", _to_json(log_data))
 
-def log_chatbot_event(session_id: str, event_type: str, message: str, level: str = "INFO"):
-    """Log chatbot-specific events"""
-    logger = logging.getLogger('chatbot')
+_chatbot_event_logger = get_logger("chatbot")
+
+def log_chatbot_event(session_id: str, event_type: str, message: str, level: str = "INFO", message_args: tuple = ()):
+    """Log chatbot-specific events; message may be a %-template filled from message_args"""
+    logger = _chatbot_event_logger
+    if level == "ERROR":
+        log_level = logging.ERROR
+    elif level == "WARNING":
+        log_level = logging.WARNING
+    else:
+        log_level = logging.INFO
+    if not logger.isEnabledFor(log_level):
+        return
     
     log_entry = {
         "timestamp": datetime.now(UTC).isoformat(),
         "session_id": session_id,
         "event_type": event_type,
-        "message": message,
+        "message": message % message_args if message_args else message,
         "level": level
     }
+    entry_json = _to_json(log_entry)
     
-    if level == "ERROR":
-        logger.error(f"Chatbot Event: {json.dumps(log_entry)}")
-    elif level == "WARNING":
-        logger.warning(f"Chatbot Event: {json.dumps(log_entry)}")
-    else:
-        logger.info(f"Chatbot Event: {json.dumps(log_entry)}")
-    
-    # Also write to chatbot-specific log file
-    try:
-        with open('logs/chatbot.log', 'a') as f:
-            f.write(f"{json.dumps(log_entry)}\n")
-    except Exception as e:
-        logger.error(f"Failed to write to chatbot log: {str(e)}")
+    # The listener's chatbot.log handler writes the entry itself, off the request thread
+    logger.log(log_level, "Chatbot Event: %s", entry_json, extra={'chatbot_entry': entry_json})
 
 # Initialize logging when module is imported
 setup_logging()
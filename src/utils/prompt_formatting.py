@@ -0,0 +1,26 @@
+"""
+Prompt Formatting Utility
+
+This module provides the field formatters agents use to render patient data
+into LLM prompt lines.
+"""
+
+import json
+from typing import Any, Dict
+
+def join_or_str(value: Any) -> str:
+    """Render list fields as comma-separated text and anything else with str()"""
+    if isinstance(value, list):
+        return ", ".join(value)
+    return str(value)
+
+def format_vital_signs(vitals: Dict[str, Any]) -> str:
+    """Render recorded vital signs, skipping missing readings"""
+    return ", ".join(f"{vital}: {value}" for vital, value in vitals.items() if value is not None)
+
+def format_lab_results(labs: Any) -> str:
+    """Render lab results as compact, key-sorted JSON; non-dict values are left out of the prompt"""
+    if not isinstance(labs, dict):
+        return ''
+    # Compact separators trim prompt tokens; sorted keys keep identical labs byte-identical
+    return json.dumps(labs, separators=(',', ':'), sort_keys=True, default=str)
@@ -0,0 +1,111 @@
+"""
+Shared test fixtures
+
+Tests run against an in-memory SQLite database with foreign keys enforced, bound to
+the application's global database manager so code under test uses get_db_session.
+"""
+
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+# Make the application packages importable as the entry point does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+# Agents build their LLM client on construction; no request is made in tests
+os.environ.setdefault('GROQ_API_KEY', 'test-key')
+
+from sqlalchemy import DateTime, create_engine, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql.functions import GenericFunction
+
+from database.connection import db_manager
+from database.models import Base
+
+def _utc_timestamp() -> str:
+    """SQLite stand-in for MySQL's UTC_TIMESTAMP(), used by server defaults"""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+
+class timestampadd(GenericFunction):
+    """MySQL's TIMESTAMPADD(unit, amount, datetime), as used for appointment end times"""
+    type = DateTime()
+    inherit_cache = True
+
+@compiles(timestampadd, 'sqlite')
+def _sqlite_timestampadd(element, compiler, **kw):
+    # Appointment arithmetic is always in minutes
+    _unit, amount, value = element.clauses
+    return f"datetime({compiler.process(value, **kw)}, '+' || {compiler.process(amount, **kw)} || ' minutes')"
+
+@pytest.fixture
+def db():
+    """Bind the global database manager to a fresh SQLite database"""
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+
+    @event.listens_for(engine, 'connect')
+    def _configure_connection(dbapi_connection, connection_record):
+        dbapi_connection.create_function('utc_timestamp', 0, _utc_timestamp)
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+    Base.metadata.create_all(bind=engine)
+
+    saved = (db_manager.engine, db_manager.SessionLocal, db_manager.ScopedSession, db_manager._initialized)
+    db_manager.engine = engine
+    db_manager.bind_session_factories(engine)
+    db_manager._initialized = True
+    try:
+        yield db_manager
+    finally:
+        db_manager.remove_scoped_session()
+        db_manager.engine, db_manager.SessionLocal, db_manager.ScopedSession, db_manager._initialized = saved
+        engine.dispose()
+
+@pytest.fixture
+def make_patient(db):
+    """Factory storing a patient and returning its id"""
+    from database.models import Patient
+    
+    def make(mrn: str = 'MRN-TEST-0001') -> str:
+        session = db.SessionLocal()
+        try:
+            patient = Patient(
+                mrn=mrn,
+                first_name='Test',
+                last_name='Patient',
+                date_of_birth=datetime(1980, 1, 1).date(),
+                gender='F'
+            )
+            session.add(patient)
+            session.commit()
+            return patient.id
+        finally:
+            session.close()
+    
+    return make
+
+@pytest.fixture
+def patient_id(make_patient):
+    """Id of a stored patient for rows that reference patients"""
+    return make_patient()
+
+@pytest.fixture
+def client(db):
+    """Test client for an app serving the chatbot blueprint from the test database"""
+    from flask import Flask
+    from api.chatbot_routes import chatbot_bp
+    from api.json_provider import OrjsonProvider
+    
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    app.config['AGENTS'] = {}
+    app.register_blueprint(chatbot_bp, url_prefix='/api/chatbot')
+    return app.test_client()
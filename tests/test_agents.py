@@ -0,0 +1,449 @@
+"""
+Agent Tests
+
+Tests for agent persistence and caching paths that do not call the LLM.
+"""
+
+from datetime import timedelta
+
+import pytest
+
+from agents.scheduling_agent import DIRECT_SCHEDULING_ASSESSMENT, SLOT_OFFSETS
+from api.json_provider import encode_json
+from database.models import MedicalRecord, Treatment, TriageAssessment, TriageLevel
+
+TREATMENT_PLAN = {
+    'treatment_type': 'Antibiotic therapy',
+    'medications': ['Amoxicillin 500mg'],
+    'interventions': ['Rest'],
+    'monitoring': [],
+    'timeline': '7 days',
+    'side_effects': [],
+    'follow_up': [],
+    'education': [],
+    'assessment': 'Community-acquired pneumonia, outpatient treatment'
+}
+PLAN_TEXT = "TREATMENT_TYPE: Antibiotic therapy\nMEDICATIONS:\n- Amoxicillin 500mg\nASSESSMENT: full plan"
+
+@pytest.fixture
+def treatment_agent():
+    from agents.treatment_agent import TreatmentAgent
+    return TreatmentAgent({})
+
+@pytest.fixture
+def medical_records_agent():
+    from agents.medical_records_agent import MedicalRecordsAgent
+    return MedicalRecordsAgent({})
+
+def test_save_treatment_plan_with_foreign_keys(db, patient_id, treatment_agent):
+    treatment_record, medical_record = treatment_agent._save_treatment_plan(
+        {'patient_id': patient_id}, TREATMENT_PLAN, PLAN_TEXT
+    )
+    
+    assert treatment_record is not None and medical_record is not None
+    session = db.SessionLocal()
+    try:
+        record = session.get(MedicalRecord, medical_record['id'])
+        assert record.treatment_id == treatment_record['id']
+        assert session.get(Treatment, treatment_record['id']).treatment_plan == PLAN_TEXT
+    finally:
+        session.close()
+
+def test_medical_record_readers_return_full_plan(db, patient_id, treatment_agent, medical_records_agent):
+    treatment_agent._save_treatment_plan({'patient_id': patient_id}, TREATMENT_PLAN, PLAN_TEXT)
+    
+    records = medical_records_agent._get_patient_records(patient_id)
+    assert records['success']
+    assert [record['content'] for record in records['records']] == [PLAN_TEXT]
+    
+    found = medical_records_agent.search_medical_records({'patient_id': patient_id})
+    assert found['success']
+    assert [record['content'] for record in found['records']] == [PLAN_TEXT]
+
+def test_medical_record_keeps_plan_text_as_written(db, patient_id, treatment_agent):
+    treatment_record, medical_record = treatment_agent._save_treatment_plan(
+        {'patient_id': patient_id}, TREATMENT_PLAN, PLAN_TEXT
+    )
+    
+    assert treatment_agent.update_treatment_plan(treatment_record['id'], {'treatment_plan': 'Revised plan'})['success']
+    session = db.SessionLocal()
+    try:
+        assert session.get(MedicalRecord, medical_record['id']).content == PLAN_TEXT
+        session.delete(session.get(Treatment, treatment_record['id']))
+        session.commit()
+        record = session.get(MedicalRecord, medical_record['id'])
+        session.refresh(record)
+        assert record.treatment_id is None and record.content == PLAN_TEXT
+    finally:
+        session.close()
+
+def test_treatment_plan_joins_an_enclosing_unit_of_work(db, patient_id, treatment_agent):
+    from database.connection import get_db_session
+    
+    with pytest.raises(RuntimeError):
+        with get_db_session():
+            treatment_record, _ = treatment_agent._save_treatment_plan({'patient_id': patient_id}, TREATMENT_PLAN, PLAN_TEXT)
+            raise RuntimeError("later step failed")
+    
+    session = db.SessionLocal()
+    try:
+        assert session.get(Treatment, treatment_record['id']) is None
+    finally:
+        session.close()
+
+def test_async_treatment_plan_returns_ids_not_future(db, patient_id, treatment_agent, monkeypatch):
+    monkeypatch.setattr(treatment_agent, 'execute', lambda input_data, context=None: {'success': True, 'result': PLAN_TEXT})
+    
+    result = treatment_agent.create_treatment_plan({'patient_id': patient_id}, persist='async')
+    
+    assert result['success'] and result['save_status'] == 'pending'
+    # The response must be serializable by the API layer
+    encode_json(result)
+    treatment_agent._io_pool.shutdown(wait=True)
+    session = db.SessionLocal()
+    try:
+        assert session.get(Treatment, result['treatment_id']) is not None
+        assert session.get(MedicalRecord, result['medical_record_id']).treatment_id == result['treatment_id']
+    finally:
+        session.close()
+
+@pytest.fixture
+def triage_agent():
+    from agents.triage_agent import TriageAgent
+    return TriageAgent({})
+
+def _stub_triage_llm(agent, monkeypatch) -> list:
+    """Replace the LLM call with numbered responses; returns the list of prompts sent"""
+    prompts = []
+    
+    def execute(input_data, context=None):
+        prompts.append(input_data)
+        return {'success': True, 'result': f"TRIAGE_LEVEL: 2\nASSESSMENT_SUMMARY: assessment {len(prompts)}"}
+    
+    monkeypatch.setattr(agent, 'execute', execute)
+    return prompts
+
+def test_triage_input_key_matches_only_identical_input(triage_agent):
+    presentation = {
+        'patient_id': 'patient-1',
+        'chief_complaint': 'shortness of breath',
+        'vital_signs': {'oxygen_saturation': 96, 'systolic_bp': 120}
+    }
+    reordered = {
+        'vital_signs': {'systolic_bp': 120, 'oxygen_saturation': 96},
+        'chief_complaint': 'shortness of breath',
+        'patient_id': 'patient-1'
+    }
+    hypoxic = dict(presentation, vital_signs={'oxygen_saturation': 88, 'systolic_bp': 120})
+    other_patient = dict(presentation, patient_id='patient-2')
+    
+    key = triage_agent._input_key
+    assert key(presentation) == key(reordered)
+    assert key(presentation) != key(hypoxic)
+    assert key(presentation) != key(other_patient)
+
+def test_triage_does_not_reuse_another_patients_assessment(db, make_patient, triage_agent, monkeypatch):
+    prompts = _stub_triage_llm(triage_agent, monkeypatch)
+    first_patient = make_patient('MRN-TRIAGE-1')
+    second_patient = make_patient('MRN-TRIAGE-2')
+    presentation = {
+        'chief_complaint': 'shortness of breath',
+        'vital_signs': {'oxygen_saturation': 96, 'systolic_bp': 120}
+    }
+    
+    first = triage_agent.assess_patient(dict(presentation, patient_id=first_patient))
+    second = triage_agent.assess_patient(dict(presentation, patient_id=second_patient))
+    
+    assert len(prompts) == 2
+    assert first['assessment'] != second['assessment']
+
+def test_triage_reuses_result_for_identical_retry(db, patient_id, triage_agent, monkeypatch):
+    prompts = _stub_triage_llm(triage_agent, monkeypatch)
+    patient_data = {'patient_id': patient_id, 'chief_complaint': 'ankle sprain', 'pain_level': 4}
+    
+    first = triage_agent.assess_patient(patient_data)
+    retry = triage_agent.assess_patient(dict(patient_data))
+    
+    assert len(prompts) == 1
+    assert retry['assessment'] == first['assessment']
+    assert retry['triage_level'] == first['triage_level']
+
+def test_triage_assessment_is_stored(db, patient_id, triage_agent, monkeypatch):
+    _stub_triage_llm(triage_agent, monkeypatch)
+    
+    result = triage_agent.assess_patient({'patient_id': patient_id, 'chief_complaint': 'chest pain'})
+    
+    assert result['success'] and result['assessment_id'] is not None
+    session = db.SessionLocal()
+    try:
+        stored = session.get(TriageAssessment, result['assessment_id'])
+        assert stored.triage_level == TriageLevel.EMERGENT
+        assert stored.wait_time_estimate == 15
+    finally:
+        session.close()
+
+@pytest.fixture
+def scheduling_agent():
+    from agents.scheduling_agent import SchedulingAgent
+    return SchedulingAgent({})
+
+def _next_week_at(hour: int, minute: int = 0):
+    from datetime import datetime, timedelta
+    return (datetime.now() + timedelta(days=7)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+def _direct_request(patient_id: str, start, **overrides) -> dict:
+    request = {
+        'patient_id': patient_id,
+        'doctor_id': 'DR-1',
+        'room_number': 'R-101',
+        'preferred_date': start.strftime('%Y-%m-%d'),
+        'preferred_time': start.strftime('%H:%M'),
+        'duration': 30
+    }
+    request.update(overrides)
+    return request
+
+def _book(db, patient_id: str, start, doctor_id: str, room_number: str, status=None):
+    from database.models import Appointment, AppointmentStatus
+    
+    session = db.SessionLocal()
+    try:
+        session.add(Appointment(
+            patient_id=patient_id, doctor_id=doctor_id, room_number=room_number,
+            scheduled_date=start, duration=30, status=status or AppointmentStatus.SCHEDULED
+        ))
+        session.commit()
+    finally:
+        session.close()
+
+def test_direct_booking_accepts_free_slot(db, patient_id, scheduling_agent):
+    start = _next_week_at(10)
+    _book(db, patient_id, start.replace(hour=9), 'DR-1', 'R-101')
+    
+    result = scheduling_agent._requested_slot_if_free(_direct_request(patient_id, start))
+    
+    assert result['assigned_doctor'] == 'DR-1' and result['assigned_room'] == 'R-101'
+
+def test_direct_booking_rejects_room_conflict(db, patient_id, scheduling_agent):
+    start = _next_week_at(10)
+    _book(db, patient_id, start.replace(minute=15), 'DR-2', 'R-101')
+    
+    assert scheduling_agent._requested_slot_if_free(_direct_request(patient_id, start)) is None
+
+def test_direct_booking_ignores_cancelled_appointments(db, patient_id, scheduling_agent):
+    from database.models import AppointmentStatus
+    
+    start = _next_week_at(10)
+    _book(db, patient_id, start, 'DR-1', 'R-101', status=AppointmentStatus.CANCELLED)
+    
+    assert scheduling_agent._requested_slot_if_free(_direct_request(patient_id, start)) is not None
+
+@pytest.mark.parametrize('start, duration', [
+    (_next_week_at(8), 30),
+    (_next_week_at(16, 30), 60),
+    (_next_week_at(10, 10), 30),
+    (_next_week_at(10).replace(year=2020), 30)
+], ids=['before-opening', 'past-closing', 'off-grid', 'past'])
+def test_direct_booking_rejects_invalid_slots(db, patient_id, scheduling_agent, start, duration):
+    request = _direct_request(patient_id, start, duration=duration)
+    
+    assert scheduling_agent._requested_slot_if_free(request) is None
+
+def test_async_scheduling_stores_the_appointment(db, patient_id, scheduling_agent):
+    import asyncio
+    from database.models import Appointment
+    
+    start = _next_week_at(11)
+    
+    # Each asyncio.run gets a new event loop; nothing may stay bound to the first one
+    results = [
+        asyncio.run(scheduling_agent.schedule_appointment_async(
+            _direct_request(patient_id, start, doctor_id=doctor_id, room_number=room_number)
+        ))
+        for doctor_id, room_number in (('DR-1', 'R-101'), ('DR-2', 'R-102'))
+    ]
+    
+    session = db.SessionLocal()
+    try:
+        for result in results:
+            assert result['success'] and result['assessment'] == DIRECT_SCHEDULING_ASSESSMENT
+            assert session.get(Appointment, result['appointment_id']).scheduled_date == start
+    finally:
+        session.close()
+
+MONITORING_RESULT = (
+    "OVERALL_STATUS: concerning\nABNORMALITIES:\n- Heart rate 150 bpm\n"
+    "ALERT_SEVERITY: critical\nASSESSMENT: tachycardia"
+)
+
+@pytest.fixture
+def monitoring_agent(monkeypatch):
+    from agents.monitoring_agent import MonitoringAgent
+    
+    agent = MonitoringAgent({})
+    agent.prompts = []
+    
+    def execute(input_data, context=None):
+        agent.prompts.append(input_data)
+        return {'success': True, 'result': MONITORING_RESULT}
+    
+    monkeypatch.setattr(agent, 'execute', execute)
+    return agent
+
+def test_monitoring_cache_keys_on_the_full_input(db, patient_id, monitoring_agent):
+    reading = {'patient_id': patient_id, 'vital_signs': {'heart_rate': 150}}
+    
+    monitoring_agent.analyze_vital_signs(reading)
+    monitoring_agent.analyze_vital_signs(dict(reading, previous_vitals=[{'heart_rate': 90}]))
+    monitoring_agent.analyze_vital_signs(dict(reading, medical_history=['atrial fibrillation']))
+    
+    assert len(monitoring_agent.prompts) == 3
+
+def test_monitoring_cache_is_not_shared_without_patient_id(db, monitoring_agent):
+    reading = {'vital_signs': {'heart_rate': 150}}
+    
+    monitoring_agent.analyze_vital_signs(reading)
+    monitoring_agent.analyze_vital_signs(reading)
+    
+    assert len(monitoring_agent.prompts) == 2
+
+def test_repeat_critical_reading_raises_new_alerts(db, patient_id, monitoring_agent):
+    from database.models import Alert
+    
+    reading = {'patient_id': patient_id, 'vital_signs': {'heart_rate': 150}}
+    
+    first = monitoring_agent.analyze_vital_signs(reading)
+    second = monitoring_agent.analyze_vital_signs(reading)
+    
+    assert len(monitoring_agent.prompts) == 1
+    assert first['alerts_created'] and second['alerts_created']
+    assert first['alerts_created'][0]['id'] != second['alerts_created'][0]['id']
+    session = db.SessionLocal()
+    try:
+        assert session.query(Alert).filter(Alert.patient_id == patient_id).count() == 2
+    finally:
+        session.close()
+
+def test_bulk_scheduling_never_double_books(db, patient_id, scheduling_agent, monkeypatch):
+    from database.models import Appointment
+    
+    start = _next_week_at(10)
+    _book(db, patient_id, start, 'DR-1', 'R-101')
+    # The LLM proposes the taken slot for every item in the batch
+    proposal = (
+        f"RECOMMENDED_DATE: {start:%Y-%m-%d}\nRECOMMENDED_TIME: {start:%H:%M}\n"
+        "ASSIGNED_DOCTOR: DR-1\nASSIGNED_ROOM: R-101\nDURATION: 30"
+    )
+    monkeypatch.setattr(scheduling_agent, 'execute',
+                        lambda input_data, context=None: {'success': True, 'result': proposal})
+    
+    result = scheduling_agent.schedule_appointments_bulk([
+        {'patient_id': patient_id, 'doctor_id': 'DR-1'} for _ in range(3)
+    ])
+    
+    appointments = result['appointments']
+    assert all(appointment['success'] and appointment['appointment_id'] for appointment in appointments)
+    session = db.SessionLocal()
+    try:
+        starts = sorted(row.scheduled_date for row in session.query(Appointment).all())
+    finally:
+        session.close()
+    assert len(starts) == len(set(starts)) == 4
+    assert all(later - earlier >= timedelta(minutes=30) for earlier, later in zip(starts, starts[1:]))
+
+def _stored_appointment(db, appointment_id: str):
+    from database.models import Appointment
+    
+    session = db.SessionLocal()
+    try:
+        return session.get(Appointment, appointment_id)
+    finally:
+        session.close()
+
+def _reschedule_to(db, scheduling_agent, monkeypatch, appointment_id: str, start) -> dict:
+    sessions_open = []
+    
+    def execute(input_data, context=None):
+        sessions_open.append(db.ScopedSession.registry.has())
+        return {'success': True, 'result': (
+            f"RECOMMENDED_DATE: {start:%Y-%m-%d}\nRECOMMENDED_TIME: {start:%H:%M}\nDURATION: 30\nNOTES: moved"
+        )}
+    
+    monkeypatch.setattr(scheduling_agent, 'execute', execute)
+    result = scheduling_agent.reschedule_appointment(appointment_id, {'reason': 'Patient request'})
+    # No pooled connection is held while the LLM runs
+    assert sessions_open == [False]
+    return result
+
+def test_reschedule_moves_off_a_booked_slot(db, patient_id, scheduling_agent, monkeypatch):
+    start = _next_week_at(10)
+    booked = scheduling_agent.schedule_appointment(_direct_request(patient_id, start))
+    other = scheduling_agent.schedule_appointment(_direct_request(patient_id, start.replace(hour=14)))
+    
+    result = _reschedule_to(db, scheduling_agent, monkeypatch, other['appointment_id'], start)
+    
+    assert result['success']
+    moved = _stored_appointment(db, other['appointment_id']).scheduled_date
+    assert moved != start and abs(moved - start) == timedelta(minutes=30)
+    assert _stored_appointment(db, booked['appointment_id']).scheduled_date == start
+
+def test_reschedule_may_overlap_its_own_slot(db, patient_id, scheduling_agent, monkeypatch):
+    start = _next_week_at(10)
+    booked = scheduling_agent.schedule_appointment(_direct_request(patient_id, start, duration=60))
+    
+    result = _reschedule_to(db, scheduling_agent, monkeypatch, booked['appointment_id'], start.replace(minute=30))
+    
+    assert result['success']
+    assert _stored_appointment(db, booked['appointment_id']).scheduled_date == start.replace(minute=30)
+
+def test_available_slots_skip_booked_times(db, patient_id, scheduling_agent):
+    from database.models import AppointmentStatus
+    
+    start = _next_week_at(10)
+    _book(db, patient_id, start, 'DR-1', 'R-101')
+    _book(db, patient_id, start.replace(hour=11), 'DR-1', 'R-101', status=AppointmentStatus.CANCELLED)
+    _book(db, patient_id, start.replace(hour=12), 'DR-2', 'R-102')
+    
+    result = scheduling_agent.get_available_slots('DR-1', start.date().isoformat())
+    
+    assert result['success']
+    times = [slot['time'] for slot in result['available_slots']]
+    assert '10:00' not in times
+    assert {'09:30', '10:30', '11:00', '12:00'} <= set(times)
+    assert len(times) == len(SLOT_OFFSETS) - 1
+
+def test_slot_cache_is_kept_until_the_outer_block_commits(db, patient_id, scheduling_agent):
+    from database.connection import get_db_session
+    
+    start = _next_week_at(10)
+    cache_key = ('DR-1', start.date())
+    scheduling_agent._slot_cache[cache_key] = {'success': True, 'available_slots': []}
+    
+    with get_db_session():
+        assert scheduling_agent.schedule_appointment(_direct_request(patient_id, start))['success']
+        # A reader re-caching now would still see the old slots, so nothing is dropped yet
+        assert cache_key in scheduling_agent._slot_cache
+    
+    assert cache_key not in scheduling_agent._slot_cache
+
+def test_vital_trends_group_readings_by_sign(db, patient_id, monitoring_agent):
+    from datetime import datetime
+    from database.models import VitalSigns
+    
+    session = db.SessionLocal()
+    try:
+        now = datetime.utcnow()
+        session.add_all([
+            VitalSigns(patient_id=patient_id, heart_rate=80, recorded_at=now - timedelta(hours=2)),
+            VitalSigns(patient_id=patient_id, heart_rate=95, temperature=38.2, recorded_at=now - timedelta(hours=1)),
+            VitalSigns(patient_id=patient_id, heart_rate=70, recorded_at=now - timedelta(hours=30))
+        ])
+        session.commit()
+    finally:
+        session.close()
+    
+    result = monitoring_agent.get_patient_vital_trends(patient_id)
+    
+    assert result['success'] and result['total_readings'] == 2
+    assert [reading['value'] for reading in result['trends']['heart_rate']] == [80, 95]
+    assert [reading['value'] for reading in result['trends']['temperature']] == [38.2]
@@ -0,0 +1,157 @@
+"""
+Chatbot Route Tests
+
+Tests for the chatbot API endpoints against the test database.
+"""
+
+def _create_session(client, **payload) -> str:
+    response = client.post('/api/chatbot/sessions', json=payload)
+    assert response.status_code == 201
+    return response.get_json()['data']['session_id']
+
+def test_created_session_is_immediately_readable(client):
+    session_id = _create_session(client, user_id='user-1', initial_message='Hello')
+    
+    response = client.get(f'/api/chatbot/context/{session_id}')
+    
+    assert response.status_code == 200
+    history = response.get_json()['data']['context_data']['conversation_history']
+    assert [entry['role'] for entry in history] == ['user', 'assistant']
+
+def _revalidate(client, url: str, etag: str):
+    return client.get(url, headers={'If-None-Match': f'W/"{etag}"'})
+
+def test_conversations_etag_revalidates_until_a_message_arrives(client, db):
+    from agents.chatbot_agent import ChatbotAgent, ChatbotResponse
+    
+    session_id = _create_session(client, user_id='user-1', initial_message='Hello')
+    url = '/api/chatbot/conversations?user_id=user-1'
+    etag, _ = client.get(url).get_etag()
+    
+    assert _revalidate(client, url, etag).status_code == 304
+    
+    reply = ChatbotResponse(message='Yes', intent='general', confidence=1.0, entities={},
+                            actions=[], context_update={}, suggestions=[])
+    ChatbotAgent({})._log_conversation(session_id, 'Still there?', reply, {'intent': 'general'})
+    
+    response = _revalidate(client, url, etag)
+    assert response.status_code == 200
+    assert response.get_json()['data']['conversations'][0]['message_count'] == 4
+
+def test_conversations_etag_changes_when_a_conversation_closes(client, db):
+    session_id = _create_session(client, user_id='user-1')
+    url = '/api/chatbot/conversations?user_id=user-1'
+    etag, _ = client.get(url).get_etag()
+    
+    assert client.post(f'/api/chatbot/conversations/{session_id}/close').status_code == 200
+    
+    response = _revalidate(client, url, etag)
+    assert response.status_code == 200
+    assert response.get_json()['data']['conversations'][0]['status'] == 'closed'
+
+def test_context_etag_changes_with_content_in_the_same_second(client, db):
+    from sqlalchemy import update
+    from database.connection import get_db_session
+    from database.models import ChatbotContext
+    
+    session_id = _create_session(client, user_id='user-1')
+    url = f'/api/chatbot/context/{session_id}'
+    etag, _ = client.get(url).get_etag()
+    
+    assert _revalidate(client, url, etag).status_code == 304
+    
+    with get_db_session() as session:
+        session.execute(
+            update(ChatbotContext)
+            .where(ChatbotContext.session_id == session_id)
+            .values(context_data={"current_topic": "billing"}, updated_at=ChatbotContext.updated_at)
+        )
+    
+    response = _revalidate(client, url, etag)
+    assert response.status_code == 200
+    assert response.get_json()['data']['context_data'] == {"current_topic": "billing"}
+
+def _record_api_events(monkeypatch) -> list:
+    import api.chatbot_routes as chatbot_routes
+    
+    events = []
+    monkeypatch.setattr(chatbot_routes, 'log_api_event',
+                        lambda endpoint, method, status, duration, **kwargs: events.append(status))
+    return events
+
+def test_streamed_messages_are_logged_after_the_body(client, monkeypatch):
+    session_id = _create_session(client, initial_message='Hello')
+    events = _record_api_events(monkeypatch)
+    
+    response = client.get(f'/api/chatbot/conversations/{session_id}/messages')
+    assert events == []
+    body = response.get_json()
+    
+    assert events == [200]
+    assert body['success'] is True
+    assert sorted(message['message_type'] for message in body['data']['messages']) == ['bot', 'user']
+    assert body['data']['total_count'] == 2
+
+def test_failed_message_stream_ends_in_a_well_formed_error(client, monkeypatch):
+    import api.chatbot_routes as chatbot_routes
+    
+    session_id = _create_session(client, initial_message='Hello')
+    events = _record_api_events(monkeypatch)
+    
+    def fail(rows, session_id):
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(chatbot_routes, 'message_rows_to_dicts', fail)
+    
+    body = client.get(f'/api/chatbot/conversations/{session_id}/messages').get_json()
+    
+    assert events == [500]
+    assert body['success'] is False
+    assert 'connection lost' in body['error']
+    assert body['data']['messages'] == []
+
+def test_context_patch_replaces_keys_and_keeps_nulls(client, db):
+    from sqlalchemy import update
+    from api.chatbot_routes import patched_context_data
+    from database.connection import get_db_session
+    from database.models import ChatbotContext
+    
+    session_id = _create_session(client, user_id='user-1', initial_message='Hello')
+    
+    with get_db_session() as session:
+        session.execute(
+            update(ChatbotContext)
+            .where(ChatbotContext.session_id == session_id)
+            .values(context_data=patched_context_data({
+                "current_topic": None,
+                "user_preferences": {"language": "en"},
+                'follow-up notes': [1, 2]
+            }))
+        )
+    
+    context_data = client.get(f'/api/chatbot/context/{session_id}').get_json()['data']['context_data']
+    assert "current_topic" in context_data and context_data["current_topic"] is None
+    assert context_data["user_preferences"] == {"language": "en"}
+    assert context_data['follow-up notes'] == [1, 2]
+    assert len(context_data["conversation_history"]) == 2
+
+def test_context_patch_adds_missing_conversation_history(client, db):
+    from sqlalchemy import update
+    from api.chatbot_routes import patched_context_data
+    from database.connection import get_db_session
+    from database.models import ChatbotContext
+    
+    session_id = _create_session(client, user_id='user-1')
+    with get_db_session() as session:
+        session.execute(
+            update(ChatbotContext)
+            .where(ChatbotContext.session_id == session_id)
+            .values(context_data={"current_topic": "billing"})
+        )
+        session.execute(
+            update(ChatbotContext)
+            .where(ChatbotContext.session_id == session_id)
+            .values(context_data=patched_context_data({}))
+        )
+    
+    context_data = client.get(f'/api/chatbot/context/{session_id}').get_json()['data']['context_data']
+    assert context_data == {"current_topic": "billing", "conversation_history": []}
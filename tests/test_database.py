@@ -0,0 +1,118 @@
+"""
+Database Tests
+
+Tests for session handling in database.connection.
+"""
+
+import threading
+
+import pytest
+
+from database.connection import get_db_session
+from database.models import Alert, AlertSeverity
+
+def _alert(patient_id: str, message: str) -> Alert:
+    return Alert(patient_id=patient_id, alert_type='test', severity=AlertSeverity.LOW, title=message, message=message)
+
+def _alert_messages(db) -> list:
+    session = db.SessionLocal()
+    try:
+        return sorted(message for (message,) in session.query(Alert.message))
+    finally:
+        session.close()
+
+def test_outer_block_commits_on_success(db, patient_id):
+    with get_db_session() as session:
+        session.add(_alert(patient_id, 'outer'))
+    
+    assert _alert_messages(db) == ['outer']
+
+def test_nested_block_joins_outer_session(db, patient_id):
+    with get_db_session() as outer:
+        with get_db_session() as inner:
+            assert inner is outer
+
+def test_nested_commit_does_not_commit_outer_work(db, patient_id):
+    with pytest.raises(ZeroDivisionError):
+        with get_db_session() as outer:
+            outer.add(_alert(patient_id, 'outer'))
+            with get_db_session() as inner:
+                inner.add(_alert(patient_id, 'inner'))
+                # Inner helpers that still commit only flush into the outer transaction
+                inner.commit()
+            1 / 0
+    
+    assert _alert_messages(db) == []
+
+def test_failed_nested_block_makes_outer_rollback_only(db, patient_id):
+    with pytest.raises(RuntimeError, match='rollback-only'):
+        with get_db_session() as outer:
+            outer.add(_alert(patient_id, 'outer'))
+            try:
+                with get_db_session() as inner:
+                    inner.add(_alert(patient_id, 'inner'))
+                    raise ValueError('inner failure')
+            except ValueError:
+                pass
+            # The caller carries on, but the half-applied unit of work must not commit
+            outer.add(_alert(patient_id, 'after'))
+    
+    assert _alert_messages(db) == []
+
+def test_nested_rollback_in_handler_makes_outer_rollback_only(db, patient_id):
+    with pytest.raises(RuntimeError, match='rollback-only'):
+        with get_db_session() as outer:
+            outer.add(_alert(patient_id, 'outer'))
+            with get_db_session() as inner:
+                inner.rollback()
+    
+    assert _alert_messages(db) == []
+
+def test_after_commit_waits_for_outermost_commit(db, patient_id):
+    ran = []
+    with get_db_session() as outer:
+        with get_db_session() as inner:
+            inner.add(_alert(patient_id, 'inner'))
+            inner.commit()
+            inner.after_commit(lambda: ran.append(_alert_messages(db)))
+        assert ran == []
+    
+    assert ran == [['inner']]
+
+def test_after_commit_is_dropped_on_rollback(db, patient_id):
+    ran = []
+    with pytest.raises(ZeroDivisionError):
+        with get_db_session() as outer:
+            outer.after_commit(lambda: ran.append('committed'))
+            1 / 0
+    
+    with get_db_session() as session:
+        session.add(_alert(patient_id, 'next'))
+    
+    assert ran == []
+
+def test_session_is_fresh_after_rollback_only_failure(db, patient_id):
+    with pytest.raises(RuntimeError):
+        with get_db_session() as outer:
+            with get_db_session() as inner:
+                inner.rollback()
+    
+    with get_db_session() as session:
+        session.add(_alert(patient_id, 'next'))
+    
+    assert _alert_messages(db) == ['next']
+
+def test_worker_thread_leaves_no_registered_session(db, patient_id):
+    registered = []
+    
+    def worker():
+        with get_db_session() as session:
+            session.add(_alert(patient_id, 'worker'))
+        registered.append(db.ScopedSession.registry.has())
+    
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    
+    assert registered == [False]
+    assert _alert_messages(db) == ['worker']